@@ -0,0 +1,142 @@
+import queue
+import sqlite3
+import threading
+import time
+import traceback
+
+QUERY_TIMEOUT_SECONDS = 15
+POLL_INTERVAL_MS = 50
+
+
+class QueryHandle:
+    """A submitted query; ``cancel`` drops its result and interrupts it if running"""
+
+    def __init__(self, executor, work, on_success, on_error, timeout, key):
+        self.executor = executor
+        self.work = work
+        self.on_success = on_success
+        self.on_error = on_error
+        self.timeout = timeout
+        self.key = key
+        self.deadline = None
+        self.cancelled = False
+        self.timed_out = False
+
+    def cancel(self):
+        self.executor.cancel(self)
+
+
+class AsyncQueryExecutor:
+    """Runs database work on a background thread and reports back on the Tk thread
+
+    ``work`` is called with the worker's own SQLite connection. Results are
+    delivered through ``root.after`` polling, so callbacks may touch widgets.
+    Submitting with a ``key`` cancels the previous query with the same key
+    (a superseded view), and queries running longer than ``timeout`` seconds
+    are interrupted and reported as ``TimeoutError``.
+    """
+
+    def __init__(self, root, db_path, poll_ms=POLL_INTERVAL_MS):
+        self.root = root
+        self.db_path = db_path
+        self.poll_ms = poll_ms
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.lock = threading.Lock()
+        self.current = None
+        self.conn = None
+        self.latest = {}
+
+        self.thread = threading.Thread(target=self._run, daemon=True, name="db-worker")
+        self.thread.start()
+        self.root.after(self.poll_ms, self._poll)
+
+    def submit(self, work, on_success, on_error=None, key=None, timeout=QUERY_TIMEOUT_SECONDS):
+        if key is not None and key in self.latest:
+            self.latest[key].cancel()
+        handle = QueryHandle(self, work, on_success, on_error, timeout, key)
+        if key is not None:
+            self.latest[key] = handle
+        self.jobs.put(handle)
+        return handle
+
+    def cancel(self, handle):
+        with self.lock:
+            handle.cancelled = True
+            if self.current is handle and self.conn is not None:
+                self.conn.interrupt()
+        if self.latest.get(handle.key) is handle:
+            del self.latest[handle.key]
+
+    def cancel_all(self):
+        for handle in list(self.latest.values()):
+            handle.cancel()
+
+    def shutdown(self):
+        self.cancel_all()
+        self.jobs.put(None)
+
+    def _run(self):
+        while True:
+            handle = self.jobs.get()
+            if handle is None:
+                break
+            with self.lock:
+                if handle.cancelled:
+                    continue
+                self.current = handle
+                handle.deadline = time.monotonic() + handle.timeout
+
+            try:
+                if self.conn is None:
+                    self.conn = sqlite3.connect(self.db_path, timeout=handle.timeout)
+                outcome = (True, handle.work(self.conn))
+            except Exception as e:
+                outcome = (False, e)
+                if isinstance(e, sqlite3.ProgrammingError) and self.conn is not None:
+                    # Drop a broken connection; the next query reconnects
+                    try:
+                        self.conn.close()
+                    except sqlite3.Error:
+                        pass
+                    self.conn = None
+            finally:
+                with self.lock:
+                    self.current = None
+                if self.conn is not None and self.conn.in_transaction:
+                    self.conn.rollback()
+            self.results.put((handle, outcome))
+
+    def _poll(self):
+        with self.lock:
+            current = self.current
+            if current and not current.timed_out and time.monotonic() > current.deadline and self.conn:
+                current.timed_out = True
+                self.conn.interrupt()
+
+        while True:
+            try:
+                handle, (ok, value) = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if self.latest.get(handle.key) is handle:
+                del self.latest[handle.key]
+            if handle.cancelled:
+                continue
+            if handle.timed_out:
+                ok, value = False, TimeoutError(f"Query timed out after {handle.timeout} seconds")
+            try:
+                if ok:
+                    handle.on_success(value)
+                elif handle.on_error:
+                    handle.on_error(value)
+                else:
+                    print("Unhandled error in background query:", value)
+            except Exception:
+                print("Error in query callback:", traceback.format_exc())
+
+        try:
+            self.root.after(self.poll_ms, self._poll)
+        except Exception:
+            # The window was destroyed; stop polling
+            self.shutdown()
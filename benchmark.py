@@ -0,0 +1,195 @@
+import os
+import time
+
+import click
+import cv2
+import numpy as np
+import face_recognition
+
+from detectors import DETECTORS, get_detector
+from recognition import prepare_frame, detect_faces, detect_faces_in_regions, prioritize_faces, encode_faces
+from pipeline import RecognitionPipeline
+from duplicates import find_duplicates, BLOCK_SIZE
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def crowd_frame(face_image, face_count, margin=0.3):
+    """Tile the first face of ``face_image`` into a grid of ``face_count`` faces
+
+    Returns the synthetic RGB frame and the face box of every tile, so encoding
+    can be timed without detection noise.
+    """
+    locations = detect_faces(face_image)
+    if not locations:
+        raise click.ClickException("No face detected in the benchmark image")
+
+    top, right, bottom, left = locations[0]
+    pad_y, pad_x = int((bottom - top) * margin), int((right - left) * margin)
+    height, width = face_image.shape[:2]
+    crop_top, crop_left = max(top - pad_y, 0), max(left - pad_x, 0)
+    crop = face_image[crop_top:min(bottom + pad_y, height), crop_left:min(right + pad_x, width)]
+
+    columns = int(np.ceil(np.sqrt(face_count)))
+    rows = int(np.ceil(face_count / columns))
+    tile_h, tile_w = crop.shape[:2]
+    frame = np.zeros((rows * tile_h, columns * tile_w, 3), dtype=np.uint8)
+
+    boxes = []
+    for i in range(face_count):
+        y, x = (i // columns) * tile_h, (i % columns) * tile_w
+        frame[y:y + tile_h, x:x + tile_w] = crop
+        boxes.append((y + top - crop_top, x + right - crop_left, y + bottom - crop_top, x + left - crop_left))
+    return frame, boxes
+
+
+def time_call(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return np.median(timings) * 1000
+
+
+@click.group()
+def cli():
+    """Performance benchmarks for the recognition pipeline"""
+
+
+@cli.command()
+@click.argument("image", type=click.Path(exists=True, dir_okay=False))
+@click.option("--faces", default="1,5,15,30", show_default=True, help="Comma-separated faces per frame")
+@click.option("--repeat", default=5, show_default=True)
+def encoding(image, faces, repeat):
+    """Compare one descriptor call per face with one call per frame on crowded frames built from IMAGE"""
+    face_image = face_recognition.load_image_file(image)
+    click.echo(f"{'faces':>6} {'per face ms':>12} {'per frame ms':>13} {'speedup':>8}")
+    for count in (int(value) for value in faces.split(",")):
+        frame, boxes = crowd_frame(face_image, count)
+        per_face = time_call(lambda: [encode_faces(frame, [box]) for box in boxes], repeat)
+        per_frame = time_call(lambda: encode_faces(frame, boxes), repeat)
+        click.echo(f"{count:>6} {per_face:>12.1f} {per_frame:>13.1f} {per_face / per_frame:>7.2f}x")
+
+
+@cli.command()
+@click.argument("image_dir", type=click.Path(exists=True, file_okay=False))
+@click.option("--backends", default=",".join(DETECTORS), show_default=True, help="Comma-separated detectors")
+@click.option("--scale", default=0.25, show_default=True, help="Downscale applied before detection")
+@click.option("--repeat", default=3, show_default=True)
+def detectors(image_dir, backends, scale, repeat):
+    """Compare detector latency and detection rate on a fixed set of face images
+
+    Every image in IMAGE_DIR is expected to contain at least one face, so the
+    detection rate is the share of images where the backend found one.
+    """
+    paths = sorted(os.path.join(image_dir, name) for name in os.listdir(image_dir)
+                   if name.lower().endswith(IMAGE_EXTENSIONS))
+    if not paths:
+        raise click.ClickException(f"No images found in {image_dir}")
+
+    # Decode once so only detection is timed
+    frames = [prepare_frame(cv2.imread(path), scale) for path in paths]
+
+    click.echo(f"{len(frames)} images at scale {scale}")
+    click.echo(f"{'backend':>8} {'mean ms':>9} {'p95 ms':>8} {'detected':>9} {'faces':>6}")
+    for name in backends.split(","):
+        try:
+            detector = get_detector(name)
+        except (FileNotFoundError, ValueError) as e:
+            click.echo(f"{name:>8}  skipped: {str(e)}")
+            continue
+
+        timings, detected, total_faces = [], 0, 0
+        for frame in frames:
+            for _ in range(repeat):
+                started = time.perf_counter()
+                boxes = detect_faces(frame, detector)
+                timings.append((time.perf_counter() - started) * 1000)
+            detected += bool(boxes)
+            total_faces += len(boxes)
+
+        click.echo(f"{name:>8} {np.mean(timings):>9.1f} {np.percentile(timings, 95):>8.1f} "
+                   f"{detected / len(frames):>8.0%} {total_faces:>6}")
+
+
+def pipeline_fps(pipeline, frames, streams, count):
+    """Push ``count`` frames per stream through the pipeline and return frames per second"""
+    total = count * streams
+    done = 0
+    position = 0
+    started = time.perf_counter()
+    while done < total:
+        # Wait for results instead of dropping frames when every slot is busy
+        while position < total and not pipeline.full():
+            pipeline.submit(frames[position % len(frames)], stream=position % streams)
+            position += 1
+        results = pipeline.results(timeout=0.05)
+        done += len(results)
+        if any(result.error for result in results):
+            raise click.ClickException(next(result.error for result in results if result.error))
+    return total / (time.perf_counter() - started)
+
+
+@cli.command()
+@click.argument("image_dir", type=click.Path(exists=True, file_okay=False))
+@click.option("--workers", default="1,2,4", show_default=True, help="Comma-separated worker process counts")
+@click.option("--streams", default=2, show_default=True, help="Simulated cameras feeding the pipeline")
+@click.option("--frames", default=100, show_default=True, help="Frames per stream")
+@click.option("--scale", default=0.25, show_default=True, help="Downscale applied before detection")
+def pipeline(image_dir, workers, streams, frames, scale):
+    """Measure how frame-parallel recognition scales with worker processes"""
+    paths = sorted(os.path.join(image_dir, name) for name in os.listdir(image_dir)
+                   if name.lower().endswith(IMAGE_EXTENSIONS))
+    if not paths:
+        raise click.ClickException(f"No images found in {image_dir}")
+    images = [prepare_frame(cv2.imread(path), scale) for path in paths]
+
+    # In-process baseline: the same detect + encode work on one core
+    started = time.perf_counter()
+    for i in range(frames):
+        frame = images[i % len(images)]
+        encode_faces(frame, prioritize_faces(detect_faces_in_regions(frame, [(0, frame.shape[1], frame.shape[0], 0)])))
+    baseline = frames / (time.perf_counter() - started)
+
+    click.echo(f"{len(images)} images at scale {scale}, {streams} streams x {frames} frames")
+    click.echo(f"{'workers':>8} {'fps':>8} {'speedup':>8} {'efficiency':>11}")
+    click.echo(f"{'inline':>8} {baseline:>8.1f} {1:>7.2f}x {1:>10.0%}")
+    for count in (int(value) for value in workers.split(",")):
+        recognition = RecognitionPipeline(workers=count)
+        try:
+            # Warm up: workers load dlib models on their first frame
+            pipeline_fps(recognition, images, 1, count)
+            fps = pipeline_fps(recognition, images, streams, frames)
+        finally:
+            recognition.close()
+        click.echo(f"{count:>8} {fps:>8.1f} {fps / baseline:>7.2f}x {fps / baseline / count:>10.0%}")
+
+
+
+@cli.command()
+@click.option("--students", default="10000,50000,100000", show_default=True,
+              help="Comma-separated synthetic gallery sizes")
+@click.option("--block-size", default=BLOCK_SIZE, show_default=True)
+@click.option("--workers", default="1," + str(os.cpu_count() or 1), show_default=True,
+              help="Comma-separated thread counts")
+def duplicates(students, block_size, workers):
+    """Time the all-pairs duplicate audit on random galleries with planted duplicates"""
+    rng = np.random.default_rng(0)
+    click.echo(f"{'students':>9} {'workers':>8} {'seconds':>8} {'Mpairs/s':>9} {'found':>6}")
+    for count in (int(value) for value in students.split(",")):
+        # Spread similar to real encodings, with 1% of students enrolled twice
+        encodings = rng.normal(scale=0.09, size=(count, 128))
+        planted = max(count // 100, 1)
+        copies = rng.choice(count, planted * 2, replace=False)
+        encodings[copies[:planted]] = encodings[copies[planted:]] + rng.normal(scale=0.02, size=(planted, 128))
+        for thread_count in (int(value) for value in workers.split(",")):
+            started = time.perf_counter()
+            found = len(find_duplicates(encodings, block_size=block_size, workers=thread_count))
+            elapsed = time.perf_counter() - started
+            pairs = count * (count - 1) / 2
+            click.echo(f"{count:>9} {thread_count:>8} {elapsed:>8.1f} {pairs / elapsed / 1e6:>9.0f} {found:>6}")
+
+
+if __name__ == "__main__":
+    cli()
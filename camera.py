@@ -0,0 +1,101 @@
+import glob
+import os
+import time
+
+import cv2
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+# Camera index, video file or image directory the kiosk reads from
+CAMERA_SOURCE = os.environ.get("ATTENDANCE_CAMERA", "0")
+# Playback rate for recordings (unset: the video's own rate)
+REPLAY_FPS = float(os.environ["ATTENDANCE_REPLAY_FPS"]) if os.environ.get("ATTENDANCE_REPLAY_FPS") else None
+# Restart recordings when they end instead of reporting a lost camera
+REPLAY_LOOP = False
+
+
+class ReplayCamera:
+    """Plays a recorded video or an image sequence through the VideoCapture interface
+
+    ``fps`` paces ``read`` so the kiosk sees frames at a camera-like rate
+    (0 plays as fast as the caller reads; None uses the video's own rate, or
+    runs unpaced for image sequences). With ``loop`` the recording restarts
+    when it ends, otherwise ``read`` returns ``(False, None)`` like an
+    unplugged camera.
+    """
+
+    def __init__(self, path, fps=None, loop=False):
+        self.path = path
+        self.loop = loop
+        self.images = None
+        self.video = None
+
+        if os.path.isdir(path):
+            self.images = sorted(f for f in glob.glob(os.path.join(path, "*"))
+                                 if f.lower().endswith(IMAGE_EXTENSIONS))
+        elif path.lower().endswith(IMAGE_EXTENSIONS):
+            self.images = [path]
+        else:
+            self.video = cv2.VideoCapture(path)
+            if fps is None and self.video.isOpened():
+                fps = self.video.get(cv2.CAP_PROP_FPS) or None
+        self.fps = fps or 0
+
+        self.position = 0
+        self.frames_read = 0
+        self.started = None
+        self.last_read = None
+        self.opened = bool(self.images) or (self.video is not None and self.video.isOpened())
+
+    def isOpened(self):
+        return self.opened
+
+    def read(self):
+        if not self.opened:
+            return False, None
+
+        ret, frame = self._next_frame()
+        if not ret and self.loop and self.frames_read:
+            self._rewind()
+            ret, frame = self._next_frame()
+        if not ret:
+            return False, None
+
+        # Hold the frame back until its slot in the recording's timeline
+        now = time.monotonic()
+        if self.started is None:
+            self.started = now
+        if self.fps:
+            due = self.started + self.frames_read / self.fps
+            if due > now:
+                time.sleep(due - now)
+                now = due
+        self.frames_read += 1
+        self.last_read = now
+        return True, frame
+
+    def _next_frame(self):
+        if self.video is not None:
+            return self.video.read()
+        if self.position >= len(self.images):
+            return False, None
+        frame = cv2.imread(self.images[self.position])
+        self.position += 1
+        return frame is not None, frame
+
+    def _rewind(self):
+        if self.video is not None:
+            self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self.position = 0
+
+    def release(self):
+        if self.video is not None:
+            self.video.release()
+        self.opened = False
+
+
+def open_camera(source=None):
+    """Open a live camera (an index such as "0") or a ReplayCamera for a file or directory"""
+    source = CAMERA_SOURCE if source is None else source
+    if isinstance(source, int) or str(source).isdigit():
+        return cv2.VideoCapture(int(source))
+    return ReplayCamera(str(source), fps=REPLAY_FPS, loop=REPLAY_LOOP)
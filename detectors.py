@@ -0,0 +1,99 @@
+import os
+
+import cv2
+import face_recognition
+
+# Directory holding the OpenCV DNN face detector files (never downloaded at runtime)
+DNN_MODEL_DIR = os.environ.get("ATTENDANCE_DNN_MODEL_DIR", "models")
+DNN_PROTOTXT = "deploy.prototxt"
+DNN_CAFFEMODEL = "res10_300x300_ssd_iter_140000.caffemodel"
+
+
+class HogDetector:
+    """dlib HOG detector used by face_recognition (the original behaviour)"""
+
+    name = "hog"
+
+    def detect(self, rgb_image):
+        return face_recognition.face_locations(rgb_image, model="hog")
+
+
+class HaarCascadeDetector:
+    """OpenCV's bundled frontal-face Haar cascade; fastest, least accurate"""
+
+    name = "haar"
+
+    def __init__(self, scale_factor=1.1, min_neighbors=5, min_size=20):
+        if not hasattr(cv2, "CascadeClassifier"):
+            raise ValueError("This OpenCV build does not include Haar cascade support")
+        path = os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
+        self.cascade = cv2.CascadeClassifier(path)
+        if self.cascade.empty():
+            raise FileNotFoundError(f"Could not load Haar cascade from {path}")
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+
+    def detect(self, rgb_image):
+        gray = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2GRAY)
+        faces = self.cascade.detectMultiScale(gray, scaleFactor=self.scale_factor,
+                                              minNeighbors=self.min_neighbors,
+                                              minSize=(self.min_size, self.min_size))
+        return [(int(y), int(x + w), int(y + h), int(x)) for x, y, w, h in faces]
+
+
+class DnnDetector:
+    """OpenCV ResNet-10 SSD face detector loaded from local Caffe model files"""
+
+    name = "dnn"
+
+    def __init__(self, model_dir=DNN_MODEL_DIR, confidence=0.5):
+        prototxt = os.path.join(model_dir, DNN_PROTOTXT)
+        caffemodel = os.path.join(model_dir, DNN_CAFFEMODEL)
+        for path in (prototxt, caffemodel):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"DNN face detector file not found: {path}")
+        self.net = cv2.dnn.readNetFromCaffe(prototxt, caffemodel)
+        self.confidence = confidence
+
+    def detect(self, rgb_image):
+        height, width = rgb_image.shape[:2]
+        blob = cv2.dnn.blobFromImage(cv2.resize(rgb_image, (300, 300)), 1.0, (300, 300),
+                                     (104.0, 177.0, 123.0), swapRB=True)
+        self.net.setInput(blob)
+        detections = self.net.forward()[0, 0]
+
+        boxes = []
+        for _, _, confidence, x1, y1, x2, y2 in detections:
+            if confidence < self.confidence:
+                continue
+            left, top = max(int(x1 * width), 0), max(int(y1 * height), 0)
+            right, bottom = min(int(x2 * width), width), min(int(y2 * height), height)
+            if right > left and bottom > top:
+                boxes.append((top, right, bottom, left))
+        return boxes
+
+
+DETECTORS = {detector.name: detector for detector in (HogDetector, HaarCascadeDetector, DnnDetector)}
+DEFAULT_DETECTOR = "hog"
+
+# Backend used by each screen; changed from the UI at runtime
+SCREEN_DETECTORS = {
+    "attendance": os.environ.get("ATTENDANCE_DETECTOR", DEFAULT_DETECTOR),
+    "registration": os.environ.get("REGISTRATION_DETECTOR", DEFAULT_DETECTOR),
+}
+
+_instances = {}
+
+
+def get_detector(name=DEFAULT_DETECTOR):
+    """Return a shared detector instance, loading its model on first use"""
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown face detector '{name}'. Choose from: {', '.join(DETECTORS)}")
+    if name not in _instances:
+        _instances[name] = DETECTORS[name]()
+    return _instances[name]
+
+
+def detector_for_screen(screen):
+    return get_detector(SCREEN_DETECTORS.get(screen, DEFAULT_DETECTOR))
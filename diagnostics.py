@@ -0,0 +1,262 @@
+import collections
+import gc
+import io
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+DIAGNOSTICS_DIR = os.environ.get("ATTENDANCE_DIAGNOSTICS_DIR", "diagnostics")
+# Seconds between RSS/object-count lines in memory.log (0 disables the logger)
+MEMORY_LOG_INTERVAL = float(os.environ.get("ATTENDANCE_MEMORY_LOG_INTERVAL", "300"))
+PROFILE_SECONDS = 30
+SAMPLE_INTERVAL = 0.005
+TRACEMALLOC_FRAMES = 5
+
+
+def _report_path(prefix, extension="txt"):
+    os.makedirs(DIAGNOSTICS_DIR, exist_ok=True)
+    return os.path.join(DIAGNOSTICS_DIR, f"{prefix}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.{extension}")
+
+
+def rss_bytes():
+    """Current resident set size of this process (peak RSS where nothing better exists)"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class BoundedStream(io.TextIOBase):
+    """Text stream that keeps only the last ``max_lines`` lines written to it"""
+
+    def __init__(self, max_lines=1000):
+        self.lines = collections.deque(maxlen=max_lines)
+        self.partial = ""
+        self.lock = threading.Lock()
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        with self.lock:
+            parts = (self.partial + text).split("\n")
+            self.partial = parts.pop()
+            self.lines.extend(parts)
+        return len(text)
+
+    def getvalue(self):
+        with self.lock:
+            return "\n".join(list(self.lines) + [self.partial])
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread from a background thread
+
+    Unlike cProfile this adds no per-call overhead to the profiled thread,
+    so it can be switched on in a running kiosk. When sampling ends the hottest
+    functions (self and total samples) are written to a report, next to a
+    collapsed-stack file that flame graph tools can read.
+    """
+
+    def __init__(self, thread_id=None, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id or threading.main_thread().ident
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.running = threading.Event()
+        self.thread = None
+        self.started = None
+
+    def start(self, seconds=None, on_done=None):
+        if self.running.is_set():
+            return False
+        self.stacks.clear()
+        self.samples = 0
+        self.started = time.monotonic()
+        self.running.set()
+        self.thread = threading.Thread(target=self._sample, args=(seconds, on_done), daemon=True,
+                                       name="sampling-profiler")
+        self.thread.start()
+        return True
+
+    def stop(self):
+        self.running.clear()
+
+    def _sample(self, seconds, on_done):
+        deadline = self.started + seconds if seconds else None
+        while self.running.is_set() and (deadline is None or time.monotonic() < deadline):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+                self.samples += 1
+            time.sleep(self.interval)
+        self.running.clear()
+        path = self.dump()
+        if on_done:
+            on_done(path)
+
+    def dump(self, limit=30):
+        """Write the collected samples and return the report path"""
+        own = collections.Counter()
+        total = collections.Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for function in set(stack):
+                total[function] += count
+
+        elapsed = time.monotonic() - self.started
+        path = _report_path("profile")
+        with open(path, "w") as f:
+            f.write(f"{self.samples} samples over {elapsed:.1f} s (every {self.interval * 1000:.0f} ms)\n\n")
+            for title, counter in (("Self time", own), ("Total time", total)):
+                f.write(f"{title}:\n")
+                for function, count in counter.most_common(limit):
+                    f.write(f"  {count / max(self.samples, 1):6.1%}  {count:7d}  {function}\n")
+                f.write("\n")
+        with open(path[:-len("txt")] + "folded", "w") as f:
+            for stack, count in self.stacks.items():
+                f.write(";".join(stack) + f" {count}\n")
+        return path
+
+
+class MemoryTracker:
+    """tracemalloc snapshots, each compared against the previous one"""
+
+    def __init__(self, frames=TRACEMALLOC_FRAMES):
+        self.frames = frames
+        self.previous = None
+        # Reentrant: a SIGUSR2 snapshot may interrupt a dashboard snapshot on the same thread
+        self.lock = threading.RLock()
+
+    def snapshot(self, limit=20):
+        """Take a snapshot and write the top allocation growth since the last one
+
+        The first call starts tracing, so it only records a baseline.
+        """
+        with self.lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ))
+            current, peak = tracemalloc.get_traced_memory()
+
+            path = _report_path("memory")
+            with open(path, "w") as f:
+                f.write(f"RSS {rss_bytes() / 2**20:.1f} MiB, traced {current / 2**20:.1f} MiB "
+                        f"(peak {peak / 2**20:.1f} MiB)\n\n")
+                if self.previous is None:
+                    f.write("Baseline snapshot taken; take another to see what grew.\n\n")
+                    stats = snapshot.statistics("lineno")[:limit]
+                    f.write("Largest allocations:\n")
+                else:
+                    stats = snapshot.compare_to(self.previous, "lineno")[:limit]
+                    f.write("Top growth since the previous snapshot:\n")
+                for stat in stats:
+                    f.write(f"  {stat}\n")
+            self.previous = snapshot
+        return path
+
+    def stop(self):
+        with self.lock:
+            self.previous = None
+            tracemalloc.stop()
+
+
+class MemoryLogger:
+    """Appends RSS, GC object counts and the most common object types to a log every ``interval`` seconds"""
+
+    def __init__(self, interval=MEMORY_LOG_INTERVAL, top_types=5):
+        self.interval = interval
+        self.top_types = top_types
+        self.stopped = threading.Event()
+        self.thread = None
+        self.path = os.path.join(DIAGNOSTICS_DIR, "memory.log")
+
+    def start(self):
+        if self.thread is not None or not self.interval:
+            return
+        self.thread = threading.Thread(target=self._run, daemon=True, name="memory-logger")
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.log()
+
+    def log(self):
+        objects = gc.get_objects()
+        types = collections.Counter(type(obj).__name__ for obj in objects).most_common(self.top_types)
+        line = (f"{datetime.now().isoformat(timespec='seconds')} rss={rss_bytes() / 2**20:.1f}MiB "
+                f"objects={len(objects)} gc={gc.get_count()} "
+                + " ".join(f"{name}={count}" for name, count in types))
+        del objects
+        os.makedirs(DIAGNOSTICS_DIR, exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(line + "\n")
+        return line
+
+    def stop(self):
+        self.stopped.set()
+
+
+class Diagnostics:
+    """On-demand profiling and memory diagnostics for a running kiosk
+
+    Reports are written under ``DIAGNOSTICS_DIR``. Besides the faculty
+    dashboard, a profile can be started with ``kill -USR1 <pid>`` and a
+    memory snapshot taken with ``kill -USR2 <pid>``.
+    """
+
+    def __init__(self):
+        self.profiler = SamplingProfiler()
+        self.memory = MemoryTracker()
+        self.logger = MemoryLogger()
+        self.last_report = None
+
+    def start(self):
+        self.logger.start()
+        if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.profile())
+            signal.signal(signal.SIGUSR2, lambda signum, frame: self.memory_snapshot())
+
+    def profile(self, seconds=PROFILE_SECONDS, on_done=None):
+        """Sample the UI thread for ``seconds``; returns False if a profile is already running"""
+        def done(path):
+            self.last_report = path
+            print(f"Profile written to {path}")
+            if on_done:
+                on_done(path)
+        return self.profiler.start(seconds, done)
+
+    def memory_snapshot(self):
+        self.last_report = self.memory.snapshot()
+        print(f"Memory snapshot written to {self.last_report}")
+        return self.last_report
+
+    def status(self):
+        return {
+            "rss_mib": rss_bytes() / 2**20,
+            "profiling": self.profiler.running.is_set(),
+            "tracing": tracemalloc.is_tracing(),
+            "last_report": self.last_report,
+        }
@@ -0,0 +1,123 @@
+import csv
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+import numpy as np
+
+from recognition import face_distances
+
+# Rows per block; a block pair is a BLOCK_SIZE x BLOCK_SIZE float32 matrix (16 MiB at 2048)
+BLOCK_SIZE = 2048
+AUDIT_WORKERS = os.cpu_count() or 1
+# Pairs closer than this are reported as the same person. Stricter than MATCH_TOLERANCE (0.6), which only says a
+# live face is close enough to be marked as a student: at 0.6 a large gallery has many pairs of look-alikes.
+DUPLICATE_TOLERANCE = 0.45
+# Pairs printed by the audit; the CSV gets all of them
+AUDIT_LIMIT = 50
+
+
+def _block_pairs(faces, norms, row_start, col_start, block_size, limit):
+    """Pairs (i < j) within one block of the distance matrix whose squared distance is at most ``limit``"""
+    rows = faces[row_start:row_start + block_size]
+    cols = faces[col_start:col_start + block_size]
+    squared = norms[row_start:row_start + block_size, None] + norms[None, col_start:col_start + block_size]
+    squared -= 2 * rows @ cols.T
+    i, j = np.nonzero(squared <= limit)
+    i += row_start
+    j += col_start
+    upper = i < j
+    return i[upper], j[upper]
+
+
+def find_duplicates(encodings, tolerance=DUPLICATE_TOLERANCE, block_size=BLOCK_SIZE, workers=AUDIT_WORKERS):
+    """Return (i, j, distance) for every pair of encodings within ``tolerance``, closest first
+
+    The all-pairs distance matrix is never materialized: the upper triangle is
+    computed block by block in float32 (one matrix product per block, using
+    precomputed squared norms), so memory stays at one block per worker.
+    NumPy releases the GIL for the products, so blocks run in parallel on a
+    thread pool. Candidate pairs get their exact float64 distance.
+    """
+    encodings = np.asarray(encodings, dtype=np.float64).reshape(-1, 128)
+    faces = np.ascontiguousarray(encodings, dtype=np.float32)
+    norms = np.einsum("ij,ij->i", faces, faces)
+    # A little slack so float32 rounding never hides a pair right at the tolerance
+    limit = tolerance ** 2 + 1e-3
+
+    starts = range(0, len(faces), block_size)
+    blocks = [(row, col) for row in starts for col in starts if col >= row]
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="duplicates") as pool:
+        results = list(pool.map(lambda block: _block_pairs(faces, norms, *block, block_size, limit), blocks))
+
+    i = np.concatenate([pairs[0] for pairs in results]) if results else np.empty(0, dtype=np.intp)
+    j = np.concatenate([pairs[1] for pairs in results]) if results else np.empty(0, dtype=np.intp)
+    distances = np.linalg.norm(encodings[i] - encodings[j], axis=1)
+    keep = distances <= tolerance
+    order = np.argsort(distances[keep], kind="stable")
+    return [(int(a), int(b), float(d)) for a, b, d in
+            zip(i[keep][order], j[keep][order], distances[keep][order])]
+
+
+def nearest_face(known_encodings, encoding):
+    """Return (index, distance) of the closest known encoding, or (None, None) for an empty gallery"""
+    if len(known_encodings) == 0:
+        return None, None
+    distances = face_distances(known_encodings, [encoding])[0]
+    index = int(distances.argmin())
+    return index, float(distances[index])
+
+
+def load_encodings(conn):
+    """(student_id, name, course) rows and their encodings for every enrolled face"""
+    rows = conn.execute("SELECT student_id, name, course, face_encoding FROM students "
+                        "WHERE face_encoding IS NOT NULL").fetchall()
+    students = [row[:3] for row in rows]
+    encodings = np.array([np.frombuffer(row[3], dtype=np.float64) for row in rows]).reshape(-1, 128)
+    return students, encodings
+
+
+@click.group()
+def cli():
+    """Find students enrolled more than once under different IDs"""
+
+
+@cli.command()
+@click.option("--db", "db_path", default="attendance.db", show_default=True)
+@click.option("--tolerance", default=DUPLICATE_TOLERANCE, show_default=True,
+              help="Report pairs of enrollments closer than this (the match tolerance is 0.6)")
+@click.option("--limit", default=AUDIT_LIMIT, show_default=True, help="Print at most this many pairs (0: all)")
+@click.option("--block-size", default=BLOCK_SIZE, show_default=True)
+@click.option("--workers", default=AUDIT_WORKERS, show_default=True)
+@click.option("--csv", "csv_path", type=click.Path(dir_okay=False), default=None, help="Also write all pairs here")
+def audit(db_path, tolerance, limit, block_size, workers, csv_path):
+    """Compare every enrolled face with every other and list likely duplicates"""
+    conn = sqlite3.connect(db_path)
+    students, encodings = load_encodings(conn)
+    conn.close()
+
+    started = time.perf_counter()
+    pairs = find_duplicates(encodings, tolerance, block_size, workers)
+    elapsed = time.perf_counter() - started
+    click.echo(f"Compared {len(students) * (len(students) - 1) // 2} pairs of {len(students)} students "
+               f"in {elapsed:.1f} s; {len(pairs)} likely duplicates")
+
+    shown = pairs[:limit] if limit else pairs
+    for i, j, distance in shown:
+        (id_a, name_a, course_a), (id_b, name_b, course_b) = students[i], students[j]
+        click.echo(f"{distance:.3f}  {id_a} {name_a} ({course_a})  <->  {id_b} {name_b} ({course_b})")
+    if len(shown) < len(pairs):
+        click.echo(f"... {len(pairs) - len(shown)} more pairs (raise --limit or write them with --csv)")
+
+    if csv_path:
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["distance", "student_id_a", "name_a", "course_a", "student_id_b", "name_b", "course_b"])
+            for i, j, distance in pairs:
+                writer.writerow([f"{distance:.4f}", *students[i], *students[j]])
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,346 @@
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+import cv2
+import numpy as np
+import face_recognition
+
+from detectors import get_detector
+from recognition import box_area
+from sync import add_encoding_version_column, install_change_log
+
+# Face crops keep this much of the face size around the box, capped at CROP_MAX_SIZE pixels
+CROP_MARGIN = 0.5
+CROP_MAX_SIZE = 320
+CROP_JPEG_QUALITY = 90
+# Settings the galleries were encoded with before encodings were versioned
+DEFAULT_LANDMARKS = "small"
+DEFAULT_JITTERS = 1
+DEFAULT_DETECTOR = "hog"
+REENCODE_WORKERS = os.cpu_count() or 1
+REENCODE_BATCH_SIZE = 200
+
+
+def make_version(landmarks=DEFAULT_LANDMARKS, jitters=DEFAULT_JITTERS, detector=DEFAULT_DETECTOR):
+    """Encoding version string, e.g. ``small-j1-hog`` (landmark model, jitters, detector)"""
+    if landmarks not in ("small", "large"):
+        raise ValueError(f"Unknown landmark model {landmarks}; use small or large")
+    return f"{landmarks}-j{int(jitters)}-{detector}"
+
+
+def parse_version(version):
+    """Return (landmarks, jitters, detector) from a version made by ``make_version``"""
+    landmarks, jitters, detector = version.split("-", 2)
+    return landmarks, int(jitters[1:]), detector
+
+
+DEFAULT_VERSION = make_version()
+
+
+def create_gallery_tables(conn):
+    """Add face crops and encoding versions to students, plus the re-encoding staging table
+
+    Encodings stored before versioning are labelled with DEFAULT_VERSION, the
+    settings that produced them. Call after install_change_log: the backfill
+    is local bookkeeping and is kept out of the sync change log.
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(students)")}
+    if "face_crop" not in columns:
+        conn.execute("ALTER TABLE students ADD COLUMN face_crop BLOB")
+    add_encoding_version_column(conn)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_students_encoding_version ON students (encoding_version)")
+
+    # Encodings computed by a re-encoding job, waiting to be swapped in
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS gallery_staging (
+        version TEXT NOT NULL,
+        student_id TEXT NOT NULL,
+        face_encoding BLOB,
+        error TEXT,
+        PRIMARY KEY (version, student_id)
+    )
+    ''')
+
+    if conn.execute("SELECT 1 FROM students WHERE face_encoding IS NOT NULL AND encoding_version IS NULL "
+                    "LIMIT 1").fetchone():
+        conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES ('suppress_log', 1)")
+        conn.execute("UPDATE students SET encoding_version = ? "
+                     "WHERE face_encoding IS NOT NULL AND encoding_version IS NULL", (DEFAULT_VERSION,))
+        conn.execute("DELETE FROM sync_state WHERE key = 'suppress_log'")
+    conn.commit()
+
+
+def gallery_version(conn):
+    """The encoding version most of the gallery uses; new registrations are encoded with it
+
+    Derived from the data rather than stored, so a gallery swapped on another
+    kiosk and replicated here is picked up automatically.
+    """
+    row = conn.execute('''
+    SELECT encoding_version FROM students
+    WHERE face_encoding IS NOT NULL AND encoding_version IS NOT NULL
+    GROUP BY encoding_version ORDER BY COUNT(*) DESC LIMIT 1
+    ''').fetchone()
+    return row[0] if row else DEFAULT_VERSION
+
+
+def matchable_students(conn, version):
+    """(student_id, name, course, face_encoding) of students encoded as ``version``, and how many were left out
+
+    Live frames are encoded with the gallery version, and encodings made with
+    other settings are not compared with them. Crops are not replicated, so
+    after a swap students registered on other kiosks keep their old encoding
+    until they are re-registered; they are left out rather than matched
+    across versions.
+    """
+    rows = conn.execute("SELECT student_id, name, course, face_encoding FROM students "
+                        "WHERE face_encoding IS NOT NULL AND COALESCE(encoding_version, ?) = ?",
+                        (DEFAULT_VERSION, version)).fetchall()
+    skipped = conn.execute("SELECT COUNT(*) FROM students "
+                           "WHERE face_encoding IS NOT NULL AND COALESCE(encoding_version, ?) != ?",
+                           (DEFAULT_VERSION, version)).fetchone()[0]
+    return rows, skipped
+
+
+def crop_face(rgb_image, box, margin=CROP_MARGIN, max_size=CROP_MAX_SIZE):
+    """Return a JPEG of the face at ``box`` with some context, for later re-encoding"""
+    top, right, bottom, left = box
+    height, width = rgb_image.shape[:2]
+    pad_y, pad_x = int((bottom - top) * margin), int((right - left) * margin)
+    crop = rgb_image[max(top - pad_y, 0):min(bottom + pad_y, height), max(left - pad_x, 0):min(right + pad_x, width)]
+
+    scale = max_size / max(crop.shape[:2])
+    if scale < 1:
+        crop = cv2.resize(crop, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    ok, jpeg = cv2.imencode(".jpg", cv2.cvtColor(crop, cv2.COLOR_RGB2BGR),
+                            [cv2.IMWRITE_JPEG_QUALITY, CROP_JPEG_QUALITY])
+    if not ok:
+        raise ValueError("Could not encode the face crop")
+    return jpeg.tobytes()
+
+
+def encode_face(rgb_image, box, version):
+    """Encode one face with the landmark model and jitters of ``version``"""
+    landmarks, jitters, _ = parse_version(version)
+    return face_recognition.face_encodings(rgb_image, [box], num_jitters=jitters, model=landmarks)[0]
+
+
+def encode_crop(crop_bytes, version):
+    """Re-detect and encode the face in a stored crop (the whole crop if detection fails)"""
+    bgr = cv2.imdecode(np.frombuffer(crop_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if bgr is None:
+        raise ValueError("Stored face crop cannot be decoded")
+    rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+
+    _, _, detector = parse_version(version)
+    boxes = get_detector(detector).detect(rgb)
+    if boxes:
+        box = max(boxes, key=box_area)
+    else:
+        height, width = rgb.shape[:2]
+        box = (0, width, height, 0)
+    return encode_face(rgb, box, version)
+
+
+def _encode_job(task):
+    """Process pool entry point: (student_id, crop, version) -> (student_id, encoding bytes, error)"""
+    student_id, crop_bytes, version = task
+    try:
+        return student_id, encode_crop(crop_bytes, version).tobytes(), None
+    except Exception as e:
+        return student_id, None, str(e)
+
+
+def _pending(conn, version, limit):
+    """Students with a stored crop whose encoding for ``version`` has not been computed yet"""
+    return conn.execute('''
+    SELECT s.student_id, s.face_crop FROM students s
+    WHERE s.face_crop IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM gallery_staging g WHERE g.version = ? AND g.student_id = s.student_id)
+    ORDER BY s.id LIMIT ?
+    ''', (version, limit)).fetchall()
+
+
+def reencode(conn, version, workers=REENCODE_WORKERS, batch_size=REENCODE_BATCH_SIZE, progress=None):
+    """Compute ``version`` encodings for every stored crop across a process pool
+
+    Results are committed to gallery_staging every ``batch_size`` students,
+    so an interrupted job resumes where it stopped. Returns (encoded, failed).
+    """
+    encoded = failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            rows = _pending(conn, version, batch_size)
+            if not rows:
+                break
+            results = pool.map(_encode_job, [(student_id, crop, version) for student_id, crop in rows],
+                               chunksize=max(1, len(rows) // (workers * 4)))
+            batch = list(results)
+            conn.executemany(
+                "INSERT OR REPLACE INTO gallery_staging (version, student_id, face_encoding, error) VALUES (?, ?, ?, ?)",
+                [(version, student_id, encoding, error) for student_id, encoding, error in batch])
+            conn.commit()
+
+            encoded += sum(1 for _, encoding, _ in batch if encoding is not None)
+            failed += sum(1 for _, encoding, _ in batch if encoding is None)
+            if progress:
+                progress(encoded, failed)
+    return encoded, failed
+
+
+def unstaged_students(conn, version):
+    """IDs of enrolled students the swap to ``version`` would leave on another version
+
+    They have no stored crop (registered before crops were kept, or on
+    another kiosk) or their crop failed to encode. After the swap they would
+    no longer be matched.
+    """
+    return [row[0] for row in conn.execute('''
+    SELECT s.student_id FROM students s
+    WHERE s.face_encoding IS NOT NULL AND COALESCE(s.encoding_version, ?) != ?
+      AND NOT EXISTS (SELECT 1 FROM gallery_staging g
+                      WHERE g.version = ? AND g.student_id = s.student_id AND g.face_encoding IS NOT NULL)
+    ORDER BY s.id
+    ''', (DEFAULT_VERSION, version, version))]
+
+
+def swap_gallery(conn, version, force=False):
+    """Replace the live encodings with the staged ``version`` ones in one transaction
+
+    Refused while enrolled students have no staged encoding, since the swap
+    would silently stop recognizing them; with ``force`` they keep their
+    current encoding until they are registered again. The update goes
+    through the change log, so the new gallery replicates to the other
+    kiosks. Returns the number swapped.
+    """
+    if conn.in_transaction:
+        conn.commit()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        missing = len(_pending(conn, version, 1))
+        if missing:
+            raise ValueError("Students were registered while re-encoding; run the job again to encode them")
+        unstaged = unstaged_students(conn, version)
+        if unstaged and not force:
+            shown = ", ".join(unstaged[:20]) + (f" and {len(unstaged) - 20} more" if len(unstaged) > 20 else "")
+            raise ValueError(f"{len(unstaged)} students have no {version} encoding and would no longer be "
+                             f"recognized: {shown}. Re-register them, or swap with --force to leave them out")
+
+        cursor.execute('''
+        UPDATE students
+        SET face_encoding = (SELECT g.face_encoding FROM gallery_staging g
+                             WHERE g.version = ? AND g.student_id = students.student_id),
+            encoding_version = ?
+        WHERE student_id IN (SELECT student_id FROM gallery_staging
+                             WHERE version = ? AND face_encoding IS NOT NULL)
+        ''', (version, version, version))
+        swapped = cursor.rowcount
+        cursor.execute("DELETE FROM gallery_staging WHERE version = ?", (version,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return swapped
+
+
+def gallery_status(conn):
+    versions = conn.execute('''
+    SELECT COALESCE(encoding_version, '(none)'), COUNT(*), SUM(face_crop IS NOT NULL) FROM students
+    WHERE face_encoding IS NOT NULL GROUP BY encoding_version ORDER BY COUNT(*) DESC
+    ''').fetchall()
+    staged = conn.execute('''
+    SELECT version, COUNT(face_encoding), COUNT(*) - COUNT(face_encoding) FROM gallery_staging GROUP BY version
+    ''').fetchall()
+    return versions, staged
+
+
+def open_gallery(db_path):
+    conn = sqlite3.connect(db_path)
+    install_change_log(conn)
+    create_gallery_tables(conn)
+    return conn
+
+
+@click.group()
+def cli():
+    """Re-encode the face gallery from stored face crops"""
+
+
+@cli.command("reencode")
+@click.option("--db", "db_path", default="attendance.db", show_default=True)
+@click.option("--landmarks", type=click.Choice(["small", "large"]), default=DEFAULT_LANDMARKS, show_default=True)
+@click.option("--jitters", default=DEFAULT_JITTERS, show_default=True, help="Re-samples averaged per encoding")
+@click.option("--detector", default=DEFAULT_DETECTOR, show_default=True, help="Detector that re-locates faces in crops")
+@click.option("--workers", default=REENCODE_WORKERS, show_default=True)
+@click.option("--batch-size", default=REENCODE_BATCH_SIZE, show_default=True, help="Students per checkpoint")
+@click.option("--swap/--no-swap", default=True, help="Swap the new gallery in when encoding finishes")
+@click.option("--force", is_flag=True, help="Swap even though students without a usable crop would not be recognized")
+def reencode_command(db_path, landmarks, jitters, detector, workers, batch_size, swap, force):
+    """Encode every stored crop with new settings (resumes an interrupted run)"""
+    conn = open_gallery(db_path)
+    version = make_version(landmarks, jitters, detector)
+    current = gallery_version(conn)
+    if version == current:
+        click.echo(f"Gallery is already encoded with {version}; re-encoding anyway")
+
+    total = conn.execute("SELECT COUNT(*) FROM students WHERE face_crop IS NOT NULL").fetchone()[0]
+    done = conn.execute("SELECT COUNT(*) FROM gallery_staging WHERE version = ?", (version,)).fetchone()[0]
+    click.echo(f"Re-encoding {total} stored crops as {version} with {workers} workers"
+               + (f" (resuming, {done} already done)" if done else ""))
+
+    started = time.monotonic()
+    encoded, failed = reencode(conn, version, workers, batch_size,
+                               lambda encoded, failed: click.echo(f"  {done + encoded + failed}/{total} "
+                                                                  f"({failed} failed)"))
+    elapsed = time.monotonic() - started
+    click.echo(f"Encoded {encoded} faces in {elapsed:.1f} s ({encoded / elapsed if elapsed else 0:.1f} per second), "
+               f"{failed} failed")
+
+    if swap:
+        try:
+            swapped = swap_gallery(conn, version, force)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        without_crop = conn.execute("SELECT COUNT(*) FROM students WHERE face_encoding IS NOT NULL "
+                                    "AND encoding_version != ?", (version,)).fetchone()[0]
+        click.echo(f"Swapped in {swapped} encodings; kiosks pick them up on their next return to the main menu")
+        if without_crop:
+            click.echo(f"{without_crop} students have no usable crop and keep their old encoding; "
+                       "re-register them to move them to the new version")
+    conn.close()
+
+
+@cli.command("swap")
+@click.option("--db", "db_path", default="attendance.db", show_default=True)
+@click.argument("version")
+@click.option("--force", is_flag=True, help="Swap even though students without a usable crop would not be recognized")
+def swap_command(db_path, version, force):
+    """Swap in a finished re-encoding run"""
+    conn = open_gallery(db_path)
+    try:
+        swapped = swap_gallery(conn, version, force)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Swapped in {swapped} encodings")
+    conn.close()
+
+
+@cli.command("status")
+@click.option("--db", "db_path", default="attendance.db", show_default=True)
+def status_command(db_path):
+    """Show which encoding versions the gallery uses and any staged runs"""
+    conn = open_gallery(db_path)
+    versions, staged = gallery_status(conn)
+    for version, count, crops in versions:
+        click.echo(f"{version}: {count} students ({crops} with stored crops)")
+    for version, encoded, failed in staged:
+        click.echo(f"staged {version}: {encoded} encoded, {failed} failed")
+    conn.close()
+
+
+if __name__ == "__main__":
+    cli()
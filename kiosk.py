@@ -0,0 +1,259 @@
+import json
+import logging
+import os
+import signal
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import click
+import cv2
+
+from camera import open_camera, CAMERA_SOURCE, ReplayCamera
+from detectors import DETECTORS, get_detector
+from diagnostics import Diagnostics
+from marking import create_attendance_tables, AttendanceMarker, SESSION_CHECK_SECONDS
+from pipeline import RECOGNITION_WORKERS
+from quality import QualityGate, QUALITY_GATE_ENABLED
+from snapshots import SnapshotWriter, SNAPSHOT_DIR
+from sync import SyncClient
+
+# Seconds between "kiosk_stats" log lines
+STATS_LOG_SECONDS = 300
+# Seconds to wait before reopening a live camera that stopped delivering frames
+CAMERA_RETRY_SECONDS = 2
+
+log = logging.getLogger("kiosk")
+
+# Log level of the marker's events; the rest are INFO. Repeat sightings are only logged at DEBUG.
+EVENT_LEVELS = {
+    "already_marked": logging.DEBUG,
+    "stale_encodings": logging.WARNING,
+    "session_lookup_failed": logging.ERROR,
+    "unknown_faces_not_saved": logging.ERROR,
+    "mark_failed": logging.ERROR,
+    "worker_error": logging.ERROR,
+    "workers_failed": logging.ERROR,
+    "workers_unusable": logging.ERROR,
+    "workers_not_started": logging.ERROR,
+}
+
+
+def _log(level, event, exc_info=False, **fields):
+    log.log(level, event, exc_info=exc_info, extra={"fields": fields})
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, event and the event's fields"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["error"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """``time level event key=value ...`` lines for reading on a console"""
+
+    def format(self, record):
+        fields = " ".join(f"{key}={value}" for key, value in getattr(record, "fields", {}).items())
+        line = f"{datetime.fromtimestamp(record.created):%Y-%m-%d %H:%M:%S} {record.levelname:<7} " \
+               f"{record.getMessage()} {fields}".rstrip()
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class HeadlessKiosk:
+    """The attendance screen's capture -> recognize -> mark loop, without Tk
+
+    Recognition and marking are the ``AttendanceMarker`` the GUI uses, with
+    its events written as structured log lines instead of labels and message
+    boxes. ``stop`` (also wired to SIGINT/SIGTERM) ends the loop after the
+    current frame; ``close`` then marks the frames still in the workers,
+    saves unknown faces, flushes snapshots and runs a last sync.
+    """
+
+    def __init__(self, db_path, camera=None, detector="hog", room=None, workers=0, central_url=None,
+                 sync_interval=0, preview=False, snapshot_dir=SNAPSHOT_DIR):
+        self.db_path = db_path
+        self.camera = CAMERA_SOURCE if camera is None else camera
+        # Load the model now so a missing file is reported before the camera opens
+        get_detector(detector)
+        self.central_url = central_url
+        self.sync_interval = sync_interval
+        self.preview = preview
+
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        create_attendance_tables(self.conn)
+
+        self.stopping = threading.Event()
+        self.reload_requested = threading.Event()
+        self.snapshot_writer = SnapshotWriter(db_path, snapshot_dir).start()
+        self.marker = AttendanceMarker(self.conn, self.snapshot_writer, detector, room,
+                                       QualityGate() if QUALITY_GATE_ENABLED else None, self._event)
+        self.workers = workers
+        self.cap = None
+
+        self.next_session_check = 0.0
+        self.sync_thread = None
+        self.next_sync = time.monotonic() + sync_interval if sync_interval else None
+
+        self.frames = 0
+        self.started = None
+
+    @staticmethod
+    def _event(event, **fields):
+        _log(EVENT_LEVELS.get(event, logging.INFO), event, **fields)
+
+    def show_preview(self, rgb_small_frame, boxes, names):
+        """Draw on the already downscaled frame, so the preview costs almost nothing"""
+        preview = cv2.cvtColor(rgb_small_frame, cv2.COLOR_RGB2BGR)
+        for (top, right, bottom, left), name in zip(boxes, names):
+            cv2.rectangle(preview, (left, top), (right, bottom), (0, 255, 0), 1)
+            cv2.putText(preview, name, (left, bottom + 12), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 255, 0), 1)
+        cv2.imshow("Attendance kiosk", preview)
+        if cv2.waitKey(1) & 0xFF == ord("q"):
+            self.stop()
+
+    def _sync(self):
+        try:
+            result = SyncClient(self.db_path, self.central_url).sync()
+            _log(logging.INFO, "sync_finished", **result)
+            if result.get("pulled"):
+                self.reload_requested.set()
+        except Exception as e:
+            _log(logging.WARNING, "sync_failed", error=str(e))
+
+    def _maybe_sync(self):
+        if self.next_sync is None or time.monotonic() < self.next_sync:
+            return
+        self.next_sync = time.monotonic() + self.sync_interval
+        if self.sync_thread is None or not self.sync_thread.is_alive():
+            self.sync_thread = threading.Thread(target=self._sync, daemon=True, name="kiosk-sync")
+            self.sync_thread.start()
+
+    def log_stats(self):
+        elapsed = time.monotonic() - self.started
+        marker = self.marker
+        _log(logging.INFO, "kiosk_stats", frames=self.frames, fps=round(self.frames / elapsed, 1) if elapsed else 0,
+             marks=marker.marks, motion_skipped=marker.motion_gate.stats()["skipped"],
+             quality=marker.quality_gate.summary() if marker.quality_gate else "off",
+             unknown_people=len(marker.unknown_faces.people) if marker.unknown_faces else 0,
+             **{f"snapshots_{key}": value for key, value in self.snapshot_writer.stats().items()})
+
+    def _open_camera(self):
+        self.cap = open_camera(self.camera)
+        if not self.cap.isOpened():
+            raise click.ClickException(f"Could not open camera {self.camera}")
+        _log(logging.INFO, "camera_opened", source=self.camera)
+
+    def run(self, max_frames=None):
+        """Recognize frames until ``stop`` is called, the recording ends or ``max_frames`` were read"""
+        self.marker.load_gallery()
+        self.marker.check_session()
+        self.marker.start(self.workers)
+        self._open_camera()
+
+        self.started = time.monotonic()
+        next_stats = self.started + STATS_LOG_SECONDS
+        while not self.stopping.is_set() and (max_frames is None or self.frames < max_frames):
+            ret, frame = self.cap.read()
+            if not ret:
+                self.cap.release()
+                if isinstance(self.cap, ReplayCamera):
+                    _log(logging.INFO, "recording_ended", frames=self.frames)
+                    break
+                _log(logging.WARNING, "camera_lost", source=self.camera)
+                if self.stopping.wait(CAMERA_RETRY_SECONDS):
+                    break
+                self.cap = open_camera(self.camera)
+                continue
+            self.frames += 1
+
+            rgb_small_frame, boxes, names, _ = self.marker.process(frame, time.monotonic())
+            if self.preview:
+                self.show_preview(rgb_small_frame, boxes, names)
+
+            now = time.monotonic()
+            if self.reload_requested.is_set():
+                self.reload_requested.clear()
+                self.marker.load_gallery()
+            if now >= self.next_session_check:
+                self.marker.check_session()
+                self.next_session_check = now + SESSION_CHECK_SECONDS
+            if now >= next_stats:
+                self.log_stats()
+                next_stats = now + STATS_LOG_SECONDS
+            self._maybe_sync()
+
+    def stop(self):
+        self.stopping.set()
+
+    def close(self):
+        """Mark frames still in the workers, then flush everything that is pending and release resources"""
+        self.marker.close_pipeline()
+        if self.cap is not None:
+            self.cap.release()
+        if self.preview:
+            cv2.destroyAllWindows()
+
+        self.marker.save_unknown_faces()
+        self.snapshot_writer.close()
+        if self.started is not None:
+            self.log_stats()
+        if self.sync_thread is not None:
+            self.sync_thread.join()
+        if self.central_url:
+            # Push the marks of this run before the kiosk goes down
+            self._sync()
+        self.conn.close()
+        _log(logging.INFO, "kiosk_stopped", frames=self.frames, marks=self.marker.marks)
+
+
+@click.command()
+@click.option("--db", "db_path", default="attendance.db", show_default=True)
+@click.option("--camera", default=CAMERA_SOURCE, show_default=True,
+              help="Camera index, video file or image directory")
+@click.option("--detector", type=click.Choice(list(DETECTORS)), default="hog", show_default=True)
+@click.option("--room", default=os.environ.get("ATTENDANCE_ROOM"), help="Only pick up class sessions in this room")
+@click.option("--workers", default=RECOGNITION_WORKERS, show_default=True,
+              help="Recognition worker processes (0 recognizes in this process)")
+@click.option("--central", "central_url", default=os.environ.get("ATTENDANCE_CENTRAL_URL"),
+              help="Central sync node; marks are pushed on shutdown and every --sync-interval seconds")
+@click.option("--sync-interval", default=300, show_default=True, help="Seconds between syncs (0: only on shutdown)")
+@click.option("--preview", is_flag=True, help="Show a small preview window (needs a display; q quits)")
+@click.option("--max-frames", type=int, default=None, help="Stop after this many frames")
+@click.option("--log-format", type=click.Choice(["json", "text"]), default="json", show_default=True)
+@click.option("--log-file", type=click.Path(dir_okay=False), default=None, help="Log here instead of stderr")
+def main(db_path, camera, detector, room, workers, central_url, sync_interval, preview, max_frames, log_format,
+         log_file):
+    """Run attendance recognition on a door kiosk without the GUI"""
+    handler = logging.FileHandler(log_file) if log_file else logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if log_format == "json" else TextFormatter())
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+
+    kiosk = HeadlessKiosk(db_path, camera, detector, room, workers, central_url,
+                          sync_interval if central_url else 0, preview)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda signum, frame: kiosk.stop())
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, lambda signum, frame: kiosk.reload_requested.set())
+    Diagnostics().start()
+
+    try:
+        kiosk.run(max_frames)
+    finally:
+        kiosk.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import click
+import numpy as np
+
+import camera
+from camera import IMAGE_EXTENSIONS
+from detectors import DETECTORS, SCREEN_DETECTORS
+from kiosk import EVENT_LEVELS, HeadlessKiosk, TextFormatter, log as kiosk_log
+from pipeline import RECOGNITION_WORKERS
+
+POLL_MS = 20
+
+
+class RecordingMessagebox:
+    """Stands in for tkinter.messagebox so a replay never blocks on a modal dialog"""
+
+    def __init__(self):
+        self.messages = []
+
+    def _record(self, kind):
+        def show(title, message, **options):
+            self.messages.append((kind, title, message))
+            if kind == "error":
+                click.echo(f"[{title}] {message}", err=True)
+            return True if kind == "ask" else "ok"
+        return show
+
+    def __getattr__(self, name):
+        if name.startswith("show"):
+            return self._record(name[4:])
+        if name.startswith("ask"):
+            return self._record("ask")
+        raise AttributeError(name)
+
+    def count(self, kind):
+        return sum(1 for message in self.messages if message[0] == kind)
+
+
+def copy_database(db_path):
+    """A temporary work directory holding a copy of ``db_path`` (or nothing, for a fresh database)"""
+    workdir = tempfile.mkdtemp(prefix="attendance-loadtest-")
+    copy = os.path.join(workdir, "attendance.db")
+    if os.path.exists(db_path):
+        shutil.copy(db_path, copy)
+    return workdir, copy
+
+
+def db_counts(conn):
+    cursor = conn.cursor()
+    return {table: cursor.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("students", "attendance", "change_log")}
+
+
+class KioskHarness:
+    """Replays recordings through the door kiosk's loop against a copy of the database
+
+    Recognition and marking are the ``AttendanceMarker`` shared with the
+    attendance screen, driven by ``HeadlessKiosk`` without Tk, so the replay
+    needs no display and runs in CI.
+    """
+
+    def __init__(self, db_path, fps, detector=SCREEN_DETECTORS["attendance"], workers=0):
+        self.workdir, self.db_path = copy_database(db_path)
+        camera.REPLAY_FPS = fps
+        camera.REPLAY_LOOP = False
+        # Snapshots of the replayed marks stay in the work directory; pruning must not touch the real ones
+        self.kiosk = HeadlessKiosk(self.db_path, detector=detector, workers=workers,
+                                   snapshot_dir=os.path.join(self.workdir, "snapshots"))
+        self.conn = self.kiosk.conn
+
+        self.errors = 0
+        self.latencies = []
+        self.first_marks = {}
+        self.session_started = None
+        self._wrap_marker()
+
+    def _wrap_marker(self):
+        marker = self.kiosk.marker
+        mark, events = marker.mark, marker.events
+
+        def timed_mark(student_id, *args, **kwargs):
+            if not mark(student_id, *args, **kwargs):
+                return False
+            # Time from the camera handing over the marked frame to the committed row; with
+            # recognition workers that frame is older than the one the camera last read
+            now = time.monotonic()
+            if marker.frame_captured_at is not None:
+                self.latencies.append(now - marker.frame_captured_at)
+            self.first_marks.setdefault(student_id, now - self.session_started)
+            return True
+
+        def counted_events(event, **fields):
+            if EVENT_LEVELS.get(event, logging.INFO) >= logging.ERROR:
+                self.errors += 1
+            events(event, **fields)
+
+        marker.mark = timed_mark
+        marker.events = counted_events
+
+    @property
+    def frames(self):
+        return self.kiosk.frames
+
+    def error_count(self):
+        return self.errors
+
+    def attendance(self, source, timeout):
+        """Replay ``source`` once, marking the frames still in the workers, and return the elapsed time"""
+        self.kiosk.camera = source
+        timer = threading.Timer(timeout, self.kiosk.stop)
+        self.session_started = time.monotonic()
+        timer.start()
+        try:
+            self.kiosk.run()
+            self.kiosk.marker.drain()
+        finally:
+            timer.cancel()
+            self.kiosk.stopping.clear()
+        return time.monotonic() - self.session_started
+
+    def close(self):
+        self.kiosk.close()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class Harness:
+    """Drives the registration screen of AttendanceSystem on a hidden Tk root against a copy of the database
+
+    Tk needs a display: on a machine without one, run under xvfb-run.
+    """
+
+    def __init__(self, db_path, fps):
+        # Imported here so the attendance replay never loads Tk
+        import tkinter as tk
+        import main
+
+        self.workdir, self.db_path = copy_database(db_path)
+        main.DB_PATH = self.db_path
+        main.SNAPSHOT_DIR = os.path.join(self.workdir, "snapshots")
+        main.messagebox = self.messagebox = RecordingMessagebox()
+        camera.REPLAY_FPS = fps
+
+        self.root = tk.Tk()
+        self.root.withdraw()
+        self.app = main.AttendanceSystem(self.root)
+        self.frames = 0
+
+    @property
+    def conn(self):
+        return self.app.conn
+
+    def error_count(self):
+        return self.messagebox.count("error")
+
+    def run_until(self, done, timeout):
+        """Run the Tk loop until ``done()`` is true or ``timeout`` seconds pass"""
+        deadline = time.monotonic() + timeout
+
+        def check():
+            if done() or time.monotonic() > deadline:
+                self.root.quit()
+            else:
+                self.root.after(POLL_MS, check)
+
+        self.root.after(POLL_MS, check)
+        self.root.mainloop()
+
+    def register(self, image, student_id, course, warmup, timeout):
+        """Register one student from a looping still, returning the capture_face time"""
+        camera.CAMERA_SOURCE = image
+        camera.REPLAY_LOOP = True
+        self.app.open_registration()
+        self.app.start_camera_registration()
+        cap = self.app.cap
+        if cap is None:
+            return None
+        self.run_until(lambda: cap.frames_read >= warmup, timeout)
+        self.frames += cap.frames_read
+
+        started = time.monotonic()
+        self.app.capture_face(student_id, student_id, course)
+        elapsed = time.monotonic() - started
+        self.app.release_camera()
+        return elapsed
+
+    def close(self):
+        self.app.query_executor.shutdown()
+        self.app.snapshot_writer.close()
+        self.app.conn.close()
+        self.root.destroy()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def report_db(harness, before, writes):
+    after = db_counts(harness.conn)
+    click.echo(f"DB writes: {writes} rows changed "
+               f"(+{after['students'] - before['students']} students, "
+               f"+{after['attendance'] - before['attendance']} attendance, "
+               f"+{after['change_log'] - before['change_log']} change log)")
+    click.echo(f"Errors reported: {harness.error_count()}")
+
+
+def percentile_ms(values, q):
+    return np.percentile(values, q) * 1000 if values else 0.0
+
+
+@click.group()
+def cli():
+    """End-to-end load tests that replay recordings through the kiosk
+
+    ``attendance`` runs the kiosk's recognize-and-mark loop without Tk.
+    ``registration`` drives the Tk screen, which needs a display; on a
+    headless machine run it under xvfb-run.
+    """
+
+
+@cli.command()
+@click.argument("recording", type=click.Path(exists=True))
+@click.option("--db", "db_path", default="attendance.db", show_default=True,
+              help="Database to copy; the original is never modified")
+@click.option("--fps", default=15.0, show_default=True, help="Playback rate (0: as fast as possible)")
+@click.option("--repeat", default=1, show_default=True, help="Attendance sessions to replay")
+@click.option("--timeout", default=600.0, show_default=True, help="Seconds before a session is abandoned")
+@click.option("--detector", type=click.Choice(list(DETECTORS)), default=SCREEN_DETECTORS["attendance"],
+              show_default=True)
+@click.option("--workers", default=RECOGNITION_WORKERS, show_default=True,
+              help="Recognition worker processes (0 recognizes in this process)")
+def attendance(recording, db_path, fps, repeat, timeout, detector, workers):
+    """Replay RECORDING (video or image directory) through attendance sessions"""
+    handler = logging.StreamHandler()
+    handler.setFormatter(TextFormatter())
+    kiosk_log.addHandler(handler)
+    kiosk_log.setLevel(logging.WARNING)
+
+    harness = KioskHarness(db_path, fps, detector, workers)
+    try:
+        before = db_counts(harness.conn)
+        writes = harness.conn.total_changes
+        elapsed = sum(harness.attendance(recording, timeout) for _ in range(repeat))
+        writes = harness.conn.total_changes - writes
+
+        click.echo(f"Sessions: {repeat}, frames: {harness.frames}, "
+                   f"throughput: {harness.frames / elapsed if elapsed else 0:.1f} fps")
+        click.echo(f"Students marked: {len(harness.first_marks)}")
+        if harness.latencies:
+            click.echo(f"Frame-to-mark latency: p50 {percentile_ms(harness.latencies, 50):.0f} ms, "
+                       f"p95 {percentile_ms(harness.latencies, 95):.0f} ms")
+            first = list(harness.first_marks.values())
+            click.echo(f"Time to mark from session start: p50 {np.percentile(first, 50):.2f} s, "
+                       f"max {max(first):.2f} s")
+        click.echo(harness.kiosk.marker.motion_gate.summary())
+        report_db(harness, before, writes)
+    finally:
+        harness.close()
+
+
+@cli.command()
+@click.argument("image_dir", type=click.Path(exists=True, file_okay=False))
+@click.option("--db", "db_path", default="attendance.db", show_default=True,
+              help="Database to copy; the original is never modified")
+@click.option("--course", default="LOADTEST", show_default=True)
+@click.option("--fps", default=15.0, show_default=True, help="Playback rate of the preview")
+@click.option("--warmup", default=10, show_default=True, help="Preview frames shown before capturing")
+@click.option("--timeout", default=60.0, show_default=True, help="Seconds before a registration is abandoned")
+def registration(image_dir, db_path, course, fps, warmup, timeout):
+    """Register one student per image in IMAGE_DIR (the file name is the student ID)"""
+    images = sorted(f for f in os.listdir(image_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+    if not images:
+        raise click.ClickException(f"No images found in {image_dir}")
+
+    harness = Harness(db_path, fps)
+    try:
+        before = db_counts(harness.conn)
+        writes = harness.conn.total_changes
+        started = time.monotonic()
+        timings = []
+        for name in images:
+            student_id = os.path.splitext(name)[0]
+            elapsed = harness.register(os.path.join(image_dir, name), student_id, course, warmup, timeout)
+            if elapsed is not None:
+                timings.append(elapsed)
+        total = time.monotonic() - started
+        writes = harness.conn.total_changes - writes
+
+        click.echo(f"Registrations: {len(timings)}/{len(images)} in {total:.1f} s "
+                   f"({len(timings) / total if total else 0:.2f} per second), "
+                   f"preview frames: {harness.frames}")
+        if timings:
+            click.echo(f"Capture latency: p50 {percentile_ms(timings, 50):.0f} ms, "
+                       f"p95 {percentile_ms(timings, 95):.0f} ms")
+        report_db(harness, before, writes)
+    finally:
+        harness.close()
+
+
+if __name__ == "__main__":
+    cli()
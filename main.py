@@ -11,7 +11,49 @@ from PIL import Image, ImageTk
 import hashlib
 import sys
 import traceback
-import io
+import threading
+import time
+from sync import SyncClient
+from detectors import DETECTORS, SCREEN_DETECTORS, get_detector, detector_for_screen
+from recognition import scale_box, detect_faces, box_area, MATCH_TOLERANCE
+from quality import QualityGate, QUALITY_GATE_ENABLED, QUALITY_HINTS, REGISTRATION_FRAMES
+from pipeline import RECOGNITION_WORKERS
+from snapshots import SnapshotWriter, SNAPSHOT_DIR
+from unknowns import list_unknown_faces
+from marking import create_attendance_tables, AttendanceMarker, SESSION_CHECK_SECONDS
+from duplicates import nearest_face
+from camera import open_camera
+from diagnostics import Diagnostics, BoundedStream
+from search import (create_search_index, search_students, search_student_ids, StudentSearchEntry,
+                    ID_SUGGEST_MIN_LENGTH)
+from gallery import crop_face, encode_face
+from partitions import create_terms_table, attendance_source, archive_term
+from async_db import AsyncQueryExecutor
+from query_cache import QueryCache, ALL_ATTENDANCE, ALL_STUDENTS
+from sessions import start_session, open_sessions, roster_size, close_session
+
+DB_PATH = "attendance.db"
+# Central node for multi-kiosk replication (sync is disabled when unset)
+CENTRAL_URL = os.environ.get("ATTENDANCE_CENTRAL_URL")
+# Room this kiosk is installed in; limits which class sessions it picks up
+KIOSK_ROOM = os.environ.get("ATTENDANCE_ROOM")
+# Shared across screens (and re-initialisation) so repeated views are served from memory
+QUERY_CACHE = QueryCache()
+# Profiler, memory snapshots and the periodic memory log (started once in __main__)
+DIAGNOSTICS = Diagnostics()
+# Face quality checks and their reject counts, kept across screens
+FACE_QUALITY = QualityGate()
+# How the recognition loop's events are printed (the others go to the status label or a dialog)
+MARKER_MESSAGES = {
+    "stale_encodings": "{students} students are encoded with another version than {version} and will not be "
+                       "recognized; re-register them",
+    "session_lookup_failed": "Error looking up class session: {error}",
+    "unknown_faces_not_saved": "Error saving unknown faces: {error}",
+    "worker_error": "Error in recognition worker: {error}",
+    "workers_failed": "Recognition worker failed, recognizing in-process: {error}",
+    "workers_unusable": "Cannot use recognition workers, recognizing in-process: {error}",
+    "workers_not_started": "Could not start recognition workers, recognizing in-process: {error}",
+}
 
 class AttendanceSystem:
     def __init__(self, root):
@@ -26,18 +68,38 @@ class AttendanceSystem:
         self.video_frame = None
         self.status_label = None
         self.capture_in_progress = False
+        self.sync_thread = None
+        self.next_session_check = 0.0
+        self.query_cache = QUERY_CACHE
+        self.face_quality = FACE_QUALITY
+        self.diagnostics = DIAGNOSTICS
+        self.loading_frame = None
+        self.loading_handle = None
+        
+        # Background worker for faculty and student queries (kept across re-initialisation)
+        if getattr(self, "query_executor", None) is None:
+            self.query_executor = AsyncQueryExecutor(self.root, DB_PATH)
+        
+        # Background writer for the audit snapshot of each attendance mark
+        if getattr(self, "snapshot_writer", None) is None:
+            self.snapshot_writer = SnapshotWriter(DB_PATH, SNAPSHOT_DIR).start()
         
         # Database connection with error handling
         try:
-            self.conn = sqlite3.connect("attendance.db")
+            self.conn = sqlite3.connect(DB_PATH)
             self.create_tables()
         except sqlite3.Error as e:
             messagebox.showerror("Database Error", f"Failed to connect to database: {str(e)}")
             self.exit_application()
         
+        # Recognize-and-mark loop of the attendance screen (kept across re-initialisation)
+        if getattr(self, "marker", None) is None:
+            self.marker = AttendanceMarker(self.conn, self.snapshot_writer, SCREEN_DETECTORS["attendance"], KIOSK_ROOM,
+                                           self.face_quality if QUALITY_GATE_ENABLED else None,
+                                           self.on_marker_event)
+        self.marker.conn = self.conn
+        
         # Load known faces
-        self.known_face_encodings = []
-        self.known_face_names = []
         self.load_known_faces()
         
         # Main screen components
@@ -87,29 +149,6 @@ class AttendanceSystem:
         )
         ''')
         
-        # Student table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS students (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            student_id TEXT UNIQUE NOT NULL,
-            name TEXT NOT NULL,
-            course TEXT NOT NULL,
-            face_encoding BLOB
-        )
-        ''')
-        
-        # Attendance table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS attendance (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            student_id TEXT NOT NULL,
-            date TEXT NOT NULL,
-            time TEXT NOT NULL,
-            status TEXT NOT NULL,
-            FOREIGN KEY (student_id) REFERENCES students (student_id)
-        )
-        ''')
-        
         # Insert default faculty account if not exists
         cursor.execute("SELECT * FROM faculty WHERE faculty_id = 'admin'")
         if not cursor.fetchone():
@@ -118,31 +157,39 @@ class AttendanceSystem:
                          ("admin", "Administrator", password_hash))
         
         self.conn.commit()
+        
+        # Students, attendance and what the recognition loop keeps with them (shared with kiosk.py)
+        create_attendance_tables(self.conn)
+        
+        # Archived academic terms, each in its own database file
+        create_terms_table(self.conn)
+        
+        # Prefix search over student ID, name and course
+        create_search_index(self.conn)
 
     def load_known_faces(self):
         try:
             if not self.reconnect_database():
                 return
-                
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT student_id, name, face_encoding FROM students WHERE face_encoding IS NOT NULL")
-            students = cursor.fetchall()
-            
-            self.known_face_encodings = []
-            self.known_face_names = []
-            
-            for student in students:
-                student_id, name, face_encoding_blob = student
-                if face_encoding_blob:  # Check if not None
-                    try:
-                        face_encoding = np.frombuffer(face_encoding_blob, dtype=np.float64)
-                        self.known_face_encodings.append(face_encoding)
-                        self.known_face_names.append(f"{name} ({student_id})")
-                    except Exception as e:
-                        print(f"Error loading face encoding for student {student_id}: {str(e)}")
+            self.marker.load_gallery()
         except sqlite3.Error as e:
             messagebox.showerror("Database Error", f"Error loading face data: {str(e)}")
     
+    def on_marker_event(self, event, **fields):
+        """Show what the recognition loop did on the attendance screen"""
+        if event == "attendance_marked":
+            self.set_status(f"Attendance marked for {fields['name']}")
+        elif event == "already_marked":
+            self.set_status(f"{fields['name']}: already recorded today ({fields['status']})")
+        elif event == "session_started":
+            self.set_status(f"Session {fields['course']} started ({fields['roster']} students on roster)")
+        elif event == "session_ended":
+            self.set_status("Class session ended - Looking for faces")
+        elif event == "mark_failed":
+            messagebox.showerror("Database Error", f"Error marking attendance: {fields['error']}")
+        elif event in MARKER_MESSAGES:
+            print(MARKER_MESSAGES[event].format(**fields))
+    
     def open_student_interface(self):
         self.clear_frame()
     
@@ -170,6 +217,9 @@ class AttendanceSystem:
         take_attendance_btn = tk.Button(button_frame, text="Mark Attendance", font=("Arial", 14),
                                   width=20, height=2, command=self.take_attendance)
         take_attendance_btn.grid(row=0, column=0, padx=10, pady=10)
+        
+        # Face detector used on this screen
+        self.create_detector_selector(button_frame, "attendance").grid(row=0, column=1, padx=10, pady=10)
     
         back_btn = tk.Button(student_frame, text="Back to Main Menu", font=("Arial", 14),
                         width=20, height=2, command=self.back_to_main)
@@ -192,8 +242,12 @@ class AttendanceSystem:
         id_label = tk.Label(login_frame, text="Student ID:", font=("Arial", 14), bg="#f0f0f0")
         id_label.pack(pady=10)
     
-        id_entry = tk.Entry(login_frame, font=("Arial", 14), width=20)
+        # Suggests IDs only, and Return logs in with the ID as typed: a prefix never logs anyone in
+        id_entry = StudentSearchEntry(login_frame, self.find_student_ids, self.verify_student,
+                                      width=30, rows=5, min_length=ID_SUGGEST_MIN_LENGTH, choose_top_match=False,
+                                      describe=lambda row: row[0], bg="#f0f0f0")
         id_entry.pack(pady=10)
+        id_entry.focus_set()
     
     # Login button
         login_btn = tk.Button(login_frame, text="Login", font=("Arial", 14),
@@ -239,21 +293,32 @@ class AttendanceSystem:
                       font=("Arial", 14), bg="#f0f0f0")
         id_label.pack(pady=10)
     
-    # Get attendance stats
-        total_days, present_days, percentage = self.get_student_attendance_stats(student_id)
-    
-    # Stats frame
+    # Stats frame (filled in once the stats query finishes)
         stats_frame = tk.Frame(student_frame, bg="#f0f0f0", relief=tk.RIDGE, bd=2)
         stats_frame.pack(pady=20, padx=20, fill="x")
     
-        tk.Label(stats_frame, text=f"Total Working Days: {total_days}", 
-            font=("Arial", 12), bg="#f0f0f0", anchor="w").pack(pady=5, padx=10, fill="x")
+        total_label = tk.Label(stats_frame, text="Total Working Days: ...", 
+            font=("Arial", 12), bg="#f0f0f0", anchor="w")
+        total_label.pack(pady=5, padx=10, fill="x")
+    
+        present_label = tk.Label(stats_frame, text="Days Present: ...", 
+            font=("Arial", 12), bg="#f0f0f0", anchor="w")
+        present_label.pack(pady=5, padx=10, fill="x")
     
-        tk.Label(stats_frame, text=f"Days Present: {present_days}", 
-            font=("Arial", 12), bg="#f0f0f0", anchor="w").pack(pady=5, padx=10, fill="x")
+        percentage_label = tk.Label(stats_frame, text="Attendance Percentage: ...", 
+            font=("Arial", 12, "bold"), bg="#f0f0f0", anchor="w")
+        percentage_label.pack(pady=5, padx=10, fill="x")
     
-        tk.Label(stats_frame, text=f"Attendance Percentage: {percentage:.2f}%", 
-            font=("Arial", 12, "bold"), bg="#f0f0f0", anchor="w").pack(pady=5, padx=10, fill="x")
+        def show_stats(stats):
+            total_days, present_days, percentage = stats
+            total_label.config(text=f"Total Working Days: {total_days}")
+            present_label.config(text=f"Days Present: {present_days}")
+            percentage_label.config(text=f"Attendance Percentage: {percentage:.2f}%")
+    
+    # Get attendance stats
+        self.run_query("Loading attendance stats...",
+                       lambda conn: self.get_student_attendance_stats(conn, student_id),
+                       show_stats, "Error getting attendance stats", key="stats")
     
     # View detailed attendance button
         view_btn = tk.Button(student_frame, text="View Detailed Attendance", font=("Arial", 14),
@@ -265,47 +330,37 @@ class AttendanceSystem:
                          width=20, height=2, command=self.back_to_main)
         logout_btn.pack(pady=15)
 
-    def get_student_attendance_stats(self, student_id):
-        try:
-            if not self.reconnect_database():
-                return 0, 0, 0
-            
-            cursor = self.conn.cursor()
-        
+    def get_student_attendance_stats(self, conn, student_id):
+        """Return (total days, days present, percentage); runs on the query worker"""
+        source = attendance_source(conn)
+    
         # Get total working days (all unique dates in attendance table)
-            cursor.execute("SELECT COUNT(DISTINCT date) FROM attendance")
-            total_days = cursor.fetchone()[0]
-        
+        total_days = self.query_cache.fetchall(conn, f"SELECT COUNT(DISTINCT date) FROM {source}",
+                                               tags=[ALL_ATTENDANCE])[0][0]
+    
         # Get days present for this student
-            cursor.execute("SELECT COUNT(*) FROM attendance WHERE student_id = ?", (student_id,))
-            present_days = cursor.fetchone()[0]
-        
+        present_days = self.query_cache.fetchall(
+            conn, f"SELECT COUNT(*) FROM {source} WHERE student_id = ? AND status = 'Present'",
+            (student_id,), tags=[("student", student_id)])[0][0]
+    
         # Calculate percentage
-            percentage = (present_days / total_days) * 100 if total_days > 0 else 0
-        
-            return total_days, present_days, percentage
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", f"Error getting attendance stats: {str(e)}")
-            return 0, 0, 0
+        percentage = (present_days / total_days) * 100 if total_days > 0 else 0
+    
+        return total_days, present_days, percentage
 
     def view_student_attendance(self, student_id, student_name):
-        try:
-            if not self.reconnect_database():
-                return
-            
-            cursor = self.conn.cursor()
-            cursor.execute('''
+        def query(conn):
+            return self.query_cache.fetchall(conn, f'''
             SELECT a.date, a.time, a.status, s.course
-            FROM attendance a
+            FROM {attendance_source(conn)} a
             JOIN students s ON a.student_id = s.student_id
             WHERE a.student_id = ?
             ORDER BY a.date DESC, a.time DESC
-            ''', (student_id,))
+            ''', (student_id,), tags=[("student", student_id)])
         
-            attendance_data = cursor.fetchall()
-            self.display_student_attendance(student_id, student_name, attendance_data)
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", f"Error retrieving attendance data: {str(e)}")
+        self.run_query("Loading attendance records...", query,
+                       lambda data: self.display_student_attendance(student_id, student_name, data),
+                       "Error retrieving attendance data")
 
     def display_student_attendance(self, student_id, student_name, data):
         self.clear_frame()
@@ -369,15 +424,30 @@ class AttendanceSystem:
         if hasattr(self, 'status_label') and self.status_label:
            self.status_label.config(text="Camera turned off")
     
+    def set_status(self, text):
+        """Show ``text`` on the current screen's status label, if it has one"""
+        if self.status_label is not None and self.status_label.winfo_exists():
+            self.status_label.config(text=text)
+    
     def take_attendance(self):
         if self.cap is None:
             try:
-                self.cap = cv2.VideoCapture(0)
+                self.cap = open_camera()
                 if not self.cap.isOpened():
                     messagebox.showerror("Camera Error", "Could not open camera. Please check your camera connection.")
                     self.cap = None
                     return
-                self.status_label.config(text="Camera active - Looking for faces")
+                if self.reconnect_database():
+                    # Pick up the class session running in this room right now, if any
+                    self.marker.check_session()
+                self.next_session_check = time.monotonic() + SESSION_CHECK_SECONDS
+                if self.marker.session:
+                    self.status_label.config(text=f"Camera active - Session {self.marker.session['course']} "
+                                                  f"({len(self.marker.roster)} students on roster)")
+                else:
+                    self.status_label.config(text="Camera active - Looking for faces")
+                self.marker.detector = SCREEN_DETECTORS["attendance"]
+                self.marker.start(RECOGNITION_WORKERS)
                 self.process_frame()
             except Exception as e:
                 messagebox.showerror("Camera Error", f"Error initializing camera: {str(e)}")
@@ -386,7 +456,9 @@ class AttendanceSystem:
                 self.cap = None
         else:
             self.release_camera()
-            self.status_label.config(text="Camera stopped")
+            self.marker.drain()
+            self.marker.save_unknown_faces()
+            self.status_label.config(text=f"Camera stopped. {self.marker.motion_gate.summary()}")
     
     def release_camera(self):
         if self.cap and self.cap.isOpened():
@@ -407,42 +479,22 @@ class AttendanceSystem:
                 self.status_label.config(text="Failed to capture frame. Check camera connection.")
                 self.release_camera()
                 return
-                
-            # Find faces in the frame
-            small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
-            rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
-            
-            face_locations = face_recognition.face_locations(rgb_small_frame)
-            face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
+            captured_at = time.monotonic()
             
-            face_names = []
-            for face_encoding in face_encodings:
-                # Compare with known faces
-                if len(self.known_face_encodings) > 0:  # Check if we have any known faces
-                    matches = face_recognition.compare_faces(self.known_face_encodings, face_encoding, tolerance=0.6)
-                    name = "Unknown"
-                    
-                    if True in matches:
-                        first_match_index = matches.index(True)
-                        name = self.known_face_names[first_match_index]
-                        
-                        # Mark attendance in database
-                        student_id = name.split("(")[1].split(")")[0]
-                        student_name = name.split(" (")[0]
-                        self.mark_attendance(student_id)
-                        self.status_label.config(text=f"Attendance marked for {student_name}")
-                else:
-                    name = "No registered students"
+            # Classes end and the next one starts while the camera keeps running
+            if captured_at >= self.next_session_check:
+                self.next_session_check = captured_at + SESSION_CHECK_SECONDS
+                if self.reconnect_database():
+                    self.marker.check_session()
                 
-                face_names.append(name)
+            # Recognize the faces and mark attendance
+            self.marker.detector = SCREEN_DETECTORS["attendance"]
+            _, face_locations, face_names, rejected_faces = self.marker.process(frame, captured_at)
             
             # Display results
-            for (top, right, bottom, left), name in zip(face_locations, face_names):
+            for box, name in zip(face_locations, face_names):
                 # Scale back up face locations
-                top *= 4
-                right *= 4
-                bottom *= 4
-                left *= 4
+                top, right, bottom, left = scale_box(box)
                 
                 # Draw a box around the face
                 cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
@@ -452,6 +504,13 @@ class AttendanceSystem:
                 font = cv2.FONT_HERSHEY_DUPLEX
                 cv2.putText(frame, name, (left + 6, bottom - 6), font, 0.8, (255, 255, 255), 1)
             
+            # Skipped faces get a hint on what would make them recognizable
+            for box, reason in rejected_faces:
+                top, right, bottom, left = scale_box(box)
+                cv2.rectangle(frame, (left, top), (right, bottom), (0, 165, 255), 2)
+                cv2.putText(frame, QUALITY_HINTS[reason], (left + 6, bottom - 6), cv2.FONT_HERSHEY_DUPLEX, 0.6,
+                            (0, 165, 255), 1)
+            
             # Convert to PhotoImage
             cv2image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
             img = Image.fromarray(cv2image)
@@ -470,35 +529,6 @@ class AttendanceSystem:
             print("Error in process_frame:", traceback.format_exc())
             self.release_camera()
     
-    def mark_attendance(self, student_id):
-        try:
-            if not self.reconnect_database():
-                return
-                
-            now = datetime.now()
-            date_str = now.strftime("%Y-%m-%d")
-            time_str = now.strftime("%H:%M:%S")
-            
-            cursor = self.conn.cursor()
-            
-            # Using a transaction to avoid race conditions
-            self.conn.execute("BEGIN TRANSACTION")
-            
-            # Check if attendance already marked today
-            cursor.execute("SELECT * FROM attendance WHERE student_id = ? AND date = ?", 
-                         (student_id, date_str))
-            if not cursor.fetchone():
-                cursor.execute("INSERT INTO attendance (student_id, date, time, status) VALUES (?, ?, ?, ?)",
-                             (student_id, date_str, time_str, "Present"))
-                self.status_label.config(text=f"Marked attendance for student {student_id}")
-            else:
-                self.status_label.config(text=f"Attendance already marked for {student_id} today")
-            
-            self.conn.commit()
-        except sqlite3.Error as e:
-            self.conn.rollback()
-            messagebox.showerror("Database Error", f"Error marking attendance: {str(e)}")
-    
     def open_faculty_login(self):
        self.clear_frame()
     
@@ -567,48 +597,341 @@ class AttendanceSystem:
                               font=("Arial", 20, "bold"), bg="#f0f0f0")
         title_label.pack(pady=20)
         
+        # Buttons frame
+        buttons_frame = tk.Frame(faculty_frame, bg="#f0f0f0")
+        buttons_frame.pack(pady=10)
+        
         # View all attendance button
-        view_all_btn = tk.Button(faculty_frame, text="View All Attendance", font=("Arial", 14),
+        view_all_btn = tk.Button(buttons_frame, text="View All Attendance", font=("Arial", 14),
                                width=20, height=2, command=self.view_all_attendance)
-        view_all_btn.pack(pady=15)
+        view_all_btn.grid(row=0, column=0, padx=10, pady=10)
         
         # View by date button
-        by_date_btn = tk.Button(faculty_frame, text="View Attendance by Date", font=("Arial", 14),
+        by_date_btn = tk.Button(buttons_frame, text="View Attendance by Date", font=("Arial", 14),
                               width=20, height=2, command=self.view_by_date)
-        by_date_btn.pack(pady=15)
+        by_date_btn.grid(row=0, column=1, padx=10, pady=10)
         
         # View by student button
-        by_student_btn = tk.Button(faculty_frame, text="View Attendance by Student", font=("Arial", 14),
+        by_student_btn = tk.Button(buttons_frame, text="View Attendance by Student", font=("Arial", 14),
                                  width=20, height=2, command=self.view_by_student)
-        by_student_btn.pack(pady=15)
+        by_student_btn.grid(row=1, column=0, padx=10, pady=10)
         
         # Export to CSV button
-        export_btn = tk.Button(faculty_frame, text="Export to CSV", font=("Arial", 14),
+        export_btn = tk.Button(buttons_frame, text="Export to CSV", font=("Arial", 14),
                              width=20, height=2, command=self.export_to_csv)
-        export_btn.pack(pady=15)
+        export_btn.grid(row=1, column=1, padx=10, pady=10)
+        
+        # Sync with central node button
+        sync_btn = tk.Button(buttons_frame, text="Sync with Central", font=("Arial", 14),
+                           width=20, height=2, command=self.sync_with_central,
+                           state=tk.NORMAL if CENTRAL_URL else tk.DISABLED)
+        sync_btn.grid(row=2, column=0, padx=10, pady=10)
+        
+        # Class session buttons
+        start_session_btn = tk.Button(buttons_frame, text="Start Class Session", font=("Arial", 14),
+                                    width=20, height=2, command=self.start_class_session)
+        start_session_btn.grid(row=2, column=1, padx=10, pady=10)
+        
+        close_session_btn = tk.Button(buttons_frame, text="Close Class Session", font=("Arial", 14),
+                                    width=20, height=2, command=self.close_class_session)
+        close_session_btn.grid(row=3, column=0, padx=10, pady=10)
+        
+        # Archive term button
+        archive_btn = tk.Button(buttons_frame, text="Archive Term", font=("Arial", 14),
+                              width=20, height=2, command=self.archive_term)
+        archive_btn.grid(row=3, column=1, padx=10, pady=10)
+        
+        # Unregistered people seen by the camera
+        unknown_btn = tk.Button(buttons_frame, text="Unknown Faces", font=("Arial", 14),
+                              width=20, height=2, command=self.view_unknown_faces)
+        unknown_btn.grid(row=4, column=0, padx=10, pady=10)
         
         # Back button
         back_btn = tk.Button(faculty_frame, text="Logout", font=("Arial", 14),
                            width=20, height=2, command=self.back_to_main)
         back_btn.pack(pady=15)
+        
+        # Query cache statistics
+        cache_stats = self.query_cache.stats()
+        cache_label = tk.Label(faculty_frame,
+                               text=f"Query cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+                                    f"({cache_stats['hit_rate']:.0%} hit rate), {cache_stats['entries']} cached",
+                               font=("Arial", 10), bg="#f0f0f0")
+        cache_label.pack(pady=5)
+        
+        # Face quality gate statistics
+        quality_label = tk.Label(faculty_frame, text=f"Face quality: {self.face_quality.summary()}",
+                                 font=("Arial", 10), bg="#f0f0f0")
+        quality_label.pack()
+        
+        # Audit snapshot writer statistics
+        snapshot_stats = self.snapshot_writer.stats()
+        snapshot_label = tk.Label(faculty_frame,
+                                  text=f"Audit snapshots: {snapshot_stats['written']} written, "
+                                       f"{snapshot_stats['dropped']} dropped, {snapshot_stats['pruned']} pruned",
+                                  font=("Arial", 10), bg="#f0f0f0")
+        snapshot_label.pack()
+        
+        # Profiling and memory diagnostics
+        diagnostics_btn = tk.Button(faculty_frame, text="Diagnostics", font=("Arial", 10),
+                                  command=self.open_diagnostics)
+        diagnostics_btn.pack()
     
-    def view_all_attendance(self):
+    def view_unknown_faces(self):
+        """List the distinct unregistered people seen per session, to enroll them later"""
+        self.marker.save_unknown_faces()
+        try:
+            people = list_unknown_faces(self.conn)
+        except sqlite3.Error as e:
+            messagebox.showerror("Database Error", f"Error loading unknown faces: {str(e)}")
+            return
+        if not people:
+            messagebox.showinfo("Unknown Faces", "No unknown faces have been seen yet")
+            return
+        
+        window = tk.Toplevel(self.root)
+        window.title("Unknown Faces")
+        window.geometry("600x500")
+        
+        canvas = tk.Canvas(window)
+        scrollbar = tk.Scrollbar(window, orient="vertical", command=canvas.yview)
+        list_frame = tk.Frame(canvas)
+        list_frame.bind("<Configure>", lambda event: canvas.configure(scrollregion=canvas.bbox("all")))
+        canvas.create_window((0, 0), window=list_frame, anchor="nw")
+        canvas.configure(yscrollcommand=scrollbar.set)
+        canvas.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        
+        # Keep references so Tk does not discard the thumbnails
+        window.thumbnails = []
+        
+        def dismiss(person_id, row_frame):
+            self.conn.execute("DELETE FROM unknown_faces WHERE id = ?", (person_id,))
+            self.conn.commit()
+            row_frame.destroy()
+        
+        for person in people:
+            row_frame = tk.Frame(list_frame, relief="ridge", bd=1)
+            row_frame.pack(fill="x", padx=5, pady=3)
+            
+            if person["face_crop"]:
+                image = cv2.imdecode(np.frombuffer(person["face_crop"], dtype=np.uint8), cv2.IMREAD_COLOR)
+                thumbnail = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+                thumbnail.thumbnail((80, 80))
+                photo = ImageTk.PhotoImage(thumbnail)
+                window.thumbnails.append(photo)
+                tk.Label(row_frame, image=photo).pack(side=tk.LEFT, padx=5, pady=5)
+            
+            session = f"{person['course']} session" if person["session_id"] else "No session"
+            tk.Label(row_frame, font=("Arial", 11), justify=tk.LEFT,
+                     text=f"Unknown #{person['number']} - {person['date']}, {session}\n"
+                          f"Seen {person['sightings']} times, {person['first_seen']} to {person['last_seen']}"
+                     ).pack(side=tk.LEFT, padx=10)
+            tk.Button(row_frame, text="Dismiss", font=("Arial", 10),
+                      command=lambda person_id=person["id"], row_frame=row_frame: dismiss(person_id, row_frame)
+                      ).pack(side=tk.RIGHT, padx=10)
+    
+    def open_diagnostics(self):
+        """Window for profiling the kiosk and tracking its memory while it keeps running"""
+        window = tk.Toplevel(self.root)
+        window.title("Diagnostics")
+        window.geometry("700x450")
+        
+        status_label = tk.Label(window, font=("Arial", 11), anchor="w", justify=tk.LEFT)
+        status_label.pack(pady=5, padx=10, fill="x")
+        
+        controls = tk.Frame(window)
+        controls.pack(pady=5)
+        
+        tk.Label(controls, text="Seconds:", font=("Arial", 11)).grid(row=0, column=0, padx=5)
+        seconds_entry = tk.Entry(controls, font=("Arial", 11), width=5)
+        seconds_entry.insert(0, "30")
+        seconds_entry.grid(row=0, column=1, padx=5)
+        
+        report_text = tk.Text(window, font=("Courier", 9), wrap=tk.NONE)
+        report_text.pack(pady=5, padx=10, fill="both", expand=True)
+        
+        def show_report(path):
+            try:
+                with open(path) as f:
+                    content = f.read()
+            except OSError as e:
+                content = f"Could not read {path}: {str(e)}"
+            report_text.delete("1.0", tk.END)
+            report_text.insert(tk.END, f"{path}\n\n{content}")
+        
+        def refresh():
+            if not window.winfo_exists():
+                return
+            status = self.diagnostics.status()
+            status_label.config(text=f"RSS: {status['rss_mib']:.1f} MiB   "
+                                     f"Profiler: {'running' if status['profiling'] else 'idle'}   "
+                                     f"tracemalloc: {'on' if status['tracing'] else 'off'}   "
+                                     f"Process ID: {os.getpid()}")
+            window.after(1000, refresh)
+        
+        def wait_for_profile():
+            if not window.winfo_exists():
+                return
+            if self.diagnostics.profiler.running.is_set():
+                window.after(500, wait_for_profile)
+            elif self.diagnostics.last_report:
+                show_report(self.diagnostics.last_report)
+        
+        def profile():
+            try:
+                seconds = float(seconds_entry.get())
+            except ValueError:
+                messagebox.showerror("Error", "Seconds must be a number", parent=window)
+                return
+            if not self.diagnostics.profile(seconds):
+                messagebox.showinfo("Diagnostics", "A profile is already running", parent=window)
+                return
+            report_text.delete("1.0", tk.END)
+            report_text.insert(tk.END, f"Profiling for {seconds:g} seconds...")
+            window.after(500, wait_for_profile)
+        
+        def log_memory():
+            report_text.delete("1.0", tk.END)
+            report_text.insert(tk.END, self.diagnostics.logger.log())
+        
+        tk.Button(controls, text="Start Profile", font=("Arial", 11),
+                  command=profile).grid(row=0, column=2, padx=5)
+        tk.Button(controls, text="Memory Snapshot", font=("Arial", 11),
+                  command=lambda: show_report(self.diagnostics.memory_snapshot())).grid(row=0, column=3, padx=5)
+        tk.Button(controls, text="Log Memory Now", font=("Arial", 11),
+                  command=log_memory).grid(row=0, column=4, padx=5)
+        
+        refresh()
+    
+    def sync_with_central(self):
+        """Replicate local changes to the central node without blocking the UI"""
+        if not CENTRAL_URL:
+            messagebox.showerror("Sync", "Set ATTENDANCE_CENTRAL_URL to enable syncing")
+            return
+        if self.sync_thread and self.sync_thread.is_alive():
+            messagebox.showinfo("Sync", "A sync is already in progress")
+            return
+        
+        result = {}
+        def run_sync():
+            try:
+                result.update(SyncClient(DB_PATH, CENTRAL_URL).sync())
+            except Exception as e:
+                result["error"] = str(e)
+        
+        self.sync_thread = threading.Thread(target=run_sync, daemon=True)
+        self.sync_thread.start()
+        self.root.after(200, self.check_sync, result)
+    
+    def check_sync(self, result):
+        """Poll the sync worker and report once it finishes"""
+        if self.sync_thread and self.sync_thread.is_alive():
+            self.root.after(200, self.check_sync, result)
+            return
+        
+        if "error" in result:
+            messagebox.showerror("Sync Failed", f"Error syncing with central node: {result['error']}")
+            return
+        
+        # Pick up students registered at other kiosks
+        self.load_known_faces()
+        messagebox.showinfo("Sync Complete",
+                            f"Pushed {result['pushed']} changes ({result['duplicates']} already received), "
+                            f"pulled {result['pulled']} changes, "
+                            f"resolved {result['push_conflicts'] + result['pull_conflicts']} conflicts")
+    
+    def start_class_session(self):
+        """Open a class session for a course starting now"""
+        course = simpledialog.askstring("Class Session", "Course:", parent=self.root)
+        if not course:
+            return
+        room = simpledialog.askstring("Class Session", "Room (leave empty for any kiosk):",
+                                      parent=self.root, initialvalue=KIOSK_ROOM or "")
+        minutes = simpledialog.askinteger("Class Session", "Duration (minutes):", parent=self.root,
+                                          initialvalue=60, minvalue=1, maxvalue=600)
+        if not minutes:
+            return
+        
         try:
             if not self.reconnect_database():
                 return
-                
-            cursor = self.conn.cursor()
-            cursor.execute('''
+            
+            students = roster_size(self.conn, course)
+            if students == 0 and not messagebox.askyesno(
+                    "Class Session", f"No students are registered for {course}. Start anyway?"):
+                return
+            
+            session = start_session(self.conn, course, room, minutes)
+            messagebox.showinfo("Class Session",
+                                f"Session {session['id']} for {course} started, "
+                                f"{session['start_time']} - {session['end_time']} ({students} students)")
+        except sqlite3.Error as e:
+            messagebox.showerror("Database Error", f"Error starting class session: {str(e)}")
+    
+    def close_class_session(self):
+        """Close an open session and mark the rest of its roster absent"""
+        try:
+            if not self.reconnect_database():
+                return
+            
+            sessions = open_sessions(self.conn)
+            if not sessions:
+                messagebox.showinfo("Class Session", "There are no open class sessions")
+                return
+            
+            session_id = sessions[0]["id"]
+            if len(sessions) > 1:
+                choices = "\n".join(f"{s['id']}: {s['course']} {s['room'] or ''} {s['date']} {s['start_time']}"
+                                    for s in sessions)
+                session_id = simpledialog.askinteger("Close Class Session",
+                                                     f"Open sessions:\n{choices}\n\nSession ID to close:",
+                                                     parent=self.root, initialvalue=session_id)
+                if not session_id:
+                    return
+            
+            absent = close_session(self.conn, session_id)
+            messagebox.showinfo("Class Session", f"Session {session_id} closed, {absent} students marked absent")
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+        except sqlite3.Error as e:
+            messagebox.showerror("Database Error", f"Error closing class session: {str(e)}")
+    
+    def archive_term(self):
+        """Move a finished academic term out of the live attendance table"""
+        term = simpledialog.askstring("Archive Term", "Term name (e.g. 2025-fall):", parent=self.root)
+        if not term:
+            return
+        start_date = simpledialog.askstring("Archive Term", "First day of term (YYYY-MM-DD):", parent=self.root)
+        end_date = simpledialog.askstring("Archive Term", "Last day of term (YYYY-MM-DD):", parent=self.root)
+        if not start_date or not end_date:
+            return
+        
+        try:
+            if not self.reconnect_database():
+                return
+            
+            moved = archive_term(self.conn, term, start_date, end_date)
+            # Archival bypasses the change log, so cached results cannot be invalidated precisely
+            self.query_cache.clear()
+            messagebox.showinfo("Archive Term", f"Moved {moved} attendance records for {term} to the archive")
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+        except sqlite3.Error as e:
+            messagebox.showerror("Database Error", f"Error archiving term: {str(e)}")
+    
+    def view_all_attendance(self):
+        def query(conn):
+            return self.query_cache.fetchall(conn, f'''
             SELECT a.id, s.student_id, s.name, a.date, a.time, a.status 
-            FROM attendance a
+            FROM {attendance_source(conn)} a
             JOIN students s ON a.student_id = s.student_id
             ORDER BY a.date DESC, a.time DESC
-            ''')
-            
-            attendance_data = cursor.fetchall()
-            self.display_attendance_data("All Attendance Records", attendance_data)
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", f"Error retrieving attendance data: {str(e)}")
+            ''', tags=[ALL_ATTENDANCE, ALL_STUDENTS])
+        
+        self.run_query("Loading all attendance records...", query,
+                       lambda data: self.display_attendance_data("All Attendance Records", data),
+                       "Error retrieving attendance data")
     
     def view_by_date(self):
         date_str = simpledialog.askstring("Date Input", "Enter date (YYYY-MM-DD):",
@@ -623,56 +946,72 @@ class AttendanceSystem:
             messagebox.showerror("Error", "Invalid date format. Please use YYYY-MM-DD")
             return
         
-        try:
-            if not self.reconnect_database():
-                return
-                
-            cursor = self.conn.cursor()
-            cursor.execute('''
+        def query(conn):
+            return self.query_cache.fetchall(conn, f'''
             SELECT a.id, s.student_id, s.name, a.date, a.time, a.status 
-            FROM attendance a
+            FROM {attendance_source(conn, date_str, date_str)} a
             JOIN students s ON a.student_id = s.student_id
             WHERE a.date = ?
             ORDER BY a.time
-            ''', (date_str,))
-            
-            attendance_data = cursor.fetchall()
-            self.display_attendance_data(f"Attendance Records for {date_str}", attendance_data)
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", f"Error retrieving attendance data: {str(e)}")
+            ''', (date_str,), tags=[("date", date_str), ALL_STUDENTS])
+        
+        self.run_query(f"Loading attendance for {date_str}...", query,
+                       lambda data: self.display_attendance_data(f"Attendance Records for {date_str}", data),
+                       "Error retrieving attendance data")
+    
+    def find_students(self, text, on_results):
+        """Search students on the query worker (a newer search supersedes a pending one)"""
+        self.query_executor.submit(lambda conn: search_students(conn, text), on_results,
+                                   lambda e: print("Student search failed:", e), key="search")
+    
+    def find_student_ids(self, text, on_results):
+        """Search student IDs by prefix on the query worker, for the login screen"""
+        self.query_executor.submit(lambda conn: search_student_ids(conn, text), on_results,
+                                   lambda e: print("Student ID search failed:", e), key="search")
     
     def view_by_student(self):
-        student_id = simpledialog.askstring("Student ID", "Enter student ID:",
-                                          parent=self.root)
-        if not student_id:
-            return
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Find Student")
+        dialog.transient(self.root)
         
-        try:
-            if not self.reconnect_database():
+        tk.Label(dialog, text="Student ID, name or course:", font=("Arial", 12)).pack(pady=10, padx=10)
+        
+        def choose(student_id):
+            if not student_id:
                 return
-                
-            cursor = self.conn.cursor()
-            
+            dialog.destroy()
+            self.view_student_records(student_id)
+        
+        search_entry = StudentSearchEntry(dialog, self.find_students, choose, width=40)
+        search_entry.pack(pady=5, padx=10, fill="x")
+        search_entry.focus_set()
+        
+        # Typing an exact ID still works without picking a suggestion
+        tk.Button(dialog, text="View", font=("Arial", 12), width=10,
+                  command=lambda: choose(search_entry.get())).pack(pady=10)
+    
+    def view_student_records(self, student_id):
+        def query(conn):
             # First verify if student exists
-            cursor.execute("SELECT name FROM students WHERE student_id = ?", (student_id,))
-            student = cursor.fetchone()
+            if not conn.execute("SELECT name FROM students WHERE student_id = ?", (student_id,)).fetchone():
+                return None
             
-            if not student:
-                messagebox.showerror("Error", f"Student ID {student_id} not found")
-                return
-                
-            cursor.execute('''
+            return self.query_cache.fetchall(conn, f'''
             SELECT a.id, s.student_id, s.name, a.date, a.time, a.status 
-            FROM attendance a
+            FROM {attendance_source(conn)} a
             JOIN students s ON a.student_id = s.student_id
             WHERE a.student_id = ?
             ORDER BY a.date DESC, a.time DESC
-            ''', (student_id,))
-            
-            attendance_data = cursor.fetchall()
+            ''', (student_id,), tags=[("student", student_id)])
+        
+        def show(attendance_data):
+            if attendance_data is None:
+                messagebox.showerror("Error", f"Student ID {student_id} not found")
+                return
             self.display_attendance_data(f"Attendance Records for Student {student_id}", attendance_data)
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", f"Error retrieving attendance data: {str(e)}")
+        
+        self.run_query(f"Loading attendance for {student_id}...", query, show,
+                       "Error retrieving attendance data")
     
     def display_attendance_data(self, title, data):
         self.clear_frame()
@@ -729,19 +1068,15 @@ class AttendanceSystem:
         back_btn.pack(pady=10)
     
     def export_to_csv(self):
-        try:
-            if not self.reconnect_database():
-                return
-                
-            cursor = self.conn.cursor()
-            cursor.execute('''
+        def query(conn):
+            return conn.execute(f'''
             SELECT s.student_id, s.name, s.course, a.date, a.time, a.status 
-            FROM attendance a
+            FROM {attendance_source(conn)} a
             JOIN students s ON a.student_id = s.student_id
             ORDER BY a.date DESC, a.time DESC
-            ''')
-            
-            data = cursor.fetchall()
+            ''').fetchall()
+        
+        def save(data):
             if not data:
                 messagebox.showinfo("Export", "No attendance data to export")
                 return
@@ -757,8 +1092,54 @@ class AttendanceSystem:
                     messagebox.showinfo("Export Successful", f"Data exported to {file_path}")
             except Exception as e:
                 messagebox.showerror("Export Failed", f"Error exporting data: {str(e)}")
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", f"Error retrieving data for export: {str(e)}")
+        
+        self.run_query("Preparing export...", query, save, "Error retrieving data for export")
+    
+    def run_query(self, message, work, on_success, error_message, key="view"):
+        """Run ``work(conn)`` on the query worker while showing a cancellable loading bar
+        
+        A new query with the same key supersedes (cancels) the previous one.
+        """
+        def finished(result):
+            self.hide_loading(handle)
+            on_success(result)
+        
+        def failed(error):
+            self.hide_loading(handle)
+            if isinstance(error, TimeoutError):
+                messagebox.showerror("Query Timeout", f"{error_message}: {str(error)}")
+            else:
+                messagebox.showerror("Database Error", f"{error_message}: {str(error)}")
+        
+        handle = self.query_executor.submit(work, finished, failed, key=key)
+        self.show_loading(message, handle)
+        return handle
+    
+    def show_loading(self, message, handle):
+        """Show a loading bar with a cancel button over the current screen"""
+        self.hide_loading()
+        self.loading_handle = handle
+        self.loading_frame = tk.Frame(self.root, bg="#fff8dc", relief=tk.RIDGE, bd=2)
+        self.loading_frame.place(relx=0.5, rely=0.95, anchor="s")
+        
+        tk.Label(self.loading_frame, text=message, font=("Arial", 12), bg="#fff8dc").pack(side=tk.LEFT, padx=10, pady=5)
+        
+        def cancel():
+            handle.cancel()
+            self.hide_loading()
+        
+        tk.Button(self.loading_frame, text="Cancel", font=("Arial", 10), command=cancel).pack(side=tk.LEFT, padx=10, pady=5)
+    
+    def hide_loading(self, handle=None):
+        """Remove the loading bar (only if it belongs to ``handle`` when one is given)"""
+        if handle is not None and handle is not self.loading_handle:
+            return
+        if self.loading_frame is not None:
+            try:
+                self.loading_frame.destroy()
+            except tk.TclError:
+                pass
+            self.loading_frame = None
     
     def open_registration(self):
         self.clear_frame()
@@ -822,6 +1203,9 @@ class AttendanceSystem:
                            width=15, command=self.back_to_main)
         back_btn.grid(row=1, column=1, padx=10, pady=5)
         
+        # Face detector used for camera capture and uploads
+        self.create_detector_selector(buttons_frame, "registration").grid(row=2, column=0, columnspan=2, pady=5)
+        
         # Initialize variables
         self.cap = None
         self.captured_encoding = None
@@ -831,7 +1215,7 @@ class AttendanceSystem:
         """Start the camera for registration"""
         if self.cap is None:
             try:
-                self.cap = cv2.VideoCapture(0)
+                self.cap = open_camera()
                 if not self.cap.isOpened():
                     messagebox.showerror("Camera Error", "Could not open camera. Please check your camera connection.")
                     self.cap = None
@@ -878,20 +1262,29 @@ class AttendanceSystem:
             
         # Load and process the image
         image = face_recognition.load_image_file(file_path)
-        face_locations = face_recognition.face_locations(image)
+        face_locations = detect_faces(image, detector_for_screen("registration"))
         
         if not face_locations:
             messagebox.showerror("Error", "No face detected in the uploaded image")
             return
             
-        # Take the first face found
-        face_encoding = face_recognition.face_encodings(image, [face_locations[0]])[0]
+        # Take the largest face found, if it is good enough to match against later
+        face_location = max(face_locations, key=box_area)
+        reason, _ = self.face_quality.assess(image, [face_location])[0]
+        if reason is not None and QUALITY_GATE_ENABLED:
+            messagebox.showerror("Error", f"Face image quality is too low ({QUALITY_HINTS[reason]}). "
+                                          "Please choose another photo.")
+            return
+        face_encoding = encode_face(image, face_location, self.marker.version)
+        if not self.confirm_new_face(face_encoding):
+            return
         
-        # Store in database
+        # Store in database, with the face crop so it can be re-encoded later
         face_encoding_bytes = face_encoding.tobytes()
         cursor.execute(
-            "INSERT INTO students (student_id, name, course, face_encoding) VALUES (?, ?, ?, ?)",
-            (student_id, name, course, face_encoding_bytes)
+            "INSERT INTO students (student_id, name, course, face_encoding, face_crop, encoding_version) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (student_id, name, course, face_encoding_bytes, crop_face(image, face_location), self.marker.version)
         )
         self.conn.commit()
         
@@ -922,7 +1315,7 @@ class AttendanceSystem:
             
         # Detect faces in the frame
         rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        face_locations = face_recognition.face_locations(rgb_frame)
+        face_locations = detect_faces(rgb_frame, detector_for_screen("registration"))
         
         # Draw rectangles around detected faces
         for (top, right, bottom, left) in face_locations:
@@ -965,28 +1358,53 @@ class AttendanceSystem:
             messagebox.showerror("Error", f"Student ID {student_id} already exists")
             return
             
-        # Capture a frame
-        ret, frame = self.cap.read()
-        if not ret:
-            messagebox.showerror("Error", "Failed to capture frame")
-            return
+        # Capture a few frames and keep the best face among them
+        best = None
+        captured = 0
+        reasons = []
+        for _ in range(REGISTRATION_FRAMES):
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+            captured += 1
             
-        # Find face in the frame
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        face_locations = face_recognition.face_locations(rgb_frame)
+            # Find face in the frame; the largest one is the student being registered
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            face_locations = detect_faces(rgb_frame, detector_for_screen("registration"))
+            if not face_locations:
+                continue
+            face_location = max(face_locations, key=box_area)
+            
+            reason, score = self.face_quality.assess(rgb_frame, [face_location])[0]
+            if reason is not None and QUALITY_GATE_ENABLED:
+                reasons.append(reason)
+            elif best is None or score > best[0]:
+                best = (score, rgb_frame, face_location)
         
-        if not face_locations:
-            messagebox.showerror("Error", "No face detected. Please position face properly.")
+        if not captured:
+            messagebox.showerror("Error", "Failed to capture frame")
             return
+        if best is None:
+            if reasons:
+                hint = QUALITY_HINTS[max(set(reasons), key=reasons.count)]
+                messagebox.showerror("Error", f"Face image quality is too low ({hint}). Please try again.")
+            else:
+                messagebox.showerror("Error", "No face detected. Please position face properly.")
+            return
+        _, rgb_frame, face_location = best
             
-        # Get encoding of the first face found
-        face_encoding = face_recognition.face_encodings(rgb_frame, [face_locations[0]])[0]
+        # Get encoding of the best face found
+        face_encoding = encode_face(rgb_frame, face_location, self.marker.version)
+        if not self.confirm_new_face(face_encoding):
+            return
         
-        # Save the student record with face encoding
+        # Save the student record with face encoding and the face crop it came from
         face_encoding_bytes = face_encoding.tobytes()
         cursor.execute(
-            "INSERT INTO students (student_id, name, course, face_encoding) VALUES (?, ?, ?, ?)",
-            (student_id, name, course, face_encoding_bytes)
+            "INSERT INTO students (student_id, name, course, face_encoding, face_crop, encoding_version) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (student_id, name, course, face_encoding_bytes, crop_face(rgb_frame, face_location),
+             self.marker.version)
         )
         self.conn.commit()
         
@@ -1007,6 +1425,35 @@ class AttendanceSystem:
         messagebox.showerror("Error", f"Error during face capture: {str(e)}")
         print("Error in capture_face:", traceback.format_exc())
 
+    def confirm_new_face(self, face_encoding):
+        """Ask before enrolling a face that is already registered under another student ID"""
+        # Anything within the match tolerance would be marked as that student at the door
+        index, distance = nearest_face(self.marker.encodings, face_encoding)
+        if index is None or distance > MATCH_TOLERANCE:
+            return True
+        return messagebox.askyesno("Possible Duplicate",
+                                   f"This face closely matches {self.marker.labels[index]} "
+                                   f"(distance {distance:.2f}).\n\nRegister it under a new student ID anyway?")
+
+    def create_detector_selector(self, parent, screen):
+        """Build a dropdown that switches the face detector backend for a screen"""
+        selector_frame = tk.Frame(parent, bg="#f0f0f0")
+        tk.Label(selector_frame, text="Detector:", font=("Arial", 12), bg="#f0f0f0").pack(side=tk.LEFT)
+        
+        choice = tk.StringVar(selector_frame, value=SCREEN_DETECTORS[screen])
+        
+        def select_detector(name):
+            try:
+                # Load the model now so a missing file is reported here, not mid-capture
+                get_detector(name)
+                SCREEN_DETECTORS[screen] = name
+            except (FileNotFoundError, ValueError) as e:
+                messagebox.showerror("Detector Error", f"Could not load {name} detector: {str(e)}")
+                choice.set(SCREEN_DETECTORS[screen])
+        
+        tk.OptionMenu(selector_frame, choice, *DETECTORS, command=select_detector).pack(side=tk.LEFT)
+        return selector_frame
+    
     def clear_registration_form(self):
         """Clear the registration form fields"""
         for widget in self.root.winfo_children():
@@ -1024,7 +1471,9 @@ class AttendanceSystem:
         except (sqlite3.Error, AttributeError):
             # Try to reconnect
             try:
-                self.conn = sqlite3.connect("attendance.db")
+                self.conn = sqlite3.connect(DB_PATH)
+                if getattr(self, "marker", None) is not None:
+                    self.marker.conn = self.conn
                 return True
             except sqlite3.Error as e:
                 messagebox.showerror("Database Error", f"Failed to connect to database: {str(e)}")
@@ -1032,6 +1481,11 @@ class AttendanceSystem:
 
     def clear_frame(self):
         """Clear all widgets from the root window"""
+        # Results of pending queries would land on a screen that no longer exists
+        if getattr(self, "query_executor", None) is not None:
+            self.query_executor.cancel_all()
+        self.loading_frame = None
+        
         for widget in self.root.winfo_children():
             widget.destroy()
     
@@ -1051,6 +1505,12 @@ class AttendanceSystem:
         """Clean up resources and exit the application"""
         if self.cap:
            self.release_camera()
+        
+        if getattr(self, "marker", None) is not None:
+            self.marker.stop_pipeline()
+            self.marker.save_unknown_faces()
+        if getattr(self, "snapshot_writer", None) is not None:
+            self.snapshot_writer.close()
     
         if hasattr(self, 'conn') and self.conn:
            self.conn.close()
@@ -1061,8 +1521,8 @@ class AttendanceSystem:
     # Add error handling functionality
     def setup_exception_logging(self):
         """Set up logging for unhandled exceptions"""
-        # Redirect stderr to capture unhandled exceptions
-        sys.stderr = io.StringIO()
+        # Redirect stderr to capture unhandled exceptions (only the most recent lines are kept)
+        sys.stderr = BoundedStream()
     
         # Set up a custom exception hook
         def custom_excepthook(exc_type, exc_value, exc_traceback):
@@ -1095,6 +1555,7 @@ if __name__ == "__main__":
         # Start the application
         root = tk.Tk()
         app = AttendanceSystem(root)
+        DIAGNOSTICS.start()
         root.mainloop()
         
     except Exception as e:
@@ -0,0 +1,359 @@
+import sqlite3
+import time
+from datetime import datetime
+
+import numpy as np
+
+from detectors import get_detector, DEFAULT_DETECTOR
+from gallery import create_gallery_tables, gallery_version, matchable_students, parse_version, DEFAULT_VERSION
+from motion import MotionGate
+from pipeline import RecognitionPipeline
+from recognition import (prepare_frame, scale_box, detect_faces_in_regions, prioritize_faces,
+                         encode_faces, match_faces_scoped, FRAME_SCALE)
+from sessions import create_session_table, active_session
+from snapshots import create_snapshot_columns, crop_snapshot
+from sync import install_change_log
+from unknowns import create_unknown_faces_table, UnknownFaces, UNKNOWN_MIN_DISTANCE
+
+# Seconds between checks for a new class session in the room while the camera runs
+SESSION_CHECK_SECONDS = 60
+
+
+def create_attendance_tables(conn):
+    """Create the students and attendance tables and everything the recognize-and-mark loop adds to them
+
+    Safe to run on every start; both the GUI and the headless kiosk call it.
+    """
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS students (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id TEXT UNIQUE NOT NULL,
+        name TEXT NOT NULL,
+        course TEXT NOT NULL,
+        face_encoding BLOB
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS attendance (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id TEXT NOT NULL,
+        date TEXT NOT NULL,
+        time TEXT NOT NULL,
+        status TEXT NOT NULL,
+        FOREIGN KEY (student_id) REFERENCES students (student_id)
+    )
+    ''')
+    conn.commit()
+
+    # Change log used to replicate attendance and students to the central node
+    install_change_log(conn)
+    # Audit snapshot link and match distance of each attendance mark
+    create_snapshot_columns(conn)
+    # Unregistered people seen during each session
+    create_unknown_faces_table(conn)
+    # Stored face crops and versioned encodings, so the gallery can be re-encoded
+    create_gallery_tables(conn)
+    # Class sessions (course, room, time window) used to scope matching
+    create_session_table(conn)
+
+
+class AttendanceMarker:
+    """Recognize the faces in camera frames and mark attendance, without any UI
+
+    The loop shared by the attendance screen and the headless kiosk: the
+    motion gate skips static frames, faces are detected, quality-checked and
+    encoded (in worker processes once ``start`` is given workers), matched
+    against the session roster and then the whole gallery, and marked once a
+    day with an audit snapshot. Faces that match nobody go to the session's
+    unknown-face cache unless ``track_unknowns`` is off. What happens is reported as ``events(event, **fields)``
+    so each front end can show or log it.
+    """
+
+    def __init__(self, conn, snapshot_writer, detector=DEFAULT_DETECTOR, room=None, quality_gate=None,
+                 events=None, track_unknowns=True):
+        self.conn = conn
+        self.snapshot_writer = snapshot_writer
+        # Detector name; may be switched between frames
+        self.detector = detector
+        self.room = room
+        self.quality_gate = quality_gate
+        self.events = events or (lambda event, **fields: None)
+        self.track_unknowns = track_unknowns
+
+        self.student_ids = []
+        self.names = []
+        self.courses = []
+        self.student_names = {}
+        self.encodings = np.empty((0, 128))
+        self.version = DEFAULT_VERSION
+        self.landmarks = parse_version(DEFAULT_VERSION)[0]
+        self.session = None
+        self.roster = None
+        self.unknown_faces = None
+
+        self.motion_gate = MotionGate()
+        self.pipeline = None
+        self.pipeline_settings = None
+        # Faces of the latest frame the workers returned, shown until the next one arrives
+        self.last_faces = []
+        self.last_rejected = []
+        # Capture time (time.monotonic) of the frame whose faces are being marked
+        self.frame_captured_at = None
+        # Status of today's row of each student already seen, so repeat sightings skip the database
+        self.marked_today = {}
+        self.marked_date = None
+        self.marks = 0
+
+    @property
+    def labels(self):
+        """``Name (student ID)`` of each gallery face"""
+        return [f"{name} ({student_id})" for name, student_id in zip(self.names, self.student_ids)]
+
+    def load_gallery(self):
+        """Load the registered faces, the encoder settings they were made with, and the roster"""
+        # Registrations and live frames must use the same encoder settings as the gallery
+        self.version = gallery_version(self.conn)
+        rows, stale = matchable_students(self.conn, self.version)
+        rows = [row for row in rows if row[3]]
+        self.student_ids = [row[0] for row in rows]
+        self.names = [row[1] for row in rows]
+        self.courses = [row[2] for row in rows]
+        self.student_names = dict(zip(self.student_ids, self.names))
+        self.encodings = np.array([np.frombuffer(row[3], dtype=np.float64) for row in rows]).reshape(-1, 128)
+        self.landmarks = parse_version(self.version)[0]
+        # Gallery indices changed, so rebuild the roster of the running session
+        self._update_roster()
+        # Newly registered students are no longer unknown
+        if self.unknown_faces is not None:
+            self.unknown_faces.forget_registered(self.encodings)
+        self.events("gallery_loaded", students=len(rows), version=self.version)
+        if stale:
+            self.events("stale_encodings", students=stale, version=self.version)
+
+    def _update_roster(self):
+        if self.session:
+            self.roster = [i for i, course in enumerate(self.courses) if course == self.session["course"]]
+        else:
+            self.roster = None
+
+    def check_session(self):
+        """Follow the class session running in this room; unknown faces are kept per session"""
+        try:
+            session = active_session(self.conn, self.room)
+        except sqlite3.Error as e:
+            self.events("session_lookup_failed", error=str(e))
+            session = None
+        if (session and session["id"]) != (self.session and self.session["id"]):
+            self.session = session
+            self._update_roster()
+            if session:
+                self.events("session_started", session_id=session["id"], course=session["course"],
+                            roster=len(self.roster))
+            else:
+                self.events("session_ended")
+
+        session_id = session["id"] if session else 0
+        if not self.track_unknowns:
+            return
+        if self.unknown_faces is None or (self.unknown_faces.date, self.unknown_faces.session_id) != \
+                (datetime.now().strftime("%Y-%m-%d"), session_id):
+            self.save_unknown_faces()
+            self.unknown_faces = UnknownFaces(session_id=session_id)
+
+    def save_unknown_faces(self):
+        """Store the distinct unknown people of the current session for faculty to review"""
+        if self.unknown_faces is None:
+            return
+        try:
+            saved = self.unknown_faces.save(self.conn)
+        except sqlite3.Error as e:
+            self.events("unknown_faces_not_saved", error=str(e))
+            return
+        if saved:
+            self.events("unknown_faces_saved", people=saved, session_id=self.unknown_faces.session_id)
+
+    def mark(self, student_id, distance=None, face_crop=None):
+        """Insert today's "Present" row for the student once; returns True if a row was added"""
+        now = datetime.now()
+        date_str = now.strftime("%Y-%m-%d")
+        if date_str != self.marked_date:
+            self.marked_today.clear()
+            self.marked_date = date_str
+        name = self.student_names.get(student_id, student_id)
+        if student_id in self.marked_today:
+            self.events("already_marked", student_id=student_id, name=name, status=self.marked_today[student_id])
+            return False
+
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+            cursor = self.conn.execute("SELECT status FROM attendance WHERE student_id = ? AND date = ?",
+                                       (student_id, date_str))
+            attendance_id = None
+            existing = cursor.fetchone()
+            if not existing:
+                cursor.execute("INSERT INTO attendance (student_id, date, time, status, match_distance) "
+                               "VALUES (?, ?, ?, ?, ?)",
+                               (student_id, date_str, now.strftime("%H:%M:%S"), "Present", distance))
+                attendance_id = cursor.lastrowid
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            self.events("mark_failed", student_id=student_id, name=name, error=str(e))
+            return False
+
+        # Rows written when a session closed may record the student absent
+        self.marked_today[student_id] = existing[0] if existing else "Present"
+        if attendance_id is None:
+            self.events("already_marked", student_id=student_id, name=name, status=existing[0])
+            return False
+        self.marks += 1
+        # Encoding and saving the snapshot happens off the camera loop
+        if face_crop is not None:
+            self.snapshot_writer.submit(attendance_id, face_crop)
+        self.events("attendance_marked", student_id=student_id, name=name,
+                    distance=None if distance is None else round(distance, 3),
+                    session_id=self.session["id"] if self.session else None)
+        return True
+
+    def identify(self, face_encodings, frame=None, face_locations=None):
+        """Match encodings (roster, then gallery, then the unknown-face cache), mark attendance and label each face
+
+        With the camera ``frame`` and the (scaled-down) ``face_locations``, each
+        mark and each new unknown face also gets a snapshot of the face.
+        """
+        if len(self.encodings) == 0:
+            return ["No registered students"] * len(face_encodings)
+
+        matches = match_faces_scoped(self.encodings, face_encodings, self.roster)
+        # Faces nobody matched may be unknown people already seen this session
+        rows = [row for row, (index, _) in enumerate(matches) if index is None]
+        unknown_people = [None] * len(face_encodings)
+        if self.unknown_faces is not None:
+            for row, person in zip(rows, self.unknown_faces.match([face_encodings[row] for row in rows])):
+                unknown_people[row] = person
+
+        labels = []
+        for row, (index, distance) in enumerate(matches):
+            if unknown_people[row] is not None:
+                labels.append(f"Unknown #{unknown_people[row].number}")
+                continue
+            # Crops are only needed for new unknowns and students not marked yet
+            new_unknown = index is None and distance > UNKNOWN_MIN_DISTANCE and self.unknown_faces is not None
+            face_crop = None
+            if frame is not None and face_locations is not None and \
+                    (new_unknown or index is not None and self.student_ids[index] not in self.marked_today):
+                face_crop = crop_snapshot(frame, scale_box(face_locations[row]))
+            if index is None:
+                # Remember the face so recurring unknowns can be listed for enrollment
+                if new_unknown:
+                    self.unknown_faces.add(face_encodings[row], face_crop)
+                labels.append("Unknown")
+            else:
+                self.mark(self.student_ids[index], distance, face_crop)
+                labels.append(f"{self.names[index]} ({self.student_ids[index]})")
+        return labels
+
+    def start(self, workers=0):
+        """Begin a camera session: fresh motion statistics and, with ``workers``, recognition worker processes"""
+        self.motion_gate = MotionGate()
+        self.last_faces = []
+        self.last_rejected = []
+        settings = (self.detector, self.landmarks)
+        if self.pipeline is not None and (not workers or self.pipeline_settings != settings):
+            self.stop_pipeline()
+        if workers and self.pipeline is None:
+            try:
+                self.pipeline = RecognitionPipeline(workers, detector=self.detector, landmarks=self.landmarks,
+                                                    quality_scale=FRAME_SCALE if self.quality_gate else None)
+                self.pipeline_settings = settings
+                self.events("workers_started", workers=workers)
+            except Exception as e:
+                self.events("workers_not_started", error=str(e))
+
+    def _handle_result(self, result):
+        """Mark the faces of one frame the workers recognized; returns False for worker errors"""
+        if result.error:
+            self.events("worker_error", error=result.error)
+            return False
+        if self.quality_gate is not None:
+            self.quality_gate.record(len(result.boxes), result.rejected)
+        if result.detection_seconds is not None:
+            self.motion_gate.record_detection(result.detection_seconds)
+        result_frame, self.frame_captured_at = result.meta
+        self.last_rejected = result.rejected
+        self.last_faces = list(zip(result.boxes, self.identify(result.encodings, result_frame, result.boxes)))
+        return True
+
+    def drain(self):
+        """Mark the faces of frames still in the workers, e.g. when the camera stops"""
+        try:
+            while self.pipeline is not None and self.pipeline.pending():
+                for result in self.pipeline.results(timeout=1):
+                    self._handle_result(result)
+        except RuntimeError as e:
+            self.events("workers_failed", error=str(e))
+            self.stop_pipeline()
+
+    def stop_pipeline(self):
+        """Stop the workers without waiting for the frames they hold"""
+        pipeline, self.pipeline = self.pipeline, None
+        if pipeline is not None:
+            pipeline.close()
+
+    def close_pipeline(self):
+        """Mark the frames still in the workers and stop them"""
+        self.drain()
+        self.stop_pipeline()
+
+    def process(self, frame, captured_at=None):
+        """Recognize and mark the faces in one camera frame
+
+        Returns the downscaled RGB frame, the boxes on it with their labels,
+        and the (box, reason) pairs the quality gate rejected. With workers the
+        faces are those of the latest frame they finished, which lags the
+        camera by a frame or two.
+        """
+        rgb_small_frame = prepare_frame(frame)
+        # Skip detection on static frames and only scan the regions that changed
+        height, width = rgb_small_frame.shape[:2]
+        full_frame = [(0, width, height, 0)]
+        regions = self.motion_gate.check(rgb_small_frame)
+
+        if self.pipeline is not None:
+            try:
+                if regions:
+                    # The frame is kept (not sent to the workers) for audit snapshots of its marks,
+                    # with its capture time so marks made later can be timed from the camera
+                    frame_copy = None if self.pipeline.full() else frame.copy()
+                    self.pipeline.submit(rgb_small_frame, None if regions == full_frame else regions,
+                                         meta=(frame_copy, captured_at))
+                for result in self.pipeline.results():
+                    self._handle_result(result)
+            except ValueError as e:
+                # The frame does not fit the shared-memory ring; mark what the workers hold and stop them
+                self.events("workers_unusable", error=str(e))
+                self.close_pipeline()
+            except RuntimeError as e:
+                # A recognition worker died; recognize this frame and the next ones in this process
+                self.events("workers_failed", error=str(e))
+                self.stop_pipeline()
+            else:
+                boxes = [box for box, label in self.last_faces]
+                labels = [label for box, label in self.last_faces]
+                return rgb_small_frame, boxes, labels, self.last_rejected
+
+        boxes = []
+        if regions:
+            started = time.process_time()
+            boxes = detect_faces_in_regions(rgb_small_frame, regions, get_detector(self.detector))
+            if regions == full_frame:
+                self.motion_gate.record_detection(time.process_time() - started)
+        # Crowded frames keep only the nearest faces, encoded together in one call
+        boxes = prioritize_faces(boxes)
+        rejected = []
+        if self.quality_gate is not None:
+            # Tiny, blurred, badly lit or turned faces are not worth an encoding
+            boxes, rejected = self.quality_gate.filter(rgb_small_frame, boxes, FRAME_SCALE)
+        encodings = encode_faces(rgb_small_frame, boxes, landmarks=self.landmarks)
+        self.frame_captured_at = captured_at
+        return rgb_small_frame, boxes, self.identify(encodings, frame, boxes), rejected
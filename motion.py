@@ -0,0 +1,140 @@
+import time
+
+import cv2
+import numpy as np
+
+
+def merge_regions(regions):
+    """Merge overlapping (top, right, bottom, left) regions so no face is scanned twice"""
+    merged = list(regions)
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(merged)):
+            for j in range(i + 1, len(merged)):
+                a, b = merged[i], merged[j]
+                if a[0] < b[2] and b[0] < a[2] and a[3] < b[1] and b[3] < a[1]:
+                    merged[i] = (min(a[0], b[0]), max(a[1], b[1]), max(a[2], b[2]), min(a[3], b[3]))
+                    del merged[j]
+                    changed = True
+                    break
+            if changed:
+                break
+    return merged
+
+
+class MotionGate:
+    """Cheap change detector that decides whether a frame needs face detection
+
+    Frames are shrunk to ``width`` pixels, blurred and compared against a
+    running-average background. ``check`` returns an empty list when nothing
+    changed (skip detection), the changed regions when something moved, or one
+    full-frame region when most of the frame changed or a periodic refresh is
+    due.
+    """
+
+    def __init__(self, width=80, threshold=25, min_changed=0.002, full_frame_ratio=0.5,
+                 background_rate=0.05, padding=0.5, min_region=48, refresh_seconds=5.0):
+        self.width = width
+        self.threshold = threshold
+        self.min_changed = min_changed
+        self.full_frame_ratio = full_frame_ratio
+        self.background_rate = background_rate
+        self.padding = padding
+        self.min_region = min_region
+        self.refresh_seconds = refresh_seconds
+
+        self.background = None
+        self.last_detection = 0.0
+        self.last_frame = None
+
+        self.frames = 0
+        self.skipped = 0
+        self.regional = 0
+        self.full = 0
+        self.idle_seconds = 0.0
+        self.detection_cpu = 0.0
+        self.detections = 0
+
+    def check(self, frame):
+        """Return the (top, right, bottom, left) regions of ``frame`` worth scanning"""
+        self.frames += 1
+        now = time.monotonic()
+        elapsed = now - self.last_frame if self.last_frame is not None else 0.0
+        self.last_frame = now
+        height, width = frame.shape[:2]
+        factor = width / self.width
+        small = cv2.resize(frame, (self.width, max(int(height / factor), 1)), interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_RGB2GRAY), (5, 5), 0).astype(np.float32)
+
+        full_frame = [(0, width, height, 0)]
+        if self.background is None:
+            self.background = gray
+            return self._scan(full_frame, now)
+
+        mask = cv2.absdiff(gray, self.background) > self.threshold
+        cv2.accumulateWeighted(gray, self.background, self.background_rate)
+        changed = mask.mean()
+
+        if changed < self.min_changed:
+            if now - self.last_detection >= self.refresh_seconds:
+                return self._scan(full_frame, now)
+            self.idle_seconds += elapsed
+            self.skipped += 1
+            return []
+        if changed >= self.full_frame_ratio:
+            return self._scan(full_frame, now)
+
+        # Bounding boxes of the changed blobs, padded so a partly moving face fits
+        mask = cv2.dilate(mask.astype(np.uint8), np.ones((3, 3), np.uint8), iterations=2)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        regions = []
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            pad_x = max(w * self.padding, (self.min_region / factor - w) / 2)
+            pad_y = max(h * self.padding, (self.min_region / factor - h) / 2)
+            regions.append((
+                max(int((y - pad_y) * factor), 0),
+                min(int((x + w + pad_x) * factor), width),
+                min(int((y + h + pad_y) * factor), height),
+                max(int((x - pad_x) * factor), 0),
+            ))
+
+        regions = merge_regions(regions)
+        covered = sum((bottom - top) * (right - left) for top, right, bottom, left in regions)
+        if covered >= self.full_frame_ratio * width * height:
+            return self._scan(full_frame, now)
+        self.regional += 1
+        self.last_detection = now
+        return regions
+
+    def _scan(self, regions, now):
+        self.full += 1
+        self.last_detection = now
+        return regions
+
+    def record_detection(self, cpu_seconds):
+        """Record the CPU time one detection pass took (used to estimate savings)"""
+        self.detection_cpu += cpu_seconds
+        self.detections += 1
+
+    def stats(self):
+        mean_detection = self.detection_cpu / self.detections if self.detections else 0.0
+        saved = self.skipped * mean_detection
+        idle_hours = self.idle_seconds / 3600
+        return {
+            "frames": self.frames,
+            "skipped": self.skipped,
+            "regional": self.regional,
+            "full": self.full,
+            "skip_ratio": self.skipped / self.frames if self.frames else 0.0,
+            "cpu_saved_seconds": saved,
+            "idle_seconds": self.idle_seconds,
+            "cpu_saved_per_idle_hour": saved / idle_hours if idle_hours else 0.0,
+        }
+
+    def summary(self):
+        stats = self.stats()
+        return (f"Motion gate skipped {stats['skipped']}/{stats['frames']} frames "
+                f"({stats['skip_ratio']:.0%}), saving ~{stats['cpu_saved_seconds']:.1f} CPU s "
+                f"({stats['cpu_saved_per_idle_hour']:.0f} CPU s per idle hour)")
@@ -0,0 +1,243 @@
+import os
+import re
+import sqlite3
+from datetime import datetime
+
+import click
+
+from snapshots import create_snapshot_columns
+from sync import install_change_log, set_state
+
+ARCHIVE_DIR = os.environ.get("ATTENDANCE_ARCHIVE_DIR", "archive")
+# SQLite attaches at most 10 databases per connection by default; wider ranges are read in batches
+MAX_ATTACHED_TERMS = 9
+ATTENDANCE_COLUMNS = "id, student_id, date, time, status, snapshot_hash, match_distance"
+
+
+def create_terms_table(conn):
+    """Create the table recording which academic terms were archived where"""
+    # Archived rows keep their audit columns, so the live table needs them first
+    create_snapshot_columns(conn)
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS terms (
+        name TEXT PRIMARY KEY,
+        start_date TEXT NOT NULL,
+        end_date TEXT NOT NULL,
+        archive_path TEXT,
+        archived_at TEXT,
+        row_count INTEGER
+    )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance (date)")
+    conn.commit()
+
+
+def schema_name(term):
+    return "term_" + re.sub(r"\W", "_", term)
+
+
+def _migrate_archive(conn, schema):
+    """Add the audit columns to a term archived before attendance rows carried them"""
+    columns = {row[1] for row in conn.execute(f"PRAGMA {schema}.table_info(attendance)")}
+    if not columns or {"snapshot_hash", "match_distance"} <= columns:
+        return
+    if "snapshot_hash" not in columns:
+        conn.execute(f"ALTER TABLE {schema}.attendance ADD COLUMN snapshot_hash TEXT")
+    if "match_distance" not in columns:
+        conn.execute(f"ALTER TABLE {schema}.attendance ADD COLUMN match_distance REAL")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_attendance_snapshot ON attendance (snapshot_hash)")
+
+
+def _attach(conn, schema, path):
+    conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+    _migrate_archive(conn, schema)
+
+
+def archived_terms(conn, start_date=None, end_date=None):
+    """Archived terms overlapping [start_date, end_date] (open-ended when None)"""
+    query = "SELECT name, archive_path FROM terms WHERE archive_path IS NOT NULL"
+    params = []
+    if end_date:
+        query += " AND start_date <= ?"
+        params.append(end_date)
+    if start_date:
+        query += " AND end_date >= ?"
+        params.append(start_date)
+    return conn.execute(query + " ORDER BY start_date", params).fetchall()
+
+
+def attendance_source(conn, start_date=None, end_date=None):
+    """Return a FROM-clause source for attendance between the given dates
+
+    Only the hot table is used when no archived term overlaps the range;
+    otherwise the needed term databases are attached and combined with
+    UNION ALL. Partitions no longer needed are detached. A range spanning
+    more terms than can be attached at once is read in batches of
+    ``MAX_ATTACHED_TERMS`` into a temporary table, see ``_collect_terms``.
+    """
+    terms = archived_terms(conn, start_date, end_date)
+    if not terms:
+        return "attendance"
+
+    needed = {schema_name(name): path for name, path in terms}
+    batched = len(needed) > MAX_ATTACHED_TERMS
+    attached = {row[1] for row in conn.execute("PRAGMA database_list")}
+    for schema in attached - {"main", "temp"}:
+        if schema.startswith("term_") and (batched or schema not in needed):
+            conn.execute(f"DETACH DATABASE {schema}")
+
+    parts = [f"SELECT {ATTENDANCE_COLUMNS} FROM main.attendance"]
+    if batched:
+        _collect_terms(conn, needed, start_date, end_date)
+        parts.append(f"SELECT {ATTENDANCE_COLUMNS} FROM temp.archived_attendance")
+    else:
+        for schema, path in needed.items():
+            if schema not in attached:
+                _attach(conn, schema, path)
+        parts += [f"SELECT {ATTENDANCE_COLUMNS} FROM {schema}.attendance" for schema in needed]
+    return "(" + " UNION ALL ".join(parts) + ")"
+
+
+def _collect_terms(conn, needed, start_date=None, end_date=None):
+    """Copy the archived rows between the given dates into ``temp.archived_attendance``
+
+    Term databases are attached ``MAX_ATTACHED_TERMS`` at a time, their rows
+    appended with one INSERT per batch, and detached again, so any number
+    of terms can be read. The table is rebuilt on every call.
+    """
+    where, params = [], []
+    if start_date:
+        where.append("date >= ?")
+        params.append(start_date)
+    if end_date:
+        where.append("date <= ?")
+        params.append(end_date)
+    where = " WHERE " + " AND ".join(where) if where else ""
+
+    conn.execute("DROP TABLE IF EXISTS temp.archived_attendance")
+    conn.execute(f"CREATE TEMP TABLE archived_attendance AS SELECT {ATTENDANCE_COLUMNS} FROM main.attendance WHERE 0")
+    schemas = list(needed)
+    for start in range(0, len(schemas), MAX_ATTACHED_TERMS):
+        batch = schemas[start:start + MAX_ATTACHED_TERMS]
+        for schema in batch:
+            _attach(conn, schema, needed[schema])
+        try:
+            parts = [f"SELECT {ATTENDANCE_COLUMNS} FROM {schema}.attendance{where}" for schema in batch]
+            conn.execute(f"INSERT INTO temp.archived_attendance {' UNION ALL '.join(parts)}", params * len(batch))
+            conn.commit()
+        finally:
+            for schema in batch:
+                conn.execute(f"DETACH DATABASE {schema}")
+
+
+def archive_term(conn, term, start_date, end_date, archive_dir=ARCHIVE_DIR):
+    """Move a closed term's attendance rows into their own database file
+
+    Returns the number of rows moved. The copy and the delete happen in one
+    transaction, and the delete is not written to the sync change log.
+    """
+    for value in (start_date, end_date):
+        datetime.strptime(value, "%Y-%m-%d")
+    if end_date >= datetime.now().strftime("%Y-%m-%d"):
+        raise ValueError(f"Term {term} has not ended yet; only closed terms can be archived")
+
+    overlap = conn.execute(
+        "SELECT name FROM terms WHERE archive_path IS NOT NULL AND name != ? AND start_date <= ? AND end_date >= ?",
+        (term, end_date, start_date)).fetchone()
+    if overlap:
+        raise ValueError(f"Term {term} overlaps already archived term {overlap[0]}")
+
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.abspath(os.path.join(archive_dir, f"attendance_{re.sub(r'[^0-9A-Za-z_-]', '_', term)}.db"))
+    schema = schema_name(term)
+
+    if conn.in_transaction:
+        conn.commit()
+    attached = {row[1] for row in conn.execute("PRAGMA database_list")}
+    if schema not in attached:
+        conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.attendance (
+            id INTEGER PRIMARY KEY,
+            student_id TEXT NOT NULL,
+            date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            status TEXT NOT NULL,
+            snapshot_hash TEXT,
+            match_distance REAL
+        )
+        ''')
+        _migrate_archive(conn, schema)
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_attendance_date ON attendance (date)")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_attendance_student ON attendance (student_id)")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_attendance_snapshot ON attendance (snapshot_hash)")
+        cursor.execute(f'''
+        INSERT OR IGNORE INTO {schema}.attendance ({ATTENDANCE_COLUMNS})
+        SELECT {ATTENDANCE_COLUMNS} FROM main.attendance WHERE date BETWEEN ? AND ?
+        ''', (start_date, end_date))
+
+        set_state(conn, "suppress_log", 1)
+        cursor.execute("DELETE FROM main.attendance WHERE date BETWEEN ? AND ?", (start_date, end_date))
+        moved = cursor.rowcount
+        cursor.execute("DELETE FROM sync_state WHERE key = 'suppress_log'")
+
+        cursor.execute('''
+        INSERT INTO terms (name, start_date, end_date, archive_path, archived_at, row_count)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, ?)
+        ON CONFLICT(name) DO UPDATE SET archive_path = excluded.archive_path,
+            archived_at = excluded.archived_at, row_count = COALESCE(row_count, 0) + excluded.row_count
+        ''', (term, start_date, end_date, path, moved))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute(f"DETACH DATABASE {schema}")
+    return moved
+
+
+@click.group()
+def cli():
+    """Manage term partitions of the attendance table"""
+
+
+@cli.command()
+@click.option("--db", "db_path", default="attendance.db", show_default=True)
+@click.option("--term", required=True, help="Term name, e.g. 2025-fall")
+@click.option("--start", "start_date", required=True, help="First day of the term (YYYY-MM-DD)")
+@click.option("--end", "end_date", required=True, help="Last day of the term (YYYY-MM-DD)")
+@click.option("--dir", "archive_dir", default=ARCHIVE_DIR, show_default=True)
+@click.option("--vacuum/--no-vacuum", default=False, help="Reclaim the freed space in the hot database")
+def archive(db_path, term, start_date, end_date, archive_dir, vacuum):
+    """Move a closed term out of the hot database"""
+    conn = sqlite3.connect(db_path)
+    install_change_log(conn)
+    create_terms_table(conn)
+    try:
+        moved = archive_term(conn, term, start_date, end_date, archive_dir)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Archived {moved} attendance rows for {term}")
+    if vacuum:
+        conn.execute("VACUUM")
+    conn.close()
+
+
+@cli.command("list")
+@click.option("--db", "db_path", default="attendance.db", show_default=True)
+def list_terms(db_path):
+    """Show archived terms"""
+    conn = sqlite3.connect(db_path)
+    create_terms_table(conn)
+    for name, start, end, path, archived_at, rows in conn.execute(
+            "SELECT name, start_date, end_date, archive_path, archived_at, row_count FROM terms ORDER BY start_date"):
+        click.echo(f"{name}: {start} - {end}, {rows or 0} rows in {path} (archived {archived_at})")
+    conn.close()
+
+
+if __name__ == "__main__":
+    cli()
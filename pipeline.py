@@ -0,0 +1,186 @@
+import multiprocessing
+import os
+import queue
+import traceback
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Worker processes for frame-parallel recognition (0 keeps recognition in the kiosk process)
+RECOGNITION_WORKERS = int(os.environ.get("ATTENDANCE_RECOGNITION_WORKERS", "0"))
+# Largest frame a ring slot holds: a 1080p camera frame after FRAME_SCALE, with headroom
+SLOT_BYTES = 1024 * 1024
+SLOTS_PER_WORKER = 2
+
+
+def _worker(shm_name, slot_bytes, tasks, results, detector, landmarks, quality_scale):
+    """Detect, quality-check and encode faces in frames read straight out of the shared ring"""
+    # Spawned workers re-import the parent's main module (main.py or kiosk.py, guarded by
+    # __name__ == "__main__"), so dlib is loaded in each worker either way; importing here
+    # only keeps ``import pipeline`` itself free of the recognition stack
+    from detectors import get_detector
+    from recognition import detect_faces_in_regions, prioritize_faces, encode_faces
+    from quality import QualityGate
+
+    ring = shared_memory.SharedMemory(name=shm_name)
+    face_detector = get_detector(detector)
+    gate = QualityGate() if quality_scale else None
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            stream, seq, slot, shape, regions = task
+            try:
+                frame = np.ndarray(shape, dtype=np.uint8, buffer=ring.buf, offset=slot * slot_bytes)
+                full_frame = regions is None
+                if full_frame:
+                    regions = [(0, shape[1], shape[0], 0)]
+                started = time.process_time()
+                boxes = prioritize_faces(detect_faces_in_regions(frame, regions, face_detector))
+                # Full-frame detection CPU, for the motion gate's savings estimate in the kiosk process
+                detection_seconds = time.process_time() - started if full_frame else None
+                rejected = []
+                if gate is not None:
+                    boxes, rejected = gate.filter(frame, boxes, quality_scale)
+                encodings = encode_faces(frame, boxes, landmarks)
+                del frame  # Release the view before the slot is reused
+                results.put((stream, seq, slot, boxes, np.asarray(encodings).reshape(-1, 128), rejected,
+                             detection_seconds, None))
+            except Exception:
+                results.put((stream, seq, slot, [], np.empty((0, 128)), [], None, traceback.format_exc()))
+    finally:
+        ring.close()
+
+
+class FrameResult:
+    """Boxes and encodings for one submitted frame, plus the (box, reason) faces the quality gate skipped
+
+    ``detection_seconds`` is the worker CPU time spent detecting faces when
+    the whole frame was scanned, and None for regional scans.
+    """
+
+    def __init__(self, stream, seq, boxes, encodings, rejected, error, meta, detection_seconds=None):
+        self.stream = stream
+        self.seq = seq
+        self.boxes = boxes
+        self.encodings = encodings
+        self.rejected = rejected
+        self.detection_seconds = detection_seconds
+        self.error = error
+        self.meta = meta
+
+
+class RecognitionPipeline:
+    """Frame-parallel face detection and encoding across worker processes
+
+    Frames are copied into a ring of ``multiprocessing.shared_memory`` slots
+    and only (slot, shape, regions) is queued, so full frames are never
+    pickled; workers send back just the boxes and 128-d encodings. When
+    every slot is busy ``submit`` drops the frame instead of queueing it,
+    which keeps latency bounded. ``results`` hands back finished frames in
+    submission order per stream (camera), so marking sees them in sequence.
+    With ``quality_scale`` (the size of submitted frames relative to the
+    camera frame), workers skip encoding faces that fail the quality gate.
+    """
+
+    def __init__(self, workers=RECOGNITION_WORKERS or os.cpu_count() or 1, slots=None,
+                 slot_bytes=SLOT_BYTES, detector="hog", landmarks="small", quality_scale=None):
+        self.workers = workers
+        self.slot_bytes = slot_bytes
+        slots = slots or workers * SLOTS_PER_WORKER
+
+        # Spawn rather than fork: the kiosk process holds a Tk/X connection and threads
+        context = multiprocessing.get_context("spawn")
+        self.ring = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        self.free_slots = list(range(slots))
+        self.tasks = context.Queue()
+        self.results_queue = context.Queue()
+        self.processes = [
+            context.Process(target=_worker, daemon=True, name=f"recognition-{i}",
+                            args=(self.ring.name, slot_bytes, self.tasks, self.results_queue, detector, landmarks,
+                                  quality_scale))
+            for i in range(workers)
+        ]
+        for process in self.processes:
+            process.start()
+
+        self.next_seq = {}
+        self.expected = {}
+        self.finished = {}
+        self.meta = {}
+        self.submitted = 0
+        self.dropped = 0
+        self.completed = 0
+
+    def submit(self, rgb_frame, regions=None, stream=0, meta=None):
+        """Queue a frame for recognition; returns its sequence number, or None if dropped"""
+        if rgb_frame.nbytes > self.slot_bytes:
+            raise ValueError(f"Frame of {rgb_frame.nbytes} bytes does not fit a {self.slot_bytes}-byte slot")
+        if not self.free_slots:
+            self.dropped += 1
+            return None
+
+        slot = self.free_slots.pop()
+        view = np.ndarray(rgb_frame.shape, dtype=np.uint8, buffer=self.ring.buf, offset=slot * self.slot_bytes)
+        view[...] = rgb_frame
+        del view
+
+        seq = self.next_seq.get(stream, 0)
+        self.next_seq[stream] = seq + 1
+        self.meta[(stream, seq)] = meta
+        self.tasks.put((stream, seq, slot, rgb_frame.shape, regions))
+        self.submitted += 1
+        return seq
+
+    def full(self):
+        """True when every ring slot holds a frame still being processed"""
+        return not self.free_slots
+
+    def pending(self):
+        return self.submitted - self.completed
+
+    def results(self, timeout=0):
+        """Collect finished frames and return those now in order, oldest first
+
+        With ``timeout`` > 0, waits up to that long for the first result.
+        """
+        block = timeout > 0
+        while True:
+            try:
+                (stream, seq, slot, boxes, encodings, rejected, detection_seconds,
+                 error) = self.results_queue.get(block, timeout or None)
+            except queue.Empty:
+                self._check_workers()
+                break
+            block = False
+            self.free_slots.append(slot)
+            self.finished[(stream, seq)] = FrameResult(stream, seq, boxes, encodings, rejected, error,
+                                                       self.meta.pop((stream, seq), None), detection_seconds)
+
+        # Release each stream's results only up to its first gap
+        ready = []
+        for stream in self.next_seq:
+            seq = self.expected.get(stream, 0)
+            while (stream, seq) in self.finished:
+                ready.append(self.finished.pop((stream, seq)))
+                seq += 1
+            self.expected[stream] = seq
+        self.completed += len(ready)
+        return ready
+
+    def _check_workers(self):
+        for process in self.processes:
+            if not process.is_alive():
+                raise RuntimeError(f"Recognition worker {process.name} exited with code {process.exitcode}")
+
+    def close(self):
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.ring.close()
+        self.ring.unlink()
@@ -0,0 +1,137 @@
+import collections
+import os
+
+import cv2
+import face_recognition
+import numpy as np
+
+# Set ATTENDANCE_QUALITY_GATE=0 to encode every detected face
+QUALITY_GATE_ENABLED = os.environ.get("ATTENDANCE_QUALITY_GATE", "1") != "0"
+# Smallest face side, in pixels of the full camera frame
+MIN_FACE_SIZE = 60
+# Variance of the Laplacian over the face resized to SHARPNESS_SIZE pixels
+MIN_SHARPNESS = 40.0
+SHARPNESS_SIZE = 64
+MIN_BRIGHTNESS = 40
+MAX_BRIGHTNESS = 220
+# Nose offset from the eye midpoint, as a fraction of the eye distance
+MAX_YAW = 0.4
+# Frames tried when registering from the camera; the best one is kept
+REGISTRATION_FRAMES = 5
+
+# What the person in front of the camera can do about each reject reason
+QUALITY_HINTS = {
+    "small": "Move closer",
+    "dark": "Too dark",
+    "bright": "Too bright",
+    "blurred": "Hold still",
+    "profile": "Face the camera",
+}
+
+
+def _center(points):
+    return np.mean(np.asarray(points, dtype=np.float64), axis=0)
+
+
+def estimate_yaw(landmarks):
+    """Signed left/right turn of a face from its eye and nose landmarks (0 is frontal)"""
+    left_eye, right_eye = _center(landmarks["left_eye"]), _center(landmarks["right_eye"])
+    eye_distance = np.linalg.norm(left_eye - right_eye)
+    if eye_distance == 0:
+        return 1.0
+    nose = _center(landmarks["nose_tip"])
+    return float((nose[0] - (left_eye[0] + right_eye[0]) / 2) / eye_distance)
+
+
+class QualityGate:
+    """Cheap checks that keep faces unlikely to match away from the encoder
+
+    Each face is checked for size, brightness and sharpness (Laplacian
+    variance) from its pixels alone; faces that pass those get the 5-point
+    landmarks, and turned faces are rejected by their estimated yaw. Counts
+    of passed faces and of rejects per reason are kept for the dashboard.
+    """
+
+    def __init__(self, min_size=MIN_FACE_SIZE, min_sharpness=MIN_SHARPNESS, min_brightness=MIN_BRIGHTNESS,
+                 max_brightness=MAX_BRIGHTNESS, max_yaw=MAX_YAW):
+        self.min_size = min_size
+        self.min_sharpness = min_sharpness
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.max_yaw = max_yaw
+
+        self.passed = 0
+        self.rejects = collections.Counter()
+
+    def _pixel_checks(self, rgb_frame, box, scale):
+        """Return (reject reason or None, sharpness) without touching the landmark model"""
+        top, right, bottom, left = box
+        if min(bottom - top, right - left) < self.min_size * scale:
+            return "small", 0.0
+
+        height, width = rgb_frame.shape[:2]
+        crop = rgb_frame[max(top, 0):min(bottom, height), max(left, 0):min(right, width)]
+        if crop.size == 0:
+            return "small", 0.0
+        gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
+        brightness = gray.mean()
+        if brightness < self.min_brightness:
+            return "dark", 0.0
+        if brightness > self.max_brightness:
+            return "bright", 0.0
+
+        # A fixed size makes sharpness comparable between near and far faces
+        gray = cv2.resize(gray, (SHARPNESS_SIZE, SHARPNESS_SIZE), interpolation=cv2.INTER_AREA)
+        sharpness = cv2.Laplacian(gray, cv2.CV_64F).var()
+        if sharpness < self.min_sharpness:
+            return "blurred", sharpness
+        return None, sharpness
+
+    def assess(self, rgb_frame, face_locations, scale=1.0):
+        """Return a (reject reason or None, score) pair per face; higher scores are better faces
+
+        ``scale`` is the size of ``rgb_frame`` relative to the camera frame.
+        """
+        results = [self._pixel_checks(rgb_frame, box, scale) for box in face_locations]
+
+        # One landmark pass for every face that is still in the running
+        candidates = [row for row, (reason, _) in enumerate(results) if reason is None]
+        if candidates:
+            landmarks = face_recognition.face_landmarks(rgb_frame, [face_locations[row] for row in candidates],
+                                                        model="small")
+            for row, points in zip(candidates, landmarks):
+                yaw = abs(estimate_yaw(points))
+                sharpness = results[row][1]
+                if yaw > self.max_yaw:
+                    results[row] = ("profile", sharpness)
+                else:
+                    results[row] = (None, sharpness * (1 - yaw))
+
+        for reason, _ in results:
+            if reason is None:
+                self.passed += 1
+            else:
+                self.rejects[reason] += 1
+        return results
+
+    def filter(self, rgb_frame, face_locations, scale=1.0):
+        """Split faces into the boxes worth encoding and (box, reason) pairs for the rest"""
+        kept, rejected = [], []
+        for box, (reason, _) in zip(face_locations, self.assess(rgb_frame, face_locations, scale)):
+            if reason is None:
+                kept.append(box)
+            else:
+                rejected.append((box, reason))
+        return kept, rejected
+
+    def record(self, passed, rejected):
+        """Add the outcome of faces checked elsewhere (e.g. in a recognition worker)"""
+        self.passed += passed
+        self.rejects.update(reason for _, reason in rejected)
+
+    def summary(self):
+        checked = self.passed + sum(self.rejects.values())
+        if not checked:
+            return "No faces checked"
+        reasons = ", ".join(f"{reason} {count}" for reason, count in self.rejects.most_common())
+        return f"{self.passed}/{checked} faces encoded" + (f"; rejected: {reasons}" if reasons else "")
@@ -0,0 +1,120 @@
+import threading
+from collections import OrderedDict
+
+# Tag carried by every query whose result depends on any attendance row
+ALL_ATTENDANCE = ("attendance",)
+# Tag carried by queries that show student details (names, courses) for many students
+ALL_STUDENTS = ("students",)
+
+
+class QueryCache:
+    """Bounded LRU cache of query results, invalidated from the sync change log
+
+    Every cached result is tagged with what it depends on: ``("date", d)``,
+    ``("student", id)``, ``ALL_ATTENDANCE`` or ``ALL_STUDENTS``. Before each
+    lookup the change log is checked for new entries, whoever wrote them (this
+    kiosk, a sync pull or another process), and only the results tagged with a
+    touched date or student are dropped. Maintenance that bypasses the change
+    log (term archival) must call ``clear``. Safe to share between the UI
+    thread and the background query worker.
+    """
+
+    def __init__(self, max_entries=256, max_scan=1000):
+        self.max_entries = max_entries
+        self.max_scan = max_scan
+        self.entries = OrderedDict()
+        self.tags = {}
+        self.seen_seq = None
+        self.lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def fetchall(self, conn, sql, params=(), tags=()):
+        """Return cached rows for (sql, params) or run the query and cache it"""
+        key = (sql, tuple(params))
+        with self.lock:
+            self._apply_changes(conn)
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            self.misses += 1
+            seen_seq = self.seen_seq
+
+        # Run the query outside the lock so other lookups are not blocked by it
+        rows = conn.execute(sql, params).fetchall()
+
+        with self.lock:
+            # Only store the result if nothing was written while it ran
+            if self.seen_seq == seen_seq:
+                self.entries[key] = (rows, tuple(tags))
+                for tag in tags:
+                    self.tags.setdefault(tag, set()).add(key)
+                while len(self.entries) > self.max_entries:
+                    self._drop(next(iter(self.entries)))
+                    self.evictions += 1
+        return rows
+
+    def _apply_changes(self, conn):
+        seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+        if self.seen_seq is None or seq < self.seen_seq:
+            # First lookup, or a different/rebuilt database: nothing cached can be trusted
+            self.clear()
+        elif seq - self.seen_seq > self.max_scan:
+            self.clear()
+        elif seq > self.seen_seq:
+            changes = conn.execute("SELECT table_name, op, row_key, json_extract(payload, '$.old_key') "
+                                   "FROM change_log WHERE seq > ? AND seq <= ?", (self.seen_seq, seq))
+            for table, op, row_key, old_key in changes:
+                # An update may move the row to another key; results for the old one are stale too
+                keys = {row_key, old_key} - {None}
+                if table == "attendance":
+                    for key in keys:
+                        student_id, date_str = key.split("|", 1)
+                        self._invalidate((("student", student_id), ("date", date_str)))
+                    self._invalidate([ALL_ATTENDANCE])
+                elif table == "students":
+                    # A newly registered student has no attendance rows that other results could show
+                    self._invalidate([("student", key) for key in keys])
+                    if op != "INSERT":
+                        self._invalidate([ALL_STUDENTS])
+        self.seen_seq = seq
+
+    def invalidate(self, *tags):
+        with self.lock:
+            self._invalidate(tags)
+
+    def _invalidate(self, tags):
+        for tag in tags:
+            for key in list(self.tags.get(tag, ())):
+                self._drop(key)
+                self.invalidations += 1
+
+    def _drop(self, key):
+        _, tags = self.entries.pop(key)
+        for tag in tags:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+    def clear(self):
+        with self.lock:
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+            self.tags.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,197 @@
+import threading
+
+import cv2
+import dlib
+import numpy as np
+import face_recognition_models
+
+from detectors import get_detector
+
+# Frames are downscaled before detection; boxes are scaled back up for display
+FRAME_SCALE = 0.25
+MATCH_TOLERANCE = 0.6
+# Crowded frames only encode the largest (nearest) faces
+MAX_FACES_PER_FRAME = 15
+# Landmark model files, as used by face_recognition.face_encodings
+LANDMARK_MODELS = {
+    "small": face_recognition_models.pose_predictor_five_point_model_location,
+    "large": face_recognition_models.pose_predictor_model_location,
+}
+
+# Loaded on first use, once per process
+_predictors = {}
+_face_encoder = None
+# False once the dlib build turned out to lack the multi-image descriptor call
+_batch_descriptors = True
+# dlib keeps per-layer buffers inside the network, so calls from different threads take turns
+_encoder_lock = threading.Lock()
+
+
+def prepare_frame(frame, scale=FRAME_SCALE):
+    """Downscale a BGR camera frame and convert it to RGB for detection"""
+    if scale != 1:
+        frame = cv2.resize(frame, (0, 0), fx=scale, fy=scale)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+
+def scale_box(box, scale=FRAME_SCALE):
+    """Map a (top, right, bottom, left) box from a scaled frame back to the original"""
+    factor = 1 / scale
+    return tuple(int(round(value * factor)) for value in box)
+
+
+def detect_faces(rgb_frame, detector=None):
+    """Return (top, right, bottom, left) boxes for every face in the frame"""
+    return (detector or get_detector()).detect(rgb_frame)
+
+
+def _models(landmarks):
+    """The landmark predictor for ``landmarks`` and the face encoder network"""
+    global _face_encoder
+    if landmarks not in _predictors:
+        _predictors[landmarks] = dlib.shape_predictor(LANDMARK_MODELS[landmarks]())
+    if _face_encoder is None:
+        _face_encoder = dlib.face_recognition_model_v1(face_recognition_models.face_recognition_model_location())
+    return _predictors[landmarks], _face_encoder
+
+
+def encode_faces(rgb_frame, face_locations, landmarks="small", jitters=1):
+    """Return one 128-d encoding per face location, from a single descriptor call for the frame
+
+    dlib runs all the frame's faces through the network as one batch, so a
+    crowded frame costs one forward pass rather than one per face.
+    """
+    if len(face_locations) == 0:
+        return []
+    predictor, encoder = _models(landmarks)
+    with _encoder_lock:
+        shapes = dlib.full_object_detections()
+        for top, right, bottom, left in face_locations:
+            shapes.append(predictor(rgb_frame, dlib.rectangle(left, top, right, bottom)))
+        descriptors = encoder.compute_face_descriptor(rgb_frame, shapes, jitters)
+    return [np.array(descriptor) for descriptor in descriptors]
+
+
+def detect_faces_in_regions(rgb_frame, regions, detector=None):
+    """Detect faces only inside (top, right, bottom, left) regions of the frame"""
+    height, width = rgb_frame.shape[:2]
+    if regions == [(0, width, height, 0)]:
+        return detect_faces(rgb_frame, detector)
+
+    face_locations = []
+    for top, right, bottom, left in regions:
+        crop = np.ascontiguousarray(rgb_frame[top:bottom, left:right])
+        for face_top, face_right, face_bottom, face_left in detect_faces(crop, detector):
+            face_locations.append((face_top + top, face_right + left, face_bottom + top, face_left + left))
+    return face_locations
+
+
+def box_area(box):
+    top, right, bottom, left = box
+    return max(bottom - top, 0) * max(right - left, 0)
+
+
+def prioritize_faces(face_locations, max_faces=MAX_FACES_PER_FRAME):
+    """Keep at most ``max_faces`` boxes, largest (nearest the camera) first"""
+    if max_faces is None or len(face_locations) <= max_faces:
+        return list(face_locations)
+    return sorted(face_locations, key=box_area, reverse=True)[:max_faces]
+
+
+def encode_faces_batch(rgb_images, locations_per_image, landmarks="small", jitters=1):
+    """Encode faces from several images with a single dlib descriptor call
+
+    Returns a list with one list of encodings per image. Falls back to one
+    call per image on dlib builds without the multi-image descriptor call.
+    """
+    global _batch_descriptors
+    if not any(len(locations) for locations in locations_per_image):
+        return [[] for _ in locations_per_image]
+    if not _batch_descriptors:
+        return [encode_faces(image, locations, landmarks, jitters)
+                for image, locations in zip(rgb_images, locations_per_image)]
+
+    predictor, encoder = _models(landmarks)
+    with _encoder_lock:
+        batch_faces = []
+        for image, locations in zip(rgb_images, locations_per_image):
+            shapes = dlib.full_object_detections()
+            for top, right, bottom, left in locations:
+                shapes.append(predictor(image, dlib.rectangle(left, top, right, bottom)))
+            batch_faces.append(shapes)
+        try:
+            descriptors = encoder.compute_face_descriptor(list(rgb_images), batch_faces, jitters)
+        except TypeError as e:
+            # pybind11 found no overload taking lists; anything else is a real encoding error
+            if "incompatible function arguments" not in str(e):
+                raise
+            _batch_descriptors = False
+            descriptors = None
+    if descriptors is None:
+        return encode_faces_batch(rgb_images, locations_per_image, landmarks, jitters)
+    return [[np.array(descriptor) for descriptor in image_descriptors] for image_descriptors in descriptors]
+
+
+def face_distances(known_encodings, face_encodings):
+    """Euclidean distances between every face (rows) and every known encoding (columns)"""
+    known = np.asarray(known_encodings, dtype=np.float64).reshape(-1, 128)
+    faces = np.asarray(face_encodings, dtype=np.float64).reshape(-1, 128)
+    squared = (
+        np.einsum("ij,ij->i", faces, faces)[:, None]
+        + np.einsum("ij,ij->i", known, known)[None, :]
+        - 2 * faces @ known.T
+    )
+    return np.sqrt(np.maximum(squared, 0))
+
+
+def match_faces(known_encodings, face_encodings, tolerance=MATCH_TOLERANCE):
+    """Match each face against the gallery in one vectorized pass
+
+    Returns a list of (index, distance) pairs, one per face. ``index`` is the
+    first known encoding within ``tolerance`` (same rule as
+    ``face_recognition.compare_faces``) or None, and ``distance`` is the
+    distance to that encoding, or to the closest one when nothing matched.
+    """
+    if len(face_encodings) == 0:
+        return []
+    if len(known_encodings) == 0:
+        return [(None, None) for _ in face_encodings]
+
+    distances = face_distances(known_encodings, face_encodings)
+    within = distances <= tolerance
+    first = within.argmax(axis=1)
+    closest = distances.argmin(axis=1)
+
+    results = []
+    for row, matched in enumerate(within.any(axis=1)):
+        if matched:
+            results.append((int(first[row]), float(distances[row, first[row]])))
+        else:
+            results.append((None, float(distances[row, closest[row]])))
+    return results
+
+
+def match_faces_scoped(known_encodings, face_encodings, scope, tolerance=MATCH_TOLERANCE):
+    """Match against the ``scope`` subset of the gallery first, then the full gallery
+
+    ``scope`` holds gallery indices (e.g. a class roster). Only faces that match
+    nobody in the scope are compared with the whole gallery. Returned indices
+    always refer to the full gallery.
+    """
+    if scope is None:
+        return match_faces(known_encodings, face_encodings, tolerance)
+
+    scope = np.asarray(scope, dtype=np.intp)
+    known = np.asarray(known_encodings, dtype=np.float64).reshape(-1, 128)
+    results = [(None, None)] * len(face_encodings)
+    for row, (index, distance) in enumerate(match_faces(known[scope], face_encodings, tolerance)):
+        results[row] = (int(scope[index]), distance) if index is not None else (None, distance)
+
+    # Fallback: the full gallery for faces outside the roster
+    unmatched = [row for row, (index, _) in enumerate(results) if index is None]
+    if unmatched and len(scope) < len(known):
+        fallback = match_faces(known, [face_encodings[row] for row in unmatched], tolerance)
+        for row, result in zip(unmatched, fallback):
+            results[row] = result
+    return results
+
@@ -0,0 +1,325 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import urllib.parse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import click
+import cv2
+import numpy as np
+
+from detectors import get_detector
+from recognition import (FRAME_SCALE, MATCH_TOLERANCE, prepare_frame, scale_box, detect_faces,
+                         encode_faces_batch, match_faces)
+from gallery import gallery_version, matchable_students, parse_version
+from sync import add_encoding_version_column
+
+MAX_BODY_BYTES = 8 * 1024 * 1024
+LATENCY_WINDOW = 1000
+# HOG detection runs on one core per image, so images are decoded and detected on a process per core
+DETECTION_WORKERS = os.cpu_count() or 1
+
+
+def _prepare_image(image_bytes, mode, detector):
+    """Decode a JPEG and find the faces to encode: (rgb image or None, boxes, scale of the boxes)
+
+    Runs on the detection process pool. ``mode="crop"`` takes the whole image as one face.
+    """
+    frame = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        return None, [], 1
+    if mode == "crop":
+        rgb = prepare_frame(frame, 1)
+        height, width = rgb.shape[:2]
+        return rgb, [(0, width, height, 0)], 1
+    rgb = prepare_frame(frame, FRAME_SCALE)
+    return rgb, detect_faces(rgb, get_detector(detector)), FRAME_SCALE
+
+
+class _Request:
+    """A decoded and detected image waiting for its encoding batch"""
+
+    def __init__(self, rgb, boxes, scale, future, received):
+        self.rgb = rgb
+        self.boxes = boxes
+        self.scale = scale
+        self.future = future
+        self.received = received
+        self.enqueued = time.perf_counter()
+
+
+class RecognitionService:
+    """Headless HTTP recognition service that micro-batches concurrent requests
+
+    ``POST /recognize?mode=frame`` takes a JPEG camera frame, detects faces and
+    matches them; ``mode=crop`` treats the whole JPEG as one aligned face crop.
+    Each image is decoded and detected on its own as soon as it arrives, on
+    a pool of ``detection_workers`` processes (0 detects in the event loop).
+    Images detected within ``max_wait_ms`` of each other then share one
+    encoding call and one gallery match. When ``queue_size`` requests are
+    already in flight, new ones are rejected with 503 instead of growing
+    latency.
+    """
+
+    def __init__(self, db_path, max_batch=16, max_wait_ms=10, queue_size=64,
+                 tolerance=MATCH_TOLERANCE, detection_workers=DETECTION_WORKERS):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue_size = queue_size
+        self.tolerance = tolerance
+        self.queue = None
+        self.preparing = 0
+
+        self.detection_pool = ProcessPoolExecutor(detection_workers) if detection_workers else None
+        # Encoding gains from batching, not from threads: one batch is one descriptor call on one thread
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recognition")
+        self.reload_gallery()
+
+        self.stats = {"requests": 0, "rejected": 0, "errors": 0, "batches": 0, "batched_requests": 0}
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def reload_gallery(self):
+        """Load the students encoded with the gallery version and the settings probes are encoded with
+
+        Students still encoded with another version are left out, as on the
+        kiosks, rather than compared with differently encoded probes.
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            add_encoding_version_column(conn)
+            conn.commit()
+            self.version = gallery_version(conn)
+            rows, self.stale = matchable_students(conn, self.version)
+        finally:
+            conn.close()
+        self.student_ids = [row[0] for row in rows]
+        self.names = [row[1] for row in rows]
+        self.encodings = np.array([np.frombuffer(row[3], dtype=np.float64) for row in rows]).reshape(-1, 128)
+        # Probes are detected and encoded with the same settings as the gallery
+        self.landmarks, self.jitters, self.detector = parse_version(self.version)
+
+    async def recognize(self, image_bytes, mode="frame"):
+        """Decode and detect one image, then wait for its share of the next encoding batch"""
+        if self.queue.qsize() + self.preparing >= self.queue_size:
+            self.stats["rejected"] += 1
+            raise OverflowError("Recognition queue is full")
+        self.stats["requests"] += 1
+        received = time.perf_counter()
+        loop = asyncio.get_running_loop()
+
+        self.preparing += 1
+        try:
+            if self.detection_pool is None:
+                prepared = _prepare_image(image_bytes, mode, self.detector)
+            else:
+                prepared = await loop.run_in_executor(self.detection_pool, _prepare_image, image_bytes, mode,
+                                                      self.detector)
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            self.preparing -= 1
+
+        request = _Request(*prepared, loop.create_future(), received)
+        self.queue.put_nowait(request)
+        return await request.future
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            started = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self.executor, self._run_batch, batch)
+            except Exception as e:
+                self.stats["errors"] += len(batch)
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                continue
+
+            finished = time.perf_counter()
+            self.stats["batches"] += 1
+            self.stats["batched_requests"] += len(batch)
+            for request, result in zip(batch, results):
+                result["latency_ms"] = {
+                    "detect": round((request.enqueued - request.received) * 1000, 2),
+                    "queue": round((started - request.enqueued) * 1000, 2),
+                    "process": round((finished - started) * 1000, 2),
+                    "total": round((finished - request.received) * 1000, 2),
+                    "batch_size": len(batch),
+                }
+                self.latencies.append(finished - request.received)
+                if not request.future.done():
+                    request.future.set_result(result)
+
+    def _run_batch(self, batch):
+        """Encode and match a whole batch of detected images (runs on the worker thread)"""
+        results = [{"faces": []} if request.rgb is not None else {"error": "Could not decode image", "faces": []}
+                   for request in batch]
+        images = [request.rgb for request in batch]
+        locations = [request.boxes for request in batch]
+        scales = [request.scale for request in batch]
+
+        # One shared encoding call for every face in the batch
+        valid = [i for i, image in enumerate(images) if image is not None]
+        encodings_per_image = encode_faces_batch([images[i] for i in valid], [locations[i] for i in valid],
+                                                 self.landmarks, self.jitters)
+        encodings = {i: image_encodings for i, image_encodings in zip(valid, encodings_per_image)}
+
+        # ...and one gallery match for every encoding
+        flat = [encoding for i in valid for encoding in encodings[i]]
+        matches = match_faces(self.encodings, flat, self.tolerance)
+
+        position = 0
+        for i in valid:
+            for box in locations[i]:
+                index, distance = matches[position]
+                position += 1
+                results[i]["faces"].append({
+                    "box": scale_box(box, scales[i]),
+                    "student_id": self.student_ids[index] if index is not None else None,
+                    "name": self.names[index] if index is not None else "Unknown",
+                    "distance": distance,
+                })
+        return results
+
+    def snapshot_stats(self):
+        latencies = sorted(self.latencies)
+        stats = dict(self.stats)
+        stats["queue_depth"] = self.queue.qsize() if self.queue else 0
+        stats["gallery_size"] = len(self.student_ids)
+        stats["gallery_version"] = self.version
+        stats["stale_encodings"] = self.stale
+        stats["mean_batch_size"] = (stats["batched_requests"] / stats["batches"]) if stats["batches"] else 0
+        if latencies:
+            stats["latency_ms"] = {
+                "p50": round(latencies[len(latencies) // 2] * 1000, 2),
+                "p95": round(latencies[int(len(latencies) * 0.95)] * 1000, 2),
+                "max": round(latencies[-1] * 1000, 2),
+            }
+        return stats
+
+    async def _route(self, method, target, body):
+        url = urllib.parse.urlparse(target)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        if method == "POST" and url.path == "/recognize":
+            mode = params.get("mode", "frame")
+            if mode not in ("frame", "crop"):
+                return 400, {"error": f"Unknown mode {mode}"}
+            try:
+                return 200, await self.recognize(body, mode)
+            except OverflowError as e:
+                return 503, {"error": str(e)}
+        if method == "POST" and url.path == "/reload":
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.reload_gallery)
+            return 200, {"gallery_size": len(self.student_ids), "stale_encodings": self.stale}
+        if method == "GET" and url.path == "/stats":
+            return 200, self.snapshot_stats()
+        return 404, {"error": "not found"}
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode("latin-1").split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_BYTES:
+                    await self._write_response(writer, 413, {"error": "Image too large"}, close=True)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                try:
+                    status, payload = await self._route(method, target, body)
+                except Exception as e:
+                    status, payload = 500, {"error": str(e)}
+                close = headers.get("connection", "").lower() == "close"
+                await self._write_response(writer, status, payload, close)
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _write_response(self, writer, status, payload, close=False):
+        reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+                   500: "Internal Server Error", 503: "Service Unavailable"}
+        data = json.dumps(payload).encode()
+        head = [f"HTTP/1.1 {status} {reasons.get(status, '')}",
+                "Content-Type: application/json",
+                f"Content-Length: {len(data)}",
+                f"Connection: {'close' if close else 'keep-alive'}"]
+        if status == 503:
+            head.append("Retry-After: 1")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+        await writer.drain()
+
+    async def serve(self, host="127.0.0.1", port=8080):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        batcher = asyncio.create_task(self._batch_loop())
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self.executor.shutdown(wait=False)
+            if self.detection_pool is not None:
+                self.detection_pool.shutdown(wait=False, cancel_futures=True)
+
+
+@click.command()
+@click.option("--db", "db_path", default="attendance.db", show_default=True, help="Database with the student gallery")
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8080, show_default=True)
+@click.option("--max-batch", default=16, show_default=True, help="Most requests encoded together")
+@click.option("--max-wait-ms", default=10, show_default=True, help="How long a batch waits to fill")
+@click.option("--queue-size", default=64, show_default=True, help="Pending requests before returning 503")
+@click.option("--tolerance", default=MATCH_TOLERANCE, show_default=True)
+@click.option("--detection-workers", default=DETECTION_WORKERS, show_default=True,
+              help="Processes that decode and detect faces (0 detects in the event loop)")
+def main(db_path, host, port, max_batch, max_wait_ms, queue_size, tolerance, detection_workers):
+    """Run the local recognition service"""
+    service = RecognitionService(db_path, max_batch, max_wait_ms, queue_size, tolerance, detection_workers)
+    click.echo(f"Recognition service on http://{host}:{port} ({len(service.student_ids)} faces loaded, "
+               f"encoded as {service.version})")
+    if service.stale:
+        click.echo(f"{service.stale} students are encoded with another version and will not be recognized; "
+                   "re-register them")
+    try:
+        asyncio.run(service.serve(host, port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
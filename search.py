@@ -0,0 +1,232 @@
+import re
+import sqlite3
+import tkinter as tk
+
+SEARCH_LIMIT = 20
+SEARCH_DELAY_MS = 200
+# Shorter queries match too many students for ranking to be worth it
+RANK_MIN_LENGTH = 3
+# Characters of an ID typed before the login screen suggests IDs, so it cannot be used to list students
+ID_SUGGEST_MIN_LENGTH = 3
+
+
+def fts5_available(conn):
+    try:
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def create_search_index(conn):
+    """Index students by ID, name and course for prefix search
+
+    Uses an FTS5 table kept in sync by triggers (so rows written by the sync
+    are indexed too); without FTS5, falls back to NOCASE indexes for LIKE
+    prefix queries.
+    """
+    if fts5_available(conn):
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'students_fts'").fetchone()
+        conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS students_fts USING fts5(
+            student_id, name, course,
+            content='students', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+        )
+        ''')
+        conn.executescript('''
+        CREATE TRIGGER IF NOT EXISTS students_fts_insert AFTER INSERT ON students BEGIN
+            INSERT INTO students_fts (rowid, student_id, name, course)
+            VALUES (new.id, new.student_id, new.name, new.course);
+        END;
+        CREATE TRIGGER IF NOT EXISTS students_fts_delete AFTER DELETE ON students BEGIN
+            INSERT INTO students_fts (students_fts, rowid, student_id, name, course)
+            VALUES ('delete', old.id, old.student_id, old.name, old.course);
+        END;
+        CREATE TRIGGER IF NOT EXISTS students_fts_update AFTER UPDATE OF student_id, name, course ON students BEGIN
+            INSERT INTO students_fts (students_fts, rowid, student_id, name, course)
+            VALUES ('delete', old.id, old.student_id, old.name, old.course);
+            INSERT INTO students_fts (rowid, student_id, name, course)
+            VALUES (new.id, new.student_id, new.name, new.course);
+        END;
+        ''')
+        if not exists:
+            # Index the students registered before search existed
+            conn.execute("INSERT INTO students_fts (students_fts) VALUES ('rebuild')")
+    else:
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_students_name_nocase ON students (name COLLATE NOCASE)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_students_course_nocase ON students (course COLLATE NOCASE)")
+    conn.commit()
+
+
+def _fts_query(text):
+    """Turn typed text into an FTS5 query where every word is a prefix"""
+    words = re.findall(r"\w+", text)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search_students(conn, text, limit=SEARCH_LIMIT):
+    """Return up to ``limit`` (student_id, name, course) rows matching the typed prefix(es)
+
+    An exact student ID match always comes first.
+    """
+    text = text.strip()
+    if not text:
+        return []
+
+    results = conn.execute("SELECT student_id, name, course FROM students WHERE student_id = ?",
+                           (text,)).fetchall()
+
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'students_fts'").fetchone():
+        query = _fts_query(text)
+        if not query:
+            return results
+        order = "ORDER BY rank" if len(text) >= RANK_MIN_LENGTH else ""
+        rows = conn.execute(f'''
+        SELECT s.student_id, s.name, s.course
+        FROM students_fts f JOIN students s ON s.id = f.rowid
+        WHERE students_fts MATCH ?
+        {order}
+        LIMIT ?
+        ''', (query, limit + 1)).fetchall()
+    else:
+        pattern = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        rows = conn.execute('''
+        SELECT student_id, name, course FROM students WHERE student_id GLOB ?
+        UNION
+        SELECT student_id, name, course FROM students WHERE name LIKE ? ESCAPE '\\'
+        UNION
+        SELECT student_id, name, course FROM students WHERE course LIKE ? ESCAPE '\\'
+        LIMIT ?
+        ''', (re.sub(r"([*?\[])", r"[\1]", text) + "*", pattern, pattern, limit + 1)).fetchall()
+
+    results += [row for row in rows if not results or row[0] != results[0][0]]
+    return results[:limit]
+
+
+def search_student_ids(conn, prefix, limit=SEARCH_LIMIT):
+    """Return up to ``limit`` (student_id,) rows whose ID starts with ``prefix``, in ID order"""
+    prefix = prefix.strip()
+    if not prefix:
+        return []
+    return conn.execute("SELECT student_id FROM students WHERE student_id GLOB ? ORDER BY student_id LIMIT ?",
+                        (re.sub(r"([*?\[])", r"[\1]", prefix) + "*", limit)).fetchall()
+
+
+def describe_student(row):
+    student_id, name, course = row
+    return f"{student_id}  {name}  ({course})"
+
+
+class StudentSearchEntry(tk.Frame):
+    """Entry that suggests students as the user types
+
+    ``search(text, on_results)`` must deliver the matching rows to
+    ``on_results`` later on the Tk thread (e.g. through the query worker);
+    ``on_select(student_id)`` is called when a suggestion is chosen. Typing
+    is debounced so only the text the user paused on is searched; Return
+    before the suggestions caught up searches at once and then chooses the
+    top match for the text as typed. With ``choose_top_match=False``, Return
+    passes the typed text itself to ``on_select`` instead. Nothing is
+    suggested until ``min_length`` characters are typed, and ``describe``
+    turns a result row into its line in the list.
+    """
+
+    def __init__(self, parent, search, on_select, font=("Arial", 14), width=30,
+                 rows=8, delay_ms=SEARCH_DELAY_MS, min_length=1, choose_top_match=True,
+                 describe=describe_student, **options):
+        super().__init__(parent, **options)
+        self.search = search
+        self.on_select = on_select
+        self.delay_ms = delay_ms
+        self.min_length = min_length
+        self.choose_top_match = choose_top_match
+        self.describe = describe
+        self.pending = None
+        self.results = []
+        self.shown_text = None
+        self.choose_when_shown = False
+
+        self.text = tk.StringVar()
+        self.entry = tk.Entry(self, textvariable=self.text, font=font, width=width)
+        self.entry.pack(fill="x")
+        self.listbox = tk.Listbox(self, font=(font[0], max(font[1] - 2, 8)), height=rows, width=width)
+        self.status = tk.Label(self, font=(font[0], 9), fg="#666666", bg=options.get("bg", "#f0f0f0"))
+
+        self.text.trace_add("write", lambda *args: self._schedule())
+        self.entry.bind("<Down>", self._focus_list)
+        self.entry.bind("<Return>", lambda event: self._submit())
+        self.listbox.bind("<Return>", lambda event: self._choose_selected())
+        self.listbox.bind("<Double-Button-1>", lambda event: self._choose_selected())
+
+    def get(self):
+        return self.text.get().strip()
+
+    def focus_set(self):
+        self.entry.focus_set()
+
+    def _schedule(self):
+        self.choose_when_shown = False
+        if self.pending is not None:
+            self.after_cancel(self.pending)
+        self.pending = self.after(self.delay_ms, self._run_search)
+
+    def _submit(self):
+        if not self.choose_top_match:
+            self.on_select(self.get())
+            return
+        if self.shown_text == self.get():
+            self._choose(0)
+            return
+        # The suggestions on screen are for older text: search now and choose when they arrive
+        if self.pending is not None:
+            self.after_cancel(self.pending)
+        self.choose_when_shown = True
+        self._run_search()
+
+    def _run_search(self):
+        self.pending = None
+        text = self.get()
+        if len(text) < self.min_length:
+            self._show([], text)
+            return
+        self.search(text, lambda rows: self._show(rows, text))
+
+    def _show(self, rows, text):
+        if not self.winfo_exists() or text != self.get():
+            return  # The user kept typing; a newer search is on its way
+        self.results = rows
+        self.shown_text = text
+        self.listbox.delete(0, tk.END)
+        for row in rows:
+            self.listbox.insert(tk.END, self.describe(row))
+
+        if rows:
+            self.listbox.pack(fill="x")
+            self.status.config(text=f"First {len(rows)} matches" if len(rows) >= SEARCH_LIMIT
+                               else f"{len(rows)} match{'es' if len(rows) != 1 else ''}")
+        else:
+            self.listbox.pack_forget()
+            self.status.config(text="No matching students" if len(text) >= self.min_length else "")
+        self.status.pack(fill="x")
+
+        if self.choose_when_shown:
+            self.choose_when_shown = False
+            self._choose(0)
+
+    def _focus_list(self, event):
+        if self.results:
+            self.listbox.focus_set()
+            self.listbox.selection_clear(0, tk.END)
+            self.listbox.selection_set(0)
+            self.listbox.activate(0)
+
+    def _choose_selected(self):
+        selection = self.listbox.curselection()
+        if selection:
+            self._choose(selection[0])
+
+    def _choose(self, index):
+        if index < len(self.results):
+            self.on_select(self.results[index][0])
@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta
+
+SESSION_COLUMNS = ("id", "course", "room", "date", "start_time", "end_time", "closed_at")
+
+
+def create_session_table(conn):
+    """Create the class session table and the roster index on students.course"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS class_sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        course TEXT NOT NULL,
+        room TEXT,
+        date TEXT NOT NULL,
+        start_time TEXT NOT NULL,
+        end_time TEXT NOT NULL,
+        closed_at TEXT
+    )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_class_sessions_open ON class_sessions (closed_at, date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_students_course ON students (course)")
+    conn.commit()
+
+
+def _as_dict(row):
+    return dict(zip(SESSION_COLUMNS, row)) if row else None
+
+
+def start_session(conn, course, room, minutes, now=None):
+    """Open a session for ``course`` in ``room`` lasting ``minutes`` from now"""
+    now = now or datetime.now()
+    end = now + timedelta(minutes=minutes)
+    if end.date() != now.date():
+        end = now.replace(hour=23, minute=59, second=59)
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT INTO class_sessions (course, room, date, start_time, end_time) VALUES (?, ?, ?, ?, ?)",
+        (course, room or None, now.strftime("%Y-%m-%d"), now.strftime("%H:%M:%S"), end.strftime("%H:%M:%S"))
+    )
+    conn.commit()
+    return get_session(conn, cursor.lastrowid)
+
+
+def get_session(conn, session_id):
+    row = conn.execute(f"SELECT {', '.join(SESSION_COLUMNS)} FROM class_sessions WHERE id = ?",
+                       (session_id,)).fetchone()
+    return _as_dict(row)
+
+
+def open_sessions(conn):
+    """Every session that has not been closed yet, newest first"""
+    rows = conn.execute(f'''
+    SELECT {', '.join(SESSION_COLUMNS)} FROM class_sessions
+    WHERE closed_at IS NULL
+    ORDER BY date DESC, start_time DESC
+    ''').fetchall()
+    return [_as_dict(row) for row in rows]
+
+
+def active_session(conn, room=None, now=None):
+    """The open session whose time window contains ``now``
+
+    With a ``room``, sessions in that room and sessions without a room qualify.
+    """
+    now = now or datetime.now()
+    query = f'''
+    SELECT {', '.join(SESSION_COLUMNS)} FROM class_sessions
+    WHERE closed_at IS NULL AND date = ? AND start_time <= ? AND end_time >= ?
+    '''
+    params = [now.strftime("%Y-%m-%d"), now.strftime("%H:%M:%S"), now.strftime("%H:%M:%S")]
+    if room:
+        query += " AND (room = ? OR room IS NULL)"
+        params.append(room)
+    query += " ORDER BY start_time DESC LIMIT 1"
+    return _as_dict(conn.execute(query, params).fetchone())
+
+
+def roster_size(conn, course):
+    return conn.execute("SELECT COUNT(*) FROM students WHERE course = ?", (course,)).fetchone()[0]
+
+
+def close_session(conn, session_id, now=None):
+    """Close a session and mark the rest of its roster absent in one statement
+
+    Returns the number of "Absent" rows inserted.
+    """
+    session = get_session(conn, session_id)
+    if session is None:
+        raise ValueError(f"Class session {session_id} not found")
+    if session["closed_at"]:
+        return 0
+
+    now = now or datetime.now()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute('''
+        INSERT INTO attendance (student_id, date, time, status)
+        SELECT s.student_id, ?, ?, 'Absent'
+        FROM students s
+        WHERE s.course = ?
+          AND NOT EXISTS (
+              SELECT 1 FROM attendance a WHERE a.student_id = s.student_id AND a.date = ?
+          )
+        ''', (session["date"], session["end_time"], session["course"], session["date"]))
+        absent = cursor.rowcount
+        cursor.execute("UPDATE class_sessions SET closed_at = ? WHERE id = ?",
+                       (now.strftime("%Y-%m-%d %H:%M:%S"), session_id))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return absent
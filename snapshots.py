@@ -0,0 +1,267 @@
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import click
+import cv2
+
+SNAPSHOT_DIR = os.environ.get("ATTENDANCE_SNAPSHOT_DIR", "snapshots")
+SNAPSHOT_QUEUE_SIZE = 64
+# Disk budget and age limit for snapshots; the oldest files are pruned first
+SNAPSHOT_MAX_BYTES = int(os.environ.get("ATTENDANCE_SNAPSHOT_MAX_MB", "500")) * 1024 * 1024
+SNAPSHOT_RETENTION_DAYS = int(os.environ.get("ATTENDANCE_SNAPSHOT_RETENTION_DAYS", "90"))
+PRUNE_INTERVAL_SECONDS = 3600
+SNAPSHOT_MARGIN = 0.3
+SNAPSHOT_JPEG_QUALITY = 80
+
+
+def create_snapshot_columns(conn):
+    """Add the audit columns linking an attendance row to its snapshot and match distance"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(attendance)")}
+    if "snapshot_hash" not in columns:
+        conn.execute("ALTER TABLE attendance ADD COLUMN snapshot_hash TEXT")
+    if "match_distance" not in columns:
+        conn.execute("ALTER TABLE attendance ADD COLUMN match_distance REAL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_snapshot ON attendance (snapshot_hash)")
+    conn.commit()
+
+
+def crop_snapshot(frame, box, margin=SNAPSHOT_MARGIN):
+    """Copy the face at (top, right, bottom, left) out of ``frame`` with some context
+
+    The copy is cheap and keeps the snapshot free of boxes drawn on the frame later.
+    """
+    top, right, bottom, left = box
+    height, width = frame.shape[:2]
+    pad_y, pad_x = int((bottom - top) * margin), int((right - left) * margin)
+    return frame[max(top - pad_y, 0):min(bottom + pad_y, height),
+                 max(left - pad_x, 0):min(right + pad_x, width)].copy()
+
+
+def snapshot_path(snapshot_hash, directory=SNAPSHOT_DIR):
+    return os.path.join(directory, snapshot_hash[:2], snapshot_hash + ".jpg")
+
+
+class SnapshotWriter:
+    """Writes audit snapshots of attendance marks on a background thread
+
+    ``submit`` never blocks the camera loop: when the bounded queue is full
+    the snapshot is dropped and counted. Files are stored by the SHA-256 of
+    their JPEG bytes and linked from attendance.snapshot_hash. Snapshots
+    older than ``retention_days`` or beyond ``max_bytes`` (oldest first)
+    are pruned in the background and their links cleared, in archived
+    terms as well as in the live table.
+    """
+
+    def __init__(self, db_path, directory=SNAPSHOT_DIR, queue_size=SNAPSHOT_QUEUE_SIZE,
+                 max_bytes=SNAPSHOT_MAX_BYTES, retention_days=SNAPSHOT_RETENTION_DAYS,
+                 prune_interval=PRUNE_INTERVAL_SECONDS):
+        self.db_path = db_path
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.retention_days = retention_days
+        self.prune_interval = prune_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.conn = None
+        self.next_prune = 0.0
+
+        self.written = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.errors = 0
+        self.pruned = 0
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True, name="snapshot-writer")
+        self.thread.start()
+        return self
+
+    def submit(self, attendance_id, face_crop):
+        """Queue a BGR face crop for the attendance row; returns False if it was dropped"""
+        try:
+            self.queue.put_nowait((attendance_id, face_crop))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=min(max(self.next_prune - time.monotonic(), 0.1), 60))
+            except queue.Empty:
+                item = False
+            if item is None:
+                break
+
+            try:
+                if item:
+                    self._write(*item)
+                if time.monotonic() >= self.next_prune:
+                    self.prune()
+                    self.next_prune = time.monotonic() + self.prune_interval
+            except Exception as e:
+                self.errors += 1
+                print(f"Snapshot writer error: {str(e)}")
+                if self.conn is not None and self.conn.in_transaction:
+                    self.conn.rollback()
+
+        if self.conn is not None:
+            self.conn.close()
+
+    def _write(self, attendance_id, face_crop):
+        ok, jpeg = cv2.imencode(".jpg", face_crop, [cv2.IMWRITE_JPEG_QUALITY, SNAPSHOT_JPEG_QUALITY])
+        if not ok:
+            raise ValueError("Could not encode snapshot")
+        data = jpeg.tobytes()
+        snapshot_hash = hashlib.sha256(data).hexdigest()
+
+        path = snapshot_path(snapshot_hash, self.directory)
+        if os.path.exists(path):
+            # Same image already stored; refresh it so retention counts from the newest mark
+            os.utime(path)
+            self.duplicates += 1
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+            self.written += 1
+
+        self._link("UPDATE attendance SET snapshot_hash = ? WHERE id = ?",
+                   [(snapshot_hash, attendance_id)])
+
+    def _link(self, sql, params):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_path, timeout=30)
+        # Audit links are local; keep them out of the sync change log
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES ('suppress_log', 1)")
+        self.conn.executemany(sql, params)
+        self.conn.execute("DELETE FROM sync_state WHERE key = 'suppress_log'")
+        self.conn.commit()
+
+    def _files(self):
+        files = []
+        if not os.path.isdir(self.directory):
+            return files
+        for folder in os.scandir(self.directory):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                if entry.name.endswith(".jpg"):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def prune(self):
+        """Delete expired snapshots, then the oldest ones until under the size budget"""
+        files = sorted(self._files())
+        cutoff = time.time() - self.retention_days * 86400
+        total = sum(size for _, size, _ in files)
+
+        removed = []
+        for mtime, size, path in files:
+            if mtime >= cutoff and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed.append(os.path.basename(path)[:-len(".jpg")])
+
+        if removed:
+            self._link("UPDATE attendance SET snapshot_hash = NULL WHERE snapshot_hash = ?",
+                       [(snapshot_hash,) for snapshot_hash in removed])
+            self._unlink_archived(removed)
+            self.pruned += len(removed)
+        return len(removed)
+
+    def _unlink_archived(self, removed):
+        """Clear links to pruned snapshots from the archived term databases"""
+        try:
+            paths = [row[0] for row in
+                     self.conn.execute("SELECT archive_path FROM terms WHERE archive_path IS NOT NULL")]
+        except sqlite3.OperationalError:
+            return  # No term was ever archived
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            archive = sqlite3.connect(path, timeout=30)
+            try:
+                archive.executemany("UPDATE attendance SET snapshot_hash = NULL WHERE snapshot_hash = ?",
+                                    [(snapshot_hash,) for snapshot_hash in removed])
+                archive.commit()
+            except sqlite3.OperationalError:
+                pass  # Archived before marks had snapshots; nothing links to them
+            finally:
+                archive.close()
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "written": self.written,
+            "duplicates": self.duplicates,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "pruned": self.pruned,
+        }
+
+    def close(self, timeout=5):
+        """Flush queued snapshots (up to ``timeout`` seconds) and stop the writer"""
+        if self.thread is None:
+            if self.conn is not None:
+                self.conn.close()
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self.thread.join(timeout)
+
+
+@click.group()
+def cli():
+    """Inspect and prune attendance audit snapshots"""
+
+
+@cli.command()
+@click.option("--db", "db_path", default="attendance.db", show_default=True)
+@click.option("--dir", "directory", default=SNAPSHOT_DIR, show_default=True)
+@click.argument("student_id")
+@click.argument("date", required=False)
+def show(db_path, directory, student_id, date):
+    """List a student's marks with their match distance and snapshot file"""
+    conn = sqlite3.connect(db_path)
+    query = "SELECT date, time, status, match_distance, snapshot_hash FROM attendance WHERE student_id = ?"
+    params = [student_id]
+    if date:
+        query += " AND date = ?"
+        params.append(date)
+    for row_date, row_time, status, distance, snapshot_hash in conn.execute(query + " ORDER BY date, time", params):
+        distance_text = f"{distance:.3f}" if distance is not None else "-"
+        path = snapshot_path(snapshot_hash, directory) if snapshot_hash else "no snapshot"
+        click.echo(f"{row_date} {row_time} {status:<7} distance {distance_text:<6} {path}")
+    conn.close()
+
+
+@cli.command()
+@click.option("--db", "db_path", default="attendance.db", show_default=True)
+@click.option("--dir", "directory", default=SNAPSHOT_DIR, show_default=True)
+@click.option("--max-mb", default=SNAPSHOT_MAX_BYTES // (1024 * 1024), show_default=True)
+@click.option("--retention-days", default=SNAPSHOT_RETENTION_DAYS, show_default=True)
+def prune(db_path, directory, max_mb, retention_days):
+    """Apply the retention and size limits now"""
+    writer = SnapshotWriter(db_path, directory, max_bytes=max_mb * 1024 * 1024, retention_days=retention_days)
+    click.echo(f"Pruned {writer.prune()} snapshots")
+    writer.close()
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,504 @@
+import hmac
+import json
+import os
+import socket
+import sqlite3
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import click
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_PORT = 8765
+# Bump when the capture triggers change so existing databases get them recreated
+TRIGGER_VERSION = 4
+# Shared secret kiosks present to the central node as "Authorization: Bearer <token>"
+SYNC_TOKEN = os.environ.get("ATTENDANCE_SYNC_TOKEN")
+
+
+def default_node_id():
+    """Return the identifier this node writes into the change log"""
+    return os.environ.get("ATTENDANCE_NODE_ID") or socket.gethostname()
+
+
+def install_change_log(conn, node_id=None):
+    """Create the change log, sync state and capture triggers if missing"""
+    cursor = conn.cursor()
+
+    # Append-only log of every row change on the replicated tables
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS change_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        origin TEXT NOT NULL,
+        table_name TEXT NOT NULL,
+        op TEXT NOT NULL,
+        row_key TEXT NOT NULL,
+        payload TEXT,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_change_log_origin ON change_log (origin, seq)")
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS change_log_no_update BEFORE UPDATE ON change_log
+    BEGIN
+        SELECT RAISE(ABORT, 'change_log is append-only');
+    END
+    ''')
+
+    # Key/value state: node id, sync cursors and the origin of changes being applied
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS sync_state (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO sync_state (key, value) VALUES ('node_id', ?)",
+                   (node_id or default_node_id(),))
+
+    # Highest sequence number acknowledged per remote origin (used by the central node)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS sync_peers (
+        origin TEXT PRIMARY KEY,
+        acked_seq INTEGER NOT NULL DEFAULT 0,
+        last_seen TEXT
+    )
+    ''')
+
+    add_encoding_version_column(conn)
+
+    if get_state(conn, "trigger_version") != str(TRIGGER_VERSION):
+        for table in ("attendance", "students"):
+            for op in ("insert", "update", "delete"):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {table}_log_{op}")
+        set_state(conn, "trigger_version", TRIGGER_VERSION)
+
+    # Rows applied from another node are logged under that node's origin so they
+    # are never pushed back to where they came from. Local maintenance such as
+    # archiving sets 'suppress_log' so moving rows out is not replicated.
+    # Updates also record the row's previous key as 'old_key', so readers
+    # (e.g. the query cache) can tell which student/date a row moved away from.
+    origin_expr = ("COALESCE((SELECT value FROM sync_state WHERE key = 'apply_origin'), "
+                   "(SELECT value FROM sync_state WHERE key = 'node_id'))")
+    payloads = {
+        "attendance": ("{row}.student_id || '|' || {row}.date",
+                       "json_object('student_id', {row}.student_id, 'date', {row}.date, "
+                       "'time', {row}.time, 'status', {row}.status)"),
+        "students": ("{row}.student_id",
+                     "json_object('student_id', {row}.student_id, 'name', {row}.name, "
+                     "'course', {row}.course, 'face_encoding', hex({row}.face_encoding), "
+                     "'encoding_version', {row}.encoding_version)"),
+    }
+    for table, (key_expr, payload_expr) in payloads.items():
+        for op, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            payload = "NULL" if op == "DELETE" else payload_expr.format(row=row)
+            if op == "UPDATE":
+                payload = f"json_set({payload}, '$.old_key', {key_expr.format(row='OLD')})"
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_log_{op.lower()} AFTER {op} ON {table}
+            WHEN (SELECT value FROM sync_state WHERE key = 'suppress_log') IS NULL
+            BEGIN
+                INSERT INTO change_log (origin, table_name, op, row_key, payload)
+                VALUES ({origin_expr}, '{table}', '{op}', {key_expr.format(row=row)}, {payload});
+            END
+            ''')
+
+    conn.commit()
+
+
+def add_encoding_version_column(conn):
+    """Add students.encoding_version to databases created before encodings were versioned
+
+    Replicated with each encoding so kiosks know which encoder settings produced it.
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(students)")}
+    if columns and "encoding_version" not in columns:
+        conn.execute("ALTER TABLE students ADD COLUMN encoding_version TEXT")
+
+
+def get_state(conn, key, default=None):
+    row = conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row and row[0] is not None else default
+
+
+def set_state(conn, key, value):
+    conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, str(value)))
+
+
+def read_changes(conn, since, limit, origin=None, exclude_origin=None):
+    """Return up to ``limit`` change log entries with seq greater than ``since``"""
+    query = "SELECT seq, origin, table_name, op, row_key, payload FROM change_log WHERE seq > ?"
+    params = [since]
+    if origin is not None:
+        query += " AND origin = ?"
+        params.append(origin)
+    if exclude_origin is not None:
+        query += " AND origin != ?"
+        params.append(exclude_origin)
+    query += " ORDER BY seq LIMIT ?"
+    params.append(limit)
+
+    return [
+        {"seq": seq, "origin": row_origin, "table": table, "op": op, "key": key,
+         "payload": json.loads(payload) if payload else None}
+        for seq, row_origin, table, op, key, payload in conn.execute(query, params)
+    ]
+
+
+def _apply_attendance(cursor, change, stats):
+    student_id, date_str = change["key"].split("|", 1)
+    if change["op"] == "DELETE":
+        cursor.execute("DELETE FROM attendance WHERE student_id = ? AND date = ?", (student_id, date_str))
+        return
+
+    row = change["payload"]
+    cursor.execute("SELECT id, time, status FROM attendance WHERE student_id = ? AND date = ? ORDER BY time",
+                   (student_id, date_str))
+    existing = cursor.fetchall()
+    if not existing:
+        cursor.execute("INSERT INTO attendance (student_id, date, time, status) VALUES (?, ?, ?, ?)",
+                       (student_id, date_str, row["time"], row["status"]))
+        return
+
+    # Duplicate per-day mark: a "Present" beats an "Absent", otherwise the earliest time wins
+    stats["conflicts"] += 1
+    keep_id, keep_time, keep_status = existing[0]
+    incoming_wins = (
+        (row["status"] == "Present" and keep_status != "Present")
+        or (row["status"] == keep_status and row["time"] < keep_time)
+    )
+    if incoming_wins:
+        cursor.execute("UPDATE attendance SET time = ?, status = ? WHERE id = ?",
+                       (row["time"], row["status"], keep_id))
+
+
+def _apply_student(cursor, change, stats):
+    if change["op"] == "DELETE":
+        cursor.execute("DELETE FROM students WHERE student_id = ?", (change["key"],))
+        return
+
+    row = change["payload"]
+    encoding = bytes.fromhex(row["face_encoding"]) if row.get("face_encoding") else None
+    cursor.execute("SELECT 1 FROM students WHERE student_id = ?", (row["student_id"],))
+    if cursor.fetchone():
+        stats["conflicts"] += 1
+        cursor.execute("UPDATE students SET name = ?, course = ?, face_encoding = ?, encoding_version = ? "
+                       "WHERE student_id = ?",
+                       (row["name"], row["course"], encoding, row.get("encoding_version"), row["student_id"]))
+    else:
+        cursor.execute("INSERT INTO students (student_id, name, course, face_encoding, encoding_version) "
+                       "VALUES (?, ?, ?, ?, ?)",
+                       (row["student_id"], row["name"], row["course"], encoding, row.get("encoding_version")))
+
+
+_APPLIERS = {"attendance": _apply_attendance, "students": _apply_student}
+
+
+def _apply_batch(conn, cursor, changes):
+    stats = {"applied": 0, "conflicts": 0}
+    for change in changes:
+        if change["table"] not in _APPLIERS:
+            continue
+        set_state(conn, "apply_origin", change["origin"])
+        _APPLIERS[change["table"]](cursor, change, stats)
+        stats["applied"] += 1
+    cursor.execute("DELETE FROM sync_state WHERE key = 'apply_origin'")
+    return stats
+
+
+def apply_changes(conn, changes, cursor_key=None):
+    """Apply remote changes in one transaction, logging them under their origin"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        stats = _apply_batch(conn, cursor, changes)
+        # Advance the pull cursor in the same transaction as the data it covers
+        if cursor_key and changes:
+            set_state(conn, cursor_key, changes[-1]["seq"])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return stats
+
+
+def receive_push(conn, origin, changes):
+    """Central side of a push: apply the batch once and return the new ack"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT acked_seq FROM sync_peers WHERE origin = ?", (origin,))
+        row = cursor.fetchone()
+        acked_seq = row[0] if row else 0
+
+        # Anything at or below the ack was already applied by an earlier (retried) request
+        fresh = [change for change in changes if change["seq"] > acked_seq]
+        stats = _apply_batch(conn, cursor, fresh)
+        stats["duplicates"] = len(changes) - len(fresh)
+
+        if fresh:
+            acked_seq = max(change["seq"] for change in fresh)
+            cursor.execute('''
+            INSERT INTO sync_peers (origin, acked_seq, last_seen) VALUES (?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(origin) DO UPDATE SET acked_seq = excluded.acked_seq, last_seen = excluded.last_seen
+            ''', (origin, acked_seq))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    stats["acked_seq"] = acked_seq
+    return stats
+
+
+def create_replicated_tables(conn):
+    """Create the replicated tables on a node that has never run the kiosk UI"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS students (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id TEXT UNIQUE NOT NULL,
+        name TEXT NOT NULL,
+        course TEXT NOT NULL,
+        face_encoding BLOB,
+        encoding_version TEXT
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS attendance (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id TEXT NOT NULL,
+        date TEXT NOT NULL,
+        time TEXT NOT NULL,
+        status TEXT NOT NULL,
+        FOREIGN KEY (student_id) REFERENCES students (student_id)
+    )
+    ''')
+    conn.commit()
+
+
+class CentralServer:
+    """Minimal HTTP central node that collects kiosk change logs
+
+    Every request must carry the shared ``token`` as a bearer token; it is
+    refused with 401 otherwise. Listens on localhost unless given a host.
+    """
+
+    def __init__(self, db_path, host="127.0.0.1", port=DEFAULT_PORT, node_id="central", token=SYNC_TOKEN):
+        if not token:
+            raise ValueError("The central node needs a shared sync token (set ATTENDANCE_SYNC_TOKEN)")
+        self.db_path = db_path
+        self.node_id = node_id
+        self.token = token
+
+        conn = self.connect()
+        create_replicated_tables(conn)
+        install_change_log(conn, node_id)
+        conn.close()
+
+        server = self
+        class Handler(_SyncRequestHandler):
+            central = server
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def start(self):
+        """Serve requests on a background thread (used for local testing)"""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _SyncRequestHandler(BaseHTTPRequestHandler):
+    central = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _authorized(self):
+        scheme, _, token = self.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and hmac.compare_digest(token.encode(), self.central.token.encode()):
+            return True
+        self._send_json(401, {"error": "missing or wrong sync token"})
+        return False
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        url = urllib.parse.urlparse(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        conn = self.central.connect()
+        try:
+            if url.path == "/sync/ack":
+                row = conn.execute("SELECT acked_seq FROM sync_peers WHERE origin = ?",
+                                   (params.get("origin"),)).fetchone()
+                self._send_json(200, {"acked_seq": row[0] if row else 0})
+            elif url.path == "/sync/pull":
+                changes = read_changes(conn, int(params.get("since", 0)),
+                                       int(params.get("limit", DEFAULT_BATCH_SIZE)),
+                                       exclude_origin=params.get("exclude"))
+                self._send_json(200, {"changes": changes})
+            else:
+                self._send_json(404, {"error": "not found"})
+        except (sqlite3.Error, ValueError) as e:
+            self._send_json(500, {"error": str(e)})
+        finally:
+            conn.close()
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        if self.path != "/sync/push":
+            self._send_json(404, {"error": "not found"})
+            return
+        conn = self.central.connect()
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            self._send_json(200, receive_push(conn, body["origin"], body["changes"]))
+        except (sqlite3.Error, ValueError, KeyError) as e:
+            self._send_json(500, {"error": str(e)})
+        finally:
+            conn.close()
+
+
+class SyncClient:
+    """Incremental, batched push/pull of a kiosk database against the central node"""
+
+    def __init__(self, db_path, central_url, batch_size=DEFAULT_BATCH_SIZE, timeout=10, token=SYNC_TOKEN):
+        self.db_path = db_path
+        self.central_url = central_url.rstrip("/")
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.token = token
+
+    def _request(self, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        request = urllib.request.Request(self.central_url + path, data=data, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            if e.code == 401:
+                raise PermissionError("The central node refused the sync token (set ATTENDANCE_SYNC_TOKEN)") from e
+            raise
+
+    def push(self, conn):
+        """Send local changes after the last acknowledged sequence number"""
+        node_id = get_state(conn, "node_id")
+
+        # Resume from whatever the central node last acknowledged, not our own
+        # record of it, so a lost response never causes a gap or a re-send loop
+        query = urllib.parse.urlencode({"origin": node_id})
+        acked_seq = self._request(f"/sync/ack?{query}")["acked_seq"]
+        totals = {"pushed": 0, "duplicates": 0, "push_conflicts": 0}
+
+        while True:
+            changes = read_changes(conn, acked_seq, self.batch_size, origin=node_id)
+            if not changes:
+                break
+            result = self._request("/sync/push", {"origin": node_id, "changes": changes})
+            if result["acked_seq"] <= acked_seq:
+                raise RuntimeError(f"Central node did not advance past sequence {acked_seq}")
+            acked_seq = result["acked_seq"]
+            totals["pushed"] += result["applied"]
+            totals["duplicates"] += result["duplicates"]
+            totals["push_conflicts"] += result["conflicts"]
+
+        set_state(conn, "last_pushed_seq", acked_seq)
+        conn.commit()
+        return totals
+
+    def pull(self, conn):
+        """Apply changes other nodes sent to the central node"""
+        node_id = get_state(conn, "node_id")
+        since = int(get_state(conn, "last_pulled_seq", 0))
+        totals = {"pulled": 0, "pull_conflicts": 0}
+
+        while True:
+            query = urllib.parse.urlencode({"since": since, "exclude": node_id, "limit": self.batch_size})
+            changes = self._request(f"/sync/pull?{query}")["changes"]
+            if not changes:
+                break
+            stats = apply_changes(conn, changes, cursor_key="last_pulled_seq")
+            since = changes[-1]["seq"]
+            totals["pulled"] += stats["applied"]
+            totals["pull_conflicts"] += stats["conflicts"]
+        return totals
+
+    def sync(self):
+        """Push then pull using a dedicated connection (safe to call from a worker thread)"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            result = self.push(conn)
+            result.update(self.pull(conn))
+            return result
+        finally:
+            conn.close()
+
+
+@click.group()
+def cli():
+    """Replicate attendance data between kiosks and a central node"""
+
+
+@cli.command()
+@click.option("--db", "db_path", default="central.db", show_default=True, help="Central database file")
+@click.option("--host", default="127.0.0.1", show_default=True, help="Use 0.0.0.0 to accept kiosks on the network")
+@click.option("--port", default=DEFAULT_PORT, show_default=True)
+@click.option("--token", default=SYNC_TOKEN, help="Shared sync token kiosks must send [default: $ATTENDANCE_SYNC_TOKEN]")
+def serve(db_path, host, port, token):
+    """Run the central sync node"""
+    if not token:
+        raise click.ClickException("Set a shared sync token with --token or ATTENDANCE_SYNC_TOKEN")
+    server = CentralServer(db_path, host, port, token=token)
+    click.echo(f"Central sync node listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+@cli.command("sync")
+@click.option("--db", "db_path", default="attendance.db", show_default=True, help="Kiosk database file")
+@click.option("--central", "central_url", required=True, help="Central node URL")
+@click.option("--batch-size", default=DEFAULT_BATCH_SIZE, show_default=True)
+@click.option("--token", default=SYNC_TOKEN, help="Shared sync token of the central node [default: $ATTENDANCE_SYNC_TOKEN]")
+def sync_once(db_path, central_url, batch_size, token):
+    """Push local changes and pull remote ones once"""
+    conn = sqlite3.connect(db_path)
+    install_change_log(conn)
+    conn.close()
+    result = SyncClient(db_path, central_url, batch_size, token=token).sync()
+    click.echo(json.dumps(result))
+
+
+if __name__ == "__main__":
+    cli()
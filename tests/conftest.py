@@ -0,0 +1,27 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sync import create_replicated_tables, install_change_log  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A kiosk database with the replicated tables and the change log installed"""
+    path = str(tmp_path / "attendance.db")
+    conn = sqlite3.connect(path)
+    create_replicated_tables(conn)
+    install_change_log(conn, "kiosk-a")
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = sqlite3.connect(db_path)
+    yield conn
+    conn.close()
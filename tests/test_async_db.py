@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+
+from async_db import AsyncQueryExecutor
+
+# Runs until interrupted
+ENDLESS_QUERY = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT count(*) FROM c"
+
+
+class FakeRoot:
+    """Collects ``after`` callbacks; ``pump`` runs them the way Tk's main loop would"""
+
+    def __init__(self):
+        self.callbacks = []
+
+    def after(self, ms, callback):
+        self.callbacks.append(callback)
+
+    def pump(self, until, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not until():
+            assert time.monotonic() < deadline, "timed out waiting for the executor"
+            callbacks, self.callbacks = self.callbacks, []
+            for callback in callbacks:
+                callback()
+            time.sleep(0.01)
+
+
+@pytest.fixture
+def executor(db_path):
+    executor = AsyncQueryExecutor(FakeRoot(), db_path, poll_ms=10)
+    yield executor
+    executor.shutdown()
+
+
+def endless(conn):
+    return conn.execute(ENDLESS_QUERY).fetchone()
+
+
+def test_superseded_query_is_interrupted_and_its_result_dropped(executor):
+    delivered, errors = [], []
+    first = executor.submit(endless, delivered.append, errors.append, key="attendance")
+    executor.root.pump(lambda: executor.current is first)
+
+    executor.submit(lambda conn: "second", delivered.append, errors.append, key="attendance")
+    executor.root.pump(lambda: delivered)
+
+    assert delivered == ["second"] and errors == []
+    assert first.cancelled and executor.latest == {}
+
+
+def test_slow_query_is_interrupted_and_reported_as_timeout(executor):
+    delivered, errors = [], []
+    executor.submit(endless, delivered.append, errors.append, timeout=0.2)
+    executor.root.pump(lambda: errors)
+
+    assert delivered == []
+    assert isinstance(errors[0], TimeoutError) and "0.2 seconds" in str(errors[0])
+    # The worker is free again afterwards
+    executor.submit(lambda conn: conn.execute("SELECT 1").fetchone()[0], delivered.append, errors.append)
+    executor.root.pump(lambda: delivered)
+    assert delivered == [1]
+
+
+def test_query_cancelled_while_queued_never_runs(executor):
+    release, ran, delivered = threading.Event(), [], []
+    executor.submit(lambda conn: release.wait(5), delivered.append)
+    queued = executor.submit(lambda conn: ran.append(True), delivered.append)
+
+    queued.cancel()
+    release.set()
+    executor.root.pump(lambda: delivered)
+    executor.submit(lambda conn: "after", delivered.append)
+    executor.root.pump(lambda: len(delivered) == 2)
+
+    assert delivered == [True, "after"] and ran == []
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+import detectors
+from detectors import DnnDetector, HaarCascadeDetector, detector_for_screen, get_detector
+
+
+@pytest.fixture(autouse=True)
+def fresh_instances(monkeypatch):
+    monkeypatch.setattr(detectors, "_instances", {})
+
+
+def test_detectors_are_shared_and_unknown_names_rejected():
+    assert get_detector("haar") is get_detector("haar")
+    assert get_detector().name == "hog"
+    with pytest.raises(ValueError, match="Unknown face detector 'mtcnn'"):
+        get_detector("mtcnn")
+
+
+def test_screens_without_a_choice_use_the_default(monkeypatch):
+    monkeypatch.setitem(detectors.SCREEN_DETECTORS, "registration", "haar")
+    assert detector_for_screen("registration").name == "haar"
+    assert detector_for_screen("attendance-kiosk").name == "hog"
+
+
+def test_dnn_detector_is_never_loaded_without_local_model_files(tmp_path, monkeypatch):
+    monkeypatch.setitem(detectors.DETECTORS, "dnn", lambda: DnnDetector(str(tmp_path)))
+    with pytest.raises(FileNotFoundError, match="deploy.prototxt"):
+        get_detector("dnn")
+    # A failed load is retried next time instead of being cached
+    assert "dnn" not in detectors._instances
+
+
+class FakeCascade:
+    def detectMultiScale(self, gray, **kwargs):
+        return [(5, 10, 20, 30)]
+
+
+class FakeNet:
+    def setInput(self, blob):
+        pass
+
+    def forward(self):
+        # (_, _, confidence, x1, y1, x2, y2) in fractions of the image
+        return np.array([[[[0, 1, 0.9, 0.1, 0.2, 0.5, 1.2],
+                           [0, 1, 0.3, 0.0, 0.0, 0.5, 0.5]]]])
+
+
+def test_detections_are_returned_as_top_right_bottom_left():
+    image = np.zeros((100, 200, 3), np.uint8)
+    haar = HaarCascadeDetector()
+    haar.cascade = FakeCascade()
+    assert haar.detect(image) == [(10, 25, 40, 5)]
+
+    dnn = DnnDetector.__new__(DnnDetector)
+    dnn.net, dnn.confidence = FakeNet(), 0.5
+    # Low-confidence detections are dropped and boxes are clipped to the image
+    assert dnn.detect(image) == [(20, 100, 100, 20)]
@@ -0,0 +1,54 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from duplicates import DUPLICATE_TOLERANCE, find_duplicates, nearest_face
+from recognition import MATCH_TOLERANCE
+
+
+def brute_force(encodings, tolerance):
+    pairs = []
+    for i, j in itertools.combinations(range(len(encodings)), 2):
+        distance = np.linalg.norm(encodings[i] - encodings[j])
+        if distance <= tolerance:
+            pairs.append((i, j, distance))
+    return sorted(pairs, key=lambda pair: pair[2])
+
+
+@pytest.mark.parametrize("block_size", [1, 5, 7, 23, 64])
+def test_blocks_find_the_same_pairs_as_brute_force(block_size):
+    rng = np.random.default_rng(0)
+    encodings = rng.normal(scale=0.09, size=(23, 128))
+    # Pairs inside one block, across neighbouring blocks and between the first and last block
+    for a, b, distance in [(1, 2, 0.2), (4, 5, 0.3), (9, 15, 0.55), (0, 22, 0.1), (6, 20, 0.62)]:
+        offset = np.zeros(128)
+        offset[0] = distance
+        encodings[b] = encodings[a] + offset
+
+    expected = brute_force(encodings, MATCH_TOLERANCE)
+    found = find_duplicates(encodings, MATCH_TOLERANCE, block_size=block_size, workers=2)
+
+    assert [(i, j) for i, j, _ in found] == [(i, j) for i, j, _ in expected]
+    assert np.allclose([d for _, _, d in found], [d for _, _, d in expected])
+    assert (6, 20) not in [(i, j) for i, j, _ in found]
+
+
+def test_default_tolerance_is_stricter_than_the_match_tolerance():
+    encodings = np.zeros((3, 128))
+    encodings[1, 0] = DUPLICATE_TOLERANCE - 0.05
+    # Close enough to be matched at the door, but not reported as the same person
+    encodings[2, 1] = MATCH_TOLERANCE - 0.05
+    assert DUPLICATE_TOLERANCE < MATCH_TOLERANCE
+    assert [(i, j) for i, j, _ in find_duplicates(encodings)] == [(0, 1)]
+    assert find_duplicates(np.empty((0, 128))) == []
+
+
+def test_nearest_face():
+    assert nearest_face([], np.zeros(128)) == (None, None)
+    known = np.zeros((3, 128))
+    known[:, 0] = [0.0, 1.0, 2.0]
+    encoding = np.zeros(128)
+    encoding[0] = 1.2
+    index, distance = nearest_face(known, encoding)
+    assert index == 1 and distance == pytest.approx(0.2)
@@ -0,0 +1,58 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from gallery import (DEFAULT_VERSION, create_gallery_tables, gallery_version, matchable_students, swap_gallery,
+                     unstaged_students)
+from sync import install_change_log
+
+NEW_VERSION = "large-j2-hog"
+
+
+def test_legacy_database_is_migrated_once(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "legacy.db"))
+    conn.execute("CREATE TABLE students (id INTEGER PRIMARY KEY AUTOINCREMENT, student_id TEXT UNIQUE NOT NULL, "
+                 "name TEXT NOT NULL, course TEXT NOT NULL, face_encoding BLOB)")
+    conn.execute("CREATE TABLE attendance (id INTEGER PRIMARY KEY AUTOINCREMENT, student_id TEXT NOT NULL, "
+                 "date TEXT NOT NULL, time TEXT NOT NULL, status TEXT NOT NULL)")
+    conn.execute("INSERT INTO students (student_id, name, course, face_encoding) VALUES ('S1', 'Asha', 'CS101', ?)",
+                 (np.zeros(128).tobytes(),))
+    conn.commit()
+
+    install_change_log(conn, "kiosk-a")
+    create_gallery_tables(conn)
+    # Running both again finds the columns already there
+    install_change_log(conn, "kiosk-a")
+    create_gallery_tables(conn)
+
+    assert conn.execute("SELECT encoding_version FROM students").fetchall() == [(DEFAULT_VERSION,)]
+    assert conn.execute("SELECT COUNT(*) FROM change_log").fetchone() == (0,)
+
+
+def test_swap_refuses_to_drop_students_without_a_crop(conn):
+    create_gallery_tables(conn)
+    encoding = np.zeros(128).tobytes()
+    conn.executemany("INSERT INTO students (student_id, name, course, face_encoding, face_crop, encoding_version) "
+                     "VALUES (?, ?, 'CS101', ?, ?, ?)", [
+                         ("S1", "Asha", encoding, b"crop", DEFAULT_VERSION),
+                         ("S2", "Ben", encoding, b"crop", DEFAULT_VERSION),
+                         # Registered on another kiosk: its crop is not here
+                         ("S3", "Chen", encoding, None, DEFAULT_VERSION),
+                     ])
+    conn.executemany("INSERT INTO gallery_staging (version, student_id, face_encoding) VALUES (?, ?, ?)",
+                     [(NEW_VERSION, "S1", np.ones(128).tobytes()), (NEW_VERSION, "S2", np.ones(128).tobytes())])
+    conn.commit()
+
+    # Chen would silently stop being recognized
+    assert unstaged_students(conn, NEW_VERSION) == ["S3"]
+    with pytest.raises(ValueError, match="S3"):
+        swap_gallery(conn, NEW_VERSION)
+    assert gallery_version(conn) == DEFAULT_VERSION
+
+    assert swap_gallery(conn, NEW_VERSION, force=True) == 2
+    assert gallery_version(conn) == NEW_VERSION
+
+    rows, skipped = matchable_students(conn, NEW_VERSION)
+    assert [row[0] for row in rows] == ["S1", "S2"]
+    assert skipped == 1
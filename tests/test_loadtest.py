@@ -0,0 +1,51 @@
+import sqlite3
+
+import cv2
+import numpy as np
+
+from gallery import DEFAULT_VERSION
+from loadtest import KioskHarness, db_counts
+from marking import create_attendance_tables
+
+
+def face(value):
+    encoding = np.zeros(128)
+    encoding[0] = value
+    return encoding
+
+
+class FakeDetector:
+    def detect(self, rgb_image):
+        return [(10, 40, 40, 10)]
+
+
+def test_attendance_replays_without_tk(db_path, tmp_path, monkeypatch):
+    conn = sqlite3.connect(db_path)
+    create_attendance_tables(conn)
+    conn.execute("INSERT INTO students (student_id, name, course, face_encoding, encoding_version) "
+                 "VALUES ('S1', 'Asha', 'CS101', ?, ?)", (face(1.0).tobytes(), DEFAULT_VERSION))
+    conn.commit()
+    conn.close()
+    recording = tmp_path / "recording"
+    recording.mkdir()
+    for number in range(3):
+        cv2.imwrite(str(recording / f"{number:03d}.png"), np.full((240, 320, 3), number * 40, np.uint8))
+
+    monkeypatch.setattr("kiosk.QUALITY_GATE_ENABLED", False)
+    monkeypatch.setattr("marking.get_detector", lambda name: FakeDetector())
+    monkeypatch.setattr("marking.encode_faces", lambda frame, boxes, landmarks: [face(1.1) for _ in boxes])
+    harness = KioskHarness(db_path, fps=0)
+    try:
+        harness.attendance(str(recording), timeout=30)
+        harness.attendance(str(recording), timeout=30)
+
+        assert harness.frames == 6
+        assert list(harness.first_marks) == ["S1"] and len(harness.latencies) == 1
+        assert db_counts(harness.conn)["attendance"] == 1
+        assert harness.error_count() == 0
+    finally:
+        harness.close()
+    # The copy was replayed; the original database is untouched
+    conn = sqlite3.connect(db_path)
+    assert db_counts(conn)["attendance"] == 0
+    conn.close()
@@ -0,0 +1,131 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from gallery import DEFAULT_VERSION
+from kiosk import HeadlessKiosk
+from marking import AttendanceMarker, create_attendance_tables
+from pipeline import RecognitionPipeline
+from sessions import close_session, start_session
+
+
+def face(value, axis=0):
+    encoding = np.zeros(128)
+    encoding[axis] = value
+    return encoding
+
+
+class Snapshots(list):
+    def submit(self, attendance_id, face_crop):
+        self.append(attendance_id)
+
+
+@pytest.fixture
+def marker(conn):
+    create_attendance_tables(conn)
+    conn.execute("INSERT INTO students (student_id, name, course, face_encoding, encoding_version) "
+                 "VALUES ('S1', 'Asha', 'CS101', ?, ?)", (face(1.0).tobytes(), DEFAULT_VERSION))
+    conn.commit()
+    events = []
+    marker = AttendanceMarker(conn, Snapshots(), events=lambda event, **fields: events.append(event))
+    marker.load_gallery()
+    marker.check_session()
+    marker.seen = events
+    return marker
+
+
+def test_students_are_marked_once_a_day(marker):
+    assert marker.identify([face(1.1)]) == ["Asha (S1)"]
+    assert marker.identify([face(1.1)]) == ["Asha (S1)"]
+    assert marker.conn.execute("SELECT student_id, status FROM attendance").fetchall() == [("S1", "Present")]
+    assert [event for event in marker.seen if "marked" in event] == ["attendance_marked", "already_marked"]
+    assert marker.marks == 1
+
+
+def test_repeat_sightings_report_the_recorded_status(conn):
+    create_attendance_tables(conn)
+    conn.execute("INSERT INTO students (student_id, name, course, face_encoding, encoding_version) "
+                 "VALUES ('S1', 'Asha', 'CS101', ?, ?)", (face(1.0).tobytes(), DEFAULT_VERSION))
+    # Written by close_session before the student turned up
+    conn.execute("INSERT INTO attendance (student_id, date, time, status) VALUES ('S1', date('now', 'localtime'), "
+                 "'09:00:00', 'Absent')")
+    conn.commit()
+    events = []
+    marker = AttendanceMarker(conn, Snapshots(), events=lambda event, **fields: events.append((event, fields)))
+    marker.load_gallery()
+    marker.check_session()
+
+    assert not marker.mark("S1", 0.3)
+    assert not marker.mark("S1", 0.3)
+    assert [fields["status"] for event, fields in events if event == "already_marked"] == ["Absent", "Absent"]
+
+
+def test_enrolled_face_is_marked_after_being_buffered_as_unknown(marker):
+    # A bad frame of the student was once taken for an unknown person
+    marker.unknown_faces.add(face(1.45))
+    marker.unknown_faces.cluster()
+
+    assert marker.identify([face(1.3)]) == ["Asha (S1)"]
+    assert marker.conn.execute("SELECT student_id, status FROM attendance").fetchall() == [("S1", "Present")]
+
+
+def test_only_faces_clearly_outside_the_gallery_are_remembered(marker):
+    assert marker.identify([face(1.62), face(9.0)]) == ["Unknown", "Unknown"]
+    marker.unknown_faces.cluster()
+    assert [person.encoding[0] for person in marker.unknown_faces.people] == [9.0]
+    assert marker.identify([face(9.1)]) == ["Unknown #1"]
+
+
+def test_unknown_faces_can_be_left_untracked(conn):
+    create_attendance_tables(conn)
+    marker = AttendanceMarker(conn, Snapshots(), track_unknowns=False)
+    conn.execute("INSERT INTO students (student_id, name, course, face_encoding, encoding_version) "
+                 "VALUES ('S1', 'Asha', 'CS101', ?, ?)", (face(1.0).tobytes(), DEFAULT_VERSION))
+    marker.load_gallery()
+    marker.check_session()
+
+    assert marker.identify([face(9.0), face(1.1)]) == ["Unknown", "Asha (S1)"]
+    assert marker.unknown_faces is None
+
+
+def test_roster_follows_the_sessions_of_the_room(marker):
+    session = start_session(marker.conn, "CS101", None, 60)
+    marker.check_session()
+    assert marker.roster == [0] and marker.unknown_faces.session_id == session["id"]
+
+    close_session(marker.conn, session["id"])
+    marker.check_session()
+    assert marker.roster is None and marker.unknown_faces.session_id == 0
+    assert [event for event in marker.seen if event.startswith("session")] == ["session_started", "session_ended"]
+
+
+class FakeDetector:
+    def detect(self, rgb_image):
+        return [(10, 40, 40, 10)]
+
+
+def test_frames_that_do_not_fit_the_workers_are_recognized_in_process(marker, monkeypatch):
+    monkeypatch.setattr("marking.get_detector", lambda name: FakeDetector())
+    monkeypatch.setattr("marking.encode_faces", lambda frame, boxes, landmarks: [face(1.1) for _ in boxes])
+    marker.pipeline = RecognitionPipeline(workers=0, slots=1, slot_bytes=16)
+
+    _, boxes, labels, _ = marker.process(np.zeros((240, 320, 3), np.uint8), captured_at=5.0)
+
+    assert marker.pipeline is None and "workers_unusable" in marker.seen
+    assert (boxes, labels) == ([(10, 40, 40, 10)], ["Asha (S1)"])
+    assert marker.frame_captured_at == 5.0
+    # The mark got the audit snapshot of the face
+    assert marker.snapshot_writer == [1]
+
+
+def test_kiosk_creates_the_attendance_tables(tmp_path):
+    path = str(tmp_path / "new.db")
+    kiosk = HeadlessKiosk(path)
+    kiosk.snapshot_writer.close()
+    kiosk.conn.close()
+
+    conn = sqlite3.connect(path)
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.close()
+    assert {"students", "attendance", "unknown_faces", "class_sessions", "change_log"} <= tables
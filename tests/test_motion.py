@@ -0,0 +1,49 @@
+import numpy as np
+
+from motion import MotionGate, merge_regions
+from pipeline import FrameResult
+
+
+def test_static_frames_are_skipped_after_the_first_scan():
+    gate = MotionGate(refresh_seconds=3600)
+    frame = np.full((120, 160, 3), 100, dtype=np.uint8)
+
+    assert gate.check(frame) == [(0, 160, 120, 0)]
+    assert gate.check(frame) == []
+    assert gate.check(frame) == []
+    assert (gate.frames, gate.full, gate.skipped) == (3, 1, 2)
+
+
+def test_a_small_change_is_scanned_as_a_region():
+    gate = MotionGate(refresh_seconds=3600)
+    frame = np.full((120, 160, 3), 100, dtype=np.uint8)
+    gate.check(frame)
+
+    moved = frame.copy()
+    moved[40:60, 60:80] = 255
+    regions = gate.check(moved)
+    assert len(regions) == 1
+    top, right, bottom, left = regions[0]
+    assert top <= 40 and left <= 60 and bottom >= 60 and right >= 80
+    assert (bottom - top) * (right - left) < 160 * 120
+
+
+def test_merge_regions_joins_overlaps_only():
+    merged = merge_regions([(0, 10, 10, 0), (5, 15, 15, 5), (50, 60, 60, 50)])
+    assert sorted(merged) == [(0, 15, 15, 0), (50, 60, 60, 50)]
+
+
+def test_worker_detection_time_feeds_the_savings_estimate():
+    gate = MotionGate(refresh_seconds=3600)
+    frame = np.full((120, 160, 3), 100, dtype=np.uint8)
+    gate.check(frame)
+    gate.check(frame)
+
+    # As the kiosk does with each pipeline result
+    for result in (FrameResult(0, 0, [], np.empty((0, 128)), [], None, None, detection_seconds=0.2),
+                   FrameResult(0, 1, [], np.empty((0, 128)), [], None, None)):
+        if result.detection_seconds is not None:
+            gate.record_detection(result.detection_seconds)
+
+    assert gate.detections == 1
+    assert gate.stats()["cpu_saved_seconds"] == 0.2
@@ -0,0 +1,122 @@
+import os
+import sqlite3
+
+import pytest
+
+from partitions import MAX_ATTACHED_TERMS, archive_term, attendance_source, create_terms_table
+from snapshots import SnapshotWriter
+
+
+def add_attendance(conn, rows):
+    conn.executemany("INSERT INTO attendance (student_id, date, time, status) VALUES (?, ?, '09:00:00', ?)", rows)
+    conn.commit()
+
+
+@pytest.fixture
+def archive(conn, tmp_path):
+    create_terms_table(conn)
+    return str(tmp_path / "archive")
+
+
+def test_archive_moves_rows_without_logging_deletes(conn, archive):
+    add_attendance(conn, [("S1", "2020-01-10", "Present"), ("S2", "2020-02-10", "Absent"),
+                          ("S1", "2020-09-10", "Present")])
+    logged = conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0]
+
+    assert archive_term(conn, "2020-spring", "2020-01-01", "2020-06-30", archive) == 2
+
+    assert conn.execute("SELECT date FROM attendance").fetchall() == [("2020-09-10",)]
+    assert conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0] == logged
+    assert conn.execute("SELECT row_count FROM terms WHERE name = '2020-spring'").fetchone() == (2,)
+
+
+def test_union_view_reads_hot_and_archived_rows(conn, archive):
+    add_attendance(conn, [("S1", "2020-01-10", "Present"), ("S1", "2020-09-10", "Present")])
+    archive_term(conn, "2020-spring", "2020-01-01", "2020-06-30", archive)
+
+    # Ranges that miss every archived term only touch the hot table
+    assert attendance_source(conn, "2020-09-01", "2020-09-30") == "attendance"
+
+    source = attendance_source(conn)
+    dates = conn.execute(f"SELECT date FROM {source} a WHERE a.student_id = 'S1' ORDER BY date").fetchall()
+    assert dates == [("2020-01-10",), ("2020-09-10",)]
+
+
+def test_archiving_open_or_overlapping_terms_is_refused(conn, archive):
+    with pytest.raises(ValueError):
+        archive_term(conn, "future", "2020-01-01", "2999-12-31", archive)
+
+    archive_term(conn, "2020-spring", "2020-01-01", "2020-06-30", archive)
+    with pytest.raises(ValueError):
+        archive_term(conn, "2020-overlap", "2020-06-01", "2020-07-31", archive)
+
+
+def test_more_terms_than_can_be_attached_are_read_in_batches(conn, archive):
+    terms = MAX_ATTACHED_TERMS * 2 + 3
+    for month in range(terms):
+        year, month = 2018 + month // 12, month % 12 + 1
+        add_attendance(conn, [("S1", f"{year}-{month:02d}-15", "Present")])
+        archive_term(conn, f"{year}-{month:02d}", f"{year}-{month:02d}-01", f"{year}-{month:02d}-28", archive)
+    add_attendance(conn, [("S1", "2024-01-15", "Present")])
+
+    source = attendance_source(conn)
+    assert conn.execute(f"SELECT COUNT(*), COUNT(DISTINCT date) FROM {source}").fetchone() == (terms + 1, terms + 1)
+
+    # Date bounds still apply to the archived rows
+    source = attendance_source(conn, "2018-01-01", "2019-06-30")
+    assert conn.execute(f"SELECT COUNT(*) FROM {source} WHERE date <= '2019-06-30'").fetchone() == (18,)
+
+    # A narrower range goes back to attaching the terms directly
+    assert "temp.archived_attendance" not in attendance_source(conn, "2018-01-01", "2018-03-31")
+
+
+def test_archived_rows_keep_their_audit_columns(conn, archive):
+    conn.execute("INSERT INTO attendance (student_id, date, time, status, snapshot_hash, match_distance) "
+                 "VALUES ('S1', '2020-01-10', '09:00:00', 'Present', 'abc', 0.31)")
+    conn.commit()
+    archive_term(conn, "2020-spring", "2020-01-01", "2020-06-30", archive)
+
+    source = attendance_source(conn)
+    assert conn.execute(f"SELECT snapshot_hash, match_distance FROM {source} a").fetchall() == [("abc", 0.31)]
+
+
+def test_terms_archived_before_audit_columns_are_migrated(conn, archive):
+    os.makedirs(archive)
+    path = os.path.abspath(os.path.join(archive, "attendance_2019-spring.db"))
+    old = sqlite3.connect(path)
+    old.execute("CREATE TABLE attendance (id INTEGER PRIMARY KEY, student_id TEXT NOT NULL, date TEXT NOT NULL, "
+                "time TEXT NOT NULL, status TEXT NOT NULL)")
+    old.execute("INSERT INTO attendance VALUES (0, 'S1', '2019-01-10', '09:00:00', 'Present')")
+    old.commit()
+    old.close()
+    conn.execute("INSERT INTO terms (name, start_date, end_date, archive_path) "
+                 "VALUES ('2019-spring', '2019-01-01', '2019-06-30', ?)", (path,))
+    conn.commit()
+
+    source = attendance_source(conn)
+    assert conn.execute(f"SELECT student_id, snapshot_hash FROM {source} a").fetchall() == [("S1", None)]
+
+    # Late rows can still be archived into the old term database
+    add_attendance(conn, [("S2", "2019-02-10", "Present")])
+    assert archive_term(conn, "2019-spring", "2019-01-01", "2019-06-30", archive) == 1
+    source = attendance_source(conn)
+    assert conn.execute(f"SELECT COUNT(*) FROM {source} a").fetchone() == (2,)
+
+
+def test_pruned_snapshots_are_unlinked_from_archived_terms(conn, db_path, archive, tmp_path):
+    conn.execute("INSERT INTO attendance (student_id, date, time, status, snapshot_hash) "
+                 "VALUES ('S1', '2020-01-10', '09:00:00', 'Present', 'aa11')")
+    conn.commit()
+    archive_term(conn, "2020-spring", "2020-01-01", "2020-06-30", archive)
+
+    directory = tmp_path / "snapshots"
+    snapshot = directory / "aa" / "aa11.jpg"
+    snapshot.parent.mkdir(parents=True)
+    snapshot.write_bytes(b"jpeg")
+    writer = SnapshotWriter(db_path, str(directory), retention_days=0)
+    assert writer.prune() == 1
+    writer.close()
+
+    assert not snapshot.exists()
+    source = attendance_source(conn)
+    assert conn.execute(f"SELECT snapshot_hash FROM {source} a").fetchall() == [(None,)]
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from pipeline import RecognitionPipeline
+
+
+@pytest.fixture
+def pipeline():
+    # No worker processes: frames stay queued, which is all these tests need
+    pipeline = RecognitionPipeline(workers=0, slots=2, slot_bytes=32 * 32 * 3)
+    yield pipeline
+    pipeline.close()
+
+
+def test_oversized_frames_are_refused(pipeline):
+    with pytest.raises(ValueError):
+        pipeline.submit(np.zeros((64, 64, 3), np.uint8))
+    assert pipeline.submitted == 0
+    assert len(pipeline.free_slots) == 2
+
+
+def test_frames_are_dropped_when_every_slot_is_busy(pipeline):
+    frame = np.zeros((32, 32, 3), np.uint8)
+    assert [pipeline.submit(frame, meta=(None, 1.0)) for _ in range(3)] == [0, 1, None]
+    assert pipeline.full()
+    assert (pipeline.pending(), pipeline.dropped) == (2, 1)
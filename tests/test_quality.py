@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from quality import MAX_YAW, MIN_FACE_SIZE, QualityGate, estimate_yaw
+
+
+def landmarks(nose_x):
+    # Eyes 20 px apart, centred on x = 50
+    return {"left_eye": [(38, 40), (42, 40)], "right_eye": [(58, 40), (62, 40)], "nose_tip": [(nose_x, 55)]}
+
+
+def textured(value, size=100):
+    """A sharp face-sized patch around ``value`` brightness"""
+    rng = np.random.default_rng(0)
+    gray = np.clip(value + rng.integers(-30, 31, (size, size)), 0, 255).astype(np.uint8)
+    return np.dstack([gray] * 3)
+
+
+@pytest.fixture
+def gate(monkeypatch):
+    # A frontal face unless a test says otherwise
+    monkeypatch.setattr("quality.face_recognition.face_landmarks",
+                        lambda image, boxes, model: [landmarks(50) for _ in boxes], raising=False)
+    return QualityGate()
+
+
+def test_yaw_is_the_nose_offset_in_eye_distances():
+    assert estimate_yaw(landmarks(50)) == 0
+    assert estimate_yaw(landmarks(60)) == pytest.approx(0.5)
+    assert estimate_yaw(landmarks(44)) == pytest.approx(-0.3)
+
+
+def test_size_is_measured_in_camera_frame_pixels(gate):
+    frame = textured(128)
+    side = MIN_FACE_SIZE // 4
+    # On a quarter-size frame a box of MIN_FACE_SIZE / 4 is big enough, one pixel less is not
+    assert gate.assess(frame, [(0, side, side, 0)], scale=0.25)[0][0] is None
+    assert gate.assess(frame, [(0, side - 1, side - 1, 0)], scale=0.25)[0][0] == "small"
+    assert gate.assess(frame, [(0, side, side, 0)])[0][0] == "small"
+
+
+def test_brightness_and_sharpness_thresholds(gate):
+    box = [(0, 100, 100, 0)]
+    assert gate.assess(textured(20), box)[0][0] == "dark"
+    assert gate.assess(textured(235), box)[0][0] == "bright"
+    assert gate.assess(np.full((100, 100, 3), 128, np.uint8), box)[0][0] == "blurred"
+    reason, score = gate.assess(textured(128), box)[0]
+    assert reason is None and score > gate.min_sharpness
+
+
+def test_turned_faces_are_rejected_and_counted(gate, monkeypatch):
+    turned = 50 + 20 * (MAX_YAW + 0.1)
+    slightly = 50 + 20 * (MAX_YAW - 0.1)
+    monkeypatch.setattr("quality.face_recognition.face_landmarks",
+                        lambda image, boxes, model: [landmarks(turned), landmarks(slightly)])
+    frame = np.hstack([textured(128), textured(128)])
+    boxes = [(0, 100, 100, 0), (0, 200, 100, 100)]
+
+    kept, rejected = gate.filter(frame, boxes)
+
+    assert kept == [boxes[1]] and rejected == [(boxes[0], "profile")]
+    # Slightly turned faces pass with a lower score than frontal ones
+    assert gate.assess(frame, boxes)[1][1] < gate._pixel_checks(frame, boxes[1], 1.0)[1]
+    gate.record(1, [(boxes[0], "small")])
+    assert gate.summary() == "3/6 faces encoded; rejected: profile 2, small 1"
+    assert QualityGate().summary() == "No faces checked"
@@ -0,0 +1,82 @@
+import pytest
+
+from query_cache import ALL_ATTENDANCE, ALL_STUDENTS, QueryCache
+
+STUDENT_SQL = "SELECT date, status FROM attendance WHERE student_id = ? ORDER BY date"
+DATE_SQL = "SELECT student_id FROM attendance WHERE date = ? ORDER BY student_id"
+
+
+@pytest.fixture
+def cache(conn):
+    conn.executemany("INSERT INTO attendance (student_id, date, time, status) VALUES (?, ?, '09:00:00', ?)",
+                     [("S1", "2026-03-02", "Present"), ("S2", "2026-03-02", "Present"),
+                      ("S1", "2026-03-03", "Absent")])
+    conn.commit()
+    return QueryCache()
+
+
+def by_student(cache, conn, student_id):
+    return cache.fetchall(conn, STUDENT_SQL, (student_id,), tags=[("student", student_id)])
+
+
+def by_date(cache, conn, date_str):
+    return cache.fetchall(conn, DATE_SQL, (date_str,), tags=[("date", date_str)])
+
+
+def test_repeated_lookups_are_served_from_the_cache(cache, conn):
+    first = by_student(cache, conn, "S1")
+    assert by_student(cache, conn, "S1") == first
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_only_results_for_the_written_student_and_date_are_dropped(cache, conn):
+    by_student(cache, conn, "S1")
+    by_student(cache, conn, "S2")
+    by_date(cache, conn, "2026-03-03")
+
+    conn.execute("INSERT INTO attendance (student_id, date, time, status) VALUES ('S2', '2026-03-04', "
+                 "'09:00:00', 'Present')")
+    conn.commit()
+
+    by_student(cache, conn, "S1")
+    by_date(cache, conn, "2026-03-03")
+    assert cache.hits == 2
+    assert by_student(cache, conn, "S2") == [("2026-03-02", "Present"), ("2026-03-04", "Present")]
+
+
+def test_update_invalidates_the_old_student_and_date(cache, conn):
+    assert by_student(cache, conn, "S1") == [("2026-03-02", "Present"), ("2026-03-03", "Absent")]
+    assert by_date(cache, conn, "2026-03-03") == [("S1",)]
+
+    # The row moves to another student and another day
+    conn.execute("UPDATE attendance SET student_id = 'S2', date = '2026-03-05' "
+                 "WHERE student_id = 'S1' AND date = '2026-03-03'")
+    conn.commit()
+
+    assert by_student(cache, conn, "S1") == [("2026-03-02", "Present")]
+    assert by_date(cache, conn, "2026-03-03") == []
+    assert cache.hits == 0
+
+
+def test_student_rename_drops_results_showing_student_details(cache, conn):
+    conn.execute("INSERT INTO students (student_id, name, course) VALUES ('S1', 'Asha', 'CS101')")
+    conn.commit()
+    sql = "SELECT name FROM students ORDER BY student_id"
+    cache.fetchall(conn, sql, tags=[ALL_STUDENTS])
+    attendance = cache.fetchall(conn, "SELECT COUNT(*) FROM attendance", tags=[ALL_ATTENDANCE])
+
+    conn.execute("UPDATE students SET student_id = 'S9', name = 'Asha K' WHERE student_id = 'S1'")
+    conn.commit()
+
+    assert cache.fetchall(conn, sql, tags=[ALL_STUDENTS]) == [("Asha K",)]
+    assert cache.fetchall(conn, "SELECT COUNT(*) FROM attendance", tags=[ALL_ATTENDANCE]) == attendance
+    assert cache.hits == 1
+
+
+def test_a_rebuilt_database_clears_everything(cache, conn):
+    by_student(cache, conn, "S1")
+    conn.execute("DELETE FROM change_log")
+    conn.commit()
+
+    by_student(cache, conn, "S1")
+    assert cache.hits == 0
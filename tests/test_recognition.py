@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+import recognition
+from recognition import encode_faces, encode_faces_batch, prioritize_faces, scale_box
+
+
+class FakePredictor:
+    def __call__(self, image, rect):
+        return rect
+
+
+class FakeEncoder:
+    def __init__(self):
+        self.calls = 0
+
+    def compute_face_descriptor(self, image, shapes, jitters):
+        self.calls += 1
+        return [np.full(128, float(shape.box[0] + jitters)) for shape in shapes]
+
+
+def test_a_frame_is_encoded_in_one_call_in_face_order(monkeypatch):
+    encoder = FakeEncoder()
+    monkeypatch.setattr(recognition, "_models", lambda landmarks: (FakePredictor(), encoder))
+    boxes = [(top, top + 10, top + 10, top) for top in range(7)]
+
+    encodings = encode_faces(np.zeros((20, 20, 3), np.uint8), boxes, jitters=2)
+
+    assert [encoding[0] for encoding in encodings] == [top + 2 for top in range(7)]
+    assert encoder.calls == 1
+    assert encode_faces(np.zeros((20, 20, 3), np.uint8), []) == []
+    assert encoder.calls == 1
+
+
+
+class OldDlibEncoder(FakeEncoder):
+    """A dlib build without the multi-image overload"""
+
+    def compute_face_descriptor(self, image, shapes, jitters):
+        if isinstance(image, list):
+            raise TypeError("compute_face_descriptor(): incompatible function arguments")
+        return super().compute_face_descriptor(image, shapes, jitters)
+
+
+class BatchEncoder(FakeEncoder):
+    def compute_face_descriptor(self, images, shapes_per_image, jitters):
+        self.calls += 1
+        return [[np.full(128, float(shape.box[0])) for shape in shapes] for shapes in shapes_per_image]
+
+
+def test_images_are_encoded_in_one_call(monkeypatch):
+    encoder = BatchEncoder()
+    monkeypatch.setattr(recognition, "_models", lambda landmarks: (FakePredictor(), encoder))
+    images = [np.zeros((20, 20, 3), np.uint8)] * 3
+
+    encodings = encode_faces_batch(images, [[(1, 5, 5, 1), (2, 6, 6, 2)], [], [(3, 7, 7, 3)]])
+
+    assert [[encoding[0] for encoding in image] for image in encodings] == [[1, 2], [], [3]]
+    assert encoder.calls == 1
+    assert encode_faces_batch(images[:2], [[], []]) == [[], []]
+    assert encoder.calls == 1
+
+
+def test_batch_falls_back_to_one_call_per_image_only_without_the_overload(monkeypatch):
+    monkeypatch.setattr(recognition, "_batch_descriptors", True)
+    encoder = OldDlibEncoder()
+    monkeypatch.setattr(recognition, "_models", lambda landmarks: (FakePredictor(), encoder))
+    images = [np.zeros((20, 20, 3), np.uint8)] * 2
+
+    encodings = encode_faces_batch(images, [[(1, 5, 5, 1)], [(2, 6, 6, 2)]])
+
+    assert [[encoding[0] for encoding in image] for image in encodings] == [[2], [3]]
+    assert recognition._batch_descriptors is False
+
+    class BrokenEncoder(FakeEncoder):
+        def compute_face_descriptor(self, image, shapes, jitters):
+            raise RuntimeError("Error while calling cudaMalloc")
+
+    monkeypatch.setattr(recognition, "_batch_descriptors", True)
+    monkeypatch.setattr(recognition, "_models", lambda landmarks: (FakePredictor(), BrokenEncoder()))
+    with pytest.raises(RuntimeError, match="cudaMalloc"):
+        encode_faces_batch(images, [[(1, 5, 5, 1)], []])
+
+def test_prioritize_keeps_largest_faces():
+    small, medium, large = (0, 10, 10, 0), (0, 20, 20, 0), (0, 40, 40, 0)
+    assert prioritize_faces([small, large, medium], max_faces=2) == [large, medium]
+    assert prioritize_faces([small, large], max_faces=5) == [small, large]
+
+
+def test_scale_box_maps_back_to_camera_frame():
+    assert scale_box((10, 20, 30, 5), scale=0.25) == (40, 80, 120, 20)
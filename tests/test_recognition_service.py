@@ -0,0 +1,65 @@
+import asyncio
+
+import cv2
+import numpy as np
+
+from gallery import DEFAULT_VERSION, create_gallery_tables
+from recognition_service import RecognitionService
+
+NEW_VERSION = "large-j2-hog"
+
+
+def test_gallery_is_loaded_with_its_version_settings(db_path, conn):
+    create_gallery_tables(conn)
+    conn.executemany("INSERT INTO students (student_id, name, course, face_encoding, encoding_version) "
+                     "VALUES (?, ?, 'CS101', ?, ?)", [
+                         ("S1", "Asha", np.ones(128).tobytes(), NEW_VERSION),
+                         ("S2", "Ben", np.ones(128).tobytes(), NEW_VERSION),
+                         # Not re-encoded yet: never compared with probes encoded as NEW_VERSION
+                         ("S3", "Chen", np.zeros(128).tobytes(), DEFAULT_VERSION),
+                     ])
+    conn.commit()
+
+    service = RecognitionService(db_path, detection_workers=0)
+    service.executor.shutdown()
+
+    assert service.student_ids == ["S1", "S2"]
+    assert service.encodings.shape == (2, 128)
+    assert (service.version, service.stale) == (NEW_VERSION, 1)
+    assert (service.landmarks, service.jitters) == ("large", 2)
+
+
+def test_requests_share_encoding_batches_and_overflow_is_rejected(db_path, conn, monkeypatch):
+    create_gallery_tables(conn)
+    conn.execute("INSERT INTO students (student_id, name, course, face_encoding, encoding_version) "
+                 "VALUES ('S1', 'Asha', 'CS101', ?, ?)", (np.zeros(128).tobytes(), DEFAULT_VERSION))
+    conn.commit()
+    batches = []
+
+    def encode(images, locations_per_image, landmarks, jitters):
+        batches.append(len(images))
+        return [[np.zeros(128) for _ in locations] for locations in locations_per_image]
+
+    monkeypatch.setattr("recognition_service.encode_faces_batch", encode)
+    service = RecognitionService(db_path, max_batch=4, max_wait_ms=50, queue_size=5, detection_workers=0)
+    crop = cv2.imencode(".jpg", np.zeros((32, 32, 3), np.uint8))[1].tobytes()
+
+    async def run():
+        service.queue = asyncio.Queue(maxsize=service.queue_size)
+        batcher = asyncio.create_task(service._batch_loop())
+        requests = [service.recognize(crop, "crop") for _ in range(4)] + [service.recognize(b"not a jpeg", "crop")]
+        try:
+            return await asyncio.gather(*requests, service.recognize(crop, "crop"), return_exceptions=True)
+        finally:
+            batcher.cancel()
+
+    results = asyncio.run(run())
+    service.executor.shutdown()
+
+    assert batches == [4, 0]
+    assert [face["student_id"] for result in results[:4] for face in result["faces"]] == ["S1"] * 4
+    assert results[0]["latency_ms"]["batch_size"] == 4
+    # The undecodable image still gets an answer
+    assert results[4] == {"error": "Could not decode image", "faces": [], "latency_ms": results[4]["latency_ms"]}
+    assert isinstance(results[5], OverflowError)
+    assert service.stats["rejected"] == 1 and service.stats["batches"] == 2
@@ -0,0 +1,119 @@
+import sqlite3
+import tkinter as tk
+
+import pytest
+
+from search import StudentSearchEntry, create_search_index, fts5_available, search_student_ids, search_students
+
+STUDENTS = [
+    ("S100", "Asha Kumar", "CS101"),
+    ("S101", "Ben Ashford", "CS101"),
+    ("S200", "Chen Li", "MA201"),
+    ("A1", "José Álvarez", "PH301"),
+]
+
+
+@pytest.fixture(params=["fts5", "like"])
+def students(request, conn, monkeypatch):
+    if request.param == "fts5" and not fts5_available(conn):
+        pytest.skip("SQLite was built without FTS5")
+    if request.param == "like":
+        monkeypatch.setattr("search.fts5_available", lambda conn: False)
+    conn.executemany("INSERT INTO students (student_id, name, course) VALUES (?, ?, ?)", STUDENTS[:2])
+    create_search_index(conn)
+    # Rows written after the index exists are picked up too
+    conn.executemany("INSERT INTO students (student_id, name, course) VALUES (?, ?, ?)", STUDENTS[2:])
+    conn.commit()
+    return conn
+
+
+def ids(rows):
+    return sorted(row[0] for row in rows)
+
+
+def test_prefix_matches_ids_names_and_courses(students):
+    assert ids(search_students(students, "S1")) == ["S100", "S101"]
+    assert ids(search_students(students, "asha")) == ["S100"]
+    assert ids(search_students(students, "ma2")) == ["S200"]
+    assert search_students(students, "  ") == []
+
+
+def test_exact_id_comes_first(students):
+    assert search_students(students, "S101")[0] == STUDENTS[1]
+
+
+def test_limit_and_renames(students):
+    assert len(search_students(students, "S", limit=2)) == 2
+
+    students.execute("UPDATE students SET name = 'Chen Wang' WHERE student_id = 'S200'")
+    students.commit()
+    assert ids(search_students(students, "Chen W")) == ["S200"]
+    assert search_students(students, "Chen Li") == []
+
+
+def test_fts_matches_any_word_and_ignores_accents(students):
+    if not students.execute("SELECT 1 FROM sqlite_master WHERE name = 'students_fts'").fetchone():
+        pytest.skip("The LIKE fallback only matches the start of each column")
+    assert ids(search_students(students, "ash")) == ["S100", "S101"]
+    assert ids(search_students(students, "jose alv")) == ["A1"]
+
+
+
+def test_id_suggestions_match_only_the_start_of_ids(students):
+    assert search_student_ids(students, "S1") == [("S100",), ("S101",)]
+    # Names and courses are never searched
+    assert search_student_ids(students, "Asha") == []
+    assert search_student_ids(students, "S[12]*") == []
+    assert search_student_ids(students, " ") == []
+
+@pytest.fixture
+def root():
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        pytest.skip("Tk needs a display")
+    root.withdraw()
+    yield root
+    root.destroy()
+
+
+def test_return_before_suggestions_arrive_chooses_for_the_typed_text(root):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE students (id INTEGER PRIMARY KEY, student_id TEXT, name TEXT, course TEXT)")
+    conn.executemany("INSERT INTO students (student_id, name, course) VALUES (?, ?, ?)", STUDENTS)
+    chosen = []
+    entry = StudentSearchEntry(root, lambda text, done: done(search_students(conn, text)), chosen.append)
+
+    entry.text.set("S1")
+    entry._run_search()
+    # Typed on before the debounced search ran: the shown suggestions are for "S1"
+    entry.text.set("S200")
+    entry._submit()
+
+    assert chosen == ["S200"]
+    assert entry.pending is None
+
+
+def test_login_entry_submits_the_typed_id_and_suggests_ids_only(root):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE students (id INTEGER PRIMARY KEY, student_id TEXT, name TEXT, course TEXT)")
+    conn.executemany("INSERT INTO students (student_id, name, course) VALUES (?, ?, ?)", STUDENTS)
+    searched, chosen = [], []
+
+    def search(text, done):
+        searched.append(text)
+        done(search_student_ids(conn, text))
+
+    entry = StudentSearchEntry(root, search, chosen.append, min_length=3, choose_top_match=False,
+                               describe=lambda row: row[0])
+
+    entry.text.set("S1")
+    entry._run_search()
+    assert searched == [] and entry.listbox.size() == 0
+    entry.text.set("S10")
+    entry._run_search()
+    assert entry.listbox.get(0, tk.END) == ("S100", "S101")
+
+    # Return logs in with what was typed, not the top suggestion
+    entry._submit()
+    assert chosen == ["S10"]
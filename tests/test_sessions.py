@@ -0,0 +1,74 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from recognition import match_faces_scoped
+from sessions import active_session, close_session, create_session_table, get_session, start_session
+
+
+def face(value, axis=0):
+    encoding = np.zeros(128)
+    encoding[axis] = value
+    return encoding
+
+
+@pytest.fixture
+def school(conn):
+    create_session_table(conn)
+    conn.executemany("INSERT INTO students (student_id, name, course) VALUES (?, ?, ?)", [
+        ("S1", "Asha", "CS101"),
+        ("S2", "Ben", "CS101"),
+        ("S3", "Chen", "CS101"),
+        ("S4", "Dana", "MA201"),
+    ])
+    conn.commit()
+    return conn
+
+
+def test_scoped_match_prefers_the_roster():
+    known = np.array([face(0.0), face(0.1), face(5.0)])
+    # Both the first and the second face are within tolerance; only the second is on the roster
+    [(index, distance)] = match_faces_scoped(known, [face(0.05)], scope=[1])
+    assert index == 1
+    assert distance == pytest.approx(0.05)
+
+
+def test_scoped_match_falls_back_to_the_full_gallery():
+    known = np.array([face(0.0), face(3.0), face(6.0)])
+    results = match_faces_scoped(known, [face(6.1), face(3.0), face(20.0)], scope=[1])
+    assert [index for index, _ in results] == [2, 1, None]
+
+
+def test_scoped_match_without_scope_uses_the_gallery():
+    known = np.array([face(0.0), face(3.0)])
+    assert match_faces_scoped(known, [face(3.0)], scope=None)[0][0] == 1
+
+
+def test_active_session_respects_room_and_window(school):
+    now = datetime(2026, 3, 2, 9, 30)
+    session = start_session(school, "CS101", "A1", 60, now=now)
+
+    assert active_session(school, "A1", now)["id"] == session["id"]
+    assert active_session(school, "B2", now) is None
+    assert active_session(school, "A1", datetime(2026, 3, 2, 11, 0)) is None
+
+
+def test_close_session_marks_the_rest_of_the_roster_absent(school):
+    session = start_session(school, "CS101", None, 60, now=datetime(2026, 3, 2, 9, 0))
+    school.execute("INSERT INTO attendance (student_id, date, time, status) VALUES ('S2', '2026-03-02', "
+                   "'09:05:00', 'Present')")
+    school.commit()
+
+    assert close_session(school, session["id"], now=datetime(2026, 3, 2, 10, 0)) == 2
+    rows = school.execute("SELECT student_id, status, time FROM attendance ORDER BY student_id").fetchall()
+    assert rows == [("S1", "Absent", "10:00:00"), ("S2", "Present", "09:05:00"), ("S3", "Absent", "10:00:00")]
+    assert get_session(school, session["id"])["closed_at"] == "2026-03-02 10:00:00"
+
+    # Closing again inserts nothing
+    assert close_session(school, session["id"]) == 0
+
+
+def test_close_unknown_session_raises(school):
+    with pytest.raises(ValueError):
+        close_session(school, 999)
@@ -0,0 +1,135 @@
+import sqlite3
+import urllib.error
+import urllib.request
+
+import pytest
+
+from sync import (install_change_log, create_replicated_tables, read_changes, apply_changes, receive_push,
+                  set_state, CentralServer, SyncClient)
+
+TOKEN = "kiosk-secret"
+
+
+def test_triggers_log_local_changes(conn):
+    conn.execute("INSERT INTO students (student_id, name, course) VALUES ('S1', 'Ann', 'CS')")
+    conn.execute("INSERT INTO attendance (student_id, date, time, status) "
+                 "VALUES ('S1', '2025-09-15', '09:00:00', 'Present')")
+    conn.execute("DELETE FROM attendance")
+    conn.commit()
+
+    changes = read_changes(conn, 0, 100)
+    assert [(c["table"], c["op"], c["key"]) for c in changes] == [
+        ("students", "INSERT", "S1"),
+        ("attendance", "INSERT", "S1|2025-09-15"),
+        ("attendance", "DELETE", "S1|2025-09-15"),
+    ]
+    assert all(c["origin"] == "kiosk-a" for c in changes)
+    assert changes[1]["payload"] == {"student_id": "S1", "date": "2025-09-15", "time": "09:00:00",
+                                     "status": "Present"}
+    assert changes[2]["payload"] is None
+
+
+def test_suppress_log_skips_capture(conn):
+    set_state(conn, "suppress_log", 1)
+    conn.execute("INSERT INTO students (student_id, name, course) VALUES ('S1', 'Ann', 'CS')")
+    conn.execute("DELETE FROM sync_state WHERE key = 'suppress_log'")
+    conn.commit()
+    assert read_changes(conn, 0, 100) == []
+
+
+def test_applied_changes_keep_their_origin(conn):
+    change = {"seq": 7, "origin": "kiosk-b", "table": "students", "op": "INSERT", "key": "S2",
+              "payload": {"student_id": "S2", "name": "Bo", "course": "EE", "face_encoding": None}}
+    assert apply_changes(conn, [change], cursor_key="last_pulled_seq")["applied"] == 1
+
+    assert conn.execute("SELECT name FROM students WHERE student_id = 'S2'").fetchone() == ("Bo",)
+    assert [c["origin"] for c in read_changes(conn, 0, 100)] == ["kiosk-b"]
+    # Not pushed back to where it came from
+    assert read_changes(conn, 0, 100, origin="kiosk-a") == []
+    assert conn.execute("SELECT value FROM sync_state WHERE key = 'last_pulled_seq'").fetchone() == ("7",)
+
+
+def test_present_beats_absent_on_conflict(conn):
+    conn.execute("INSERT INTO attendance (student_id, date, time, status) "
+                 "VALUES ('S1', '2025-09-15', '23:59:59', 'Absent')")
+    conn.commit()
+    change = {"seq": 1, "origin": "kiosk-b", "table": "attendance", "op": "INSERT", "key": "S1|2025-09-15",
+              "payload": {"student_id": "S1", "date": "2025-09-15", "time": "09:05:00", "status": "Present"}}
+
+    stats = apply_changes(conn, [change])
+
+    assert stats["conflicts"] == 1
+    assert conn.execute("SELECT time, status FROM attendance").fetchall() == [("09:05:00", "Present")]
+
+
+def test_receive_push_is_idempotent(tmp_path):
+    central = sqlite3.connect(str(tmp_path / "central.db"))
+    create_replicated_tables(central)
+    install_change_log(central, "central")
+    changes = [
+        {"seq": seq, "origin": "kiosk-a", "table": "attendance", "op": "INSERT", "key": f"S{seq}|2025-09-15",
+         "payload": {"student_id": f"S{seq}", "date": "2025-09-15", "time": "09:00:00", "status": "Present"}}
+        for seq in (1, 2, 3)
+    ]
+
+    first = receive_push(central, "kiosk-a", changes[:2])
+    # A retried request that overlaps the acknowledged part
+    second = receive_push(central, "kiosk-a", changes)
+
+    assert (first["applied"], first["acked_seq"]) == (2, 2)
+    assert (second["applied"], second["duplicates"], second["acked_seq"]) == (1, 2, 3)
+    assert central.execute("SELECT COUNT(*) FROM attendance").fetchone() == (3,)
+    central.close()
+
+
+def test_marks_replicate_between_kiosks(tmp_path, db_path):
+    server = CentralServer(str(tmp_path / "central.db"), port=0, token=TOKEN).start()
+    other_path = str(tmp_path / "other.db")
+    other = sqlite3.connect(other_path)
+    create_replicated_tables(other)
+    install_change_log(other, "kiosk-b")
+    try:
+        conn = sqlite3.connect(db_path)
+        conn.execute("INSERT INTO students (student_id, name, course) VALUES ('S1', 'Ann', 'CS')")
+        conn.execute("INSERT INTO attendance (student_id, date, time, status) "
+                     "VALUES ('S1', '2025-09-15', '09:00:00', 'Present')")
+        conn.commit()
+        conn.close()
+
+        assert SyncClient(db_path, server.url, token=TOKEN).sync()["pushed"] == 2
+        assert SyncClient(other_path, server.url, token=TOKEN).sync()["pulled"] == 2
+        assert other.execute("SELECT student_id, status FROM attendance").fetchall() == [("S1", "Present")]
+        # Nothing new to exchange on the next round
+        result = SyncClient(db_path, server.url, token=TOKEN).sync()
+        assert (result["pushed"], result["pulled"]) == (0, 0)
+    finally:
+        other.close()
+        server.stop()
+
+
+def test_central_node_requires_the_sync_token(tmp_path, db_path):
+    with pytest.raises(ValueError, match="ATTENDANCE_SYNC_TOKEN"):
+        CentralServer(str(tmp_path / "central.db"), port=0, token=None)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO students (student_id, name, course) VALUES ('S1', 'Ann', 'CS')")
+    conn.commit()
+    conn.close()
+    server = CentralServer(str(tmp_path / "central.db"), port=0, token=TOKEN).start()
+    try:
+        assert server.url.startswith("http://127.0.0.1:")
+        for token in (None, "wrong"):
+            with pytest.raises(PermissionError):
+                SyncClient(db_path, server.url, token=token).sync()
+        request = urllib.request.Request(server.url + "/sync/ack?origin=kiosk-a",
+                                         headers={"Authorization": "Basic " + TOKEN})
+        with pytest.raises(urllib.error.HTTPError) as refused:
+            urllib.request.urlopen(request, timeout=5)
+        assert refused.value.code == 401
+
+        central = sqlite3.connect(str(tmp_path / "central.db"))
+        assert central.execute("SELECT COUNT(*) FROM students").fetchone() == (0,)
+        central.close()
+        assert SyncClient(db_path, server.url, token=TOKEN).sync()["pushed"] == 1
+    finally:
+        server.stop()
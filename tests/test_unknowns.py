@@ -0,0 +1,57 @@
+import numpy as np
+
+from sessions import create_session_table
+from unknowns import UnknownFaces, cluster_encodings, create_unknown_faces_table, list_unknown_faces
+
+
+def face(value, axis=0):
+    encoding = np.zeros(128)
+    encoding[axis] = value
+    return encoding
+
+
+def test_clusters_are_connected_components_across_chunks():
+    # 0.0-0.4-0.8 is one chain even though its ends are farther apart than the tolerance
+    encodings = [face(0.0), face(3.0), face(0.4), face(3.2), face(0.8), face(9.0)]
+    labels = cluster_encodings(encodings, tolerance=0.5, chunk_size=2)
+    assert labels[0] == labels[2] == labels[4]
+    assert labels[1] == labels[3]
+    assert len(set(labels)) == 3
+    assert len(cluster_encodings([])) == 0
+
+
+def test_recurring_unknowns_are_matched_and_merged():
+    unknowns = UnknownFaces(cluster_batch=3)
+    for value in (5.0, 5.1, 8.0):
+        unknowns.add(face(value))
+    assert [person.sightings for person in unknowns.people] == [2, 1]
+
+    person, nobody = unknowns.match([face(5.05), face(20.0)])
+    assert person.number == 1 and person.sightings == 3
+    assert nobody is None
+
+    # A later batch of the same person joins the existing one
+    unknowns.add(face(8.1))
+    unknowns.cluster()
+    assert [(person.number, person.sightings) for person in unknowns.people] == [(1, 3), (2, 2)]
+
+
+def test_registered_people_are_forgotten():
+    unknowns = UnknownFaces(cluster_batch=1)
+    unknowns.add(face(5.0))
+    unknowns.add(face(9.0))
+    unknowns.forget_registered(np.array([face(5.1)]))
+    assert [person.number for person in unknowns.people] == [2]
+
+
+def test_save_keeps_people_seen_often_enough(conn):
+    create_unknown_faces_table(conn)
+    create_session_table(conn)
+    unknowns = UnknownFaces(date="2026-03-02", session_id=0, cluster_batch=1)
+    for value in (5.0, 5.1, 5.2, 9.0):
+        unknowns.add(face(value))
+
+    assert unknowns.save(conn, min_sightings=3) == 1
+    unknowns.add(face(5.3))
+    assert unknowns.save(conn, min_sightings=3) == 1
+    assert [(person["number"], person["sightings"]) for person in list_unknown_faces(conn)] == [(1, 4)]
@@ -0,0 +1,271 @@
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+import click
+import cv2
+import numpy as np
+
+from recognition import face_distances, MATCH_TOLERANCE
+
+# Two unknown faces closer than this are taken to be the same person
+UNKNOWN_TOLERANCE = 0.5
+# Faces that missed the gallery by less than this may be a registered student seen badly; not remembered
+UNKNOWN_MIN_DISTANCE = MATCH_TOLERANCE + 0.05
+# Unmatched faces are clustered once this many have been buffered
+CLUSTER_BATCH = 16
+# Rows of the distance matrix computed at a time while clustering
+CLUSTER_CHUNK = 512
+# Distinct unknown people kept per session; those seen least (then least recently) go first
+MAX_UNKNOWN_PEOPLE = 256
+# People seen fewer times than this are treated as noise and not saved
+MIN_SIGHTINGS = 3
+
+
+def create_unknown_faces_table(conn):
+    """Create the local table of unknown people seen during each session (not replicated)"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS unknown_faces (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT NOT NULL,
+        session_id INTEGER NOT NULL DEFAULT 0,
+        number INTEGER NOT NULL,
+        first_seen TEXT NOT NULL,
+        last_seen TEXT NOT NULL,
+        sightings INTEGER NOT NULL,
+        face_encoding BLOB NOT NULL,
+        face_crop BLOB,
+        UNIQUE (date, session_id, number)
+    )
+    ''')
+    conn.commit()
+
+
+def cluster_encodings(encodings, tolerance=UNKNOWN_TOLERANCE, chunk_size=CLUSTER_CHUNK):
+    """Label each encoding with a cluster number (0, 1, ...) for the person it belongs to
+
+    Clusters are the connected components of the graph linking encodings
+    within ``tolerance``. Distances are computed ``chunk_size`` rows at a
+    time so memory stays bounded, and components are found by vectorized
+    label propagation over the collected edges.
+    """
+    encodings = np.asarray(encodings, dtype=np.float64).reshape(-1, 128)
+    count = len(encodings)
+    if count == 0:
+        return np.empty(0, dtype=np.intp)
+
+    sources, targets = [], []
+    for start in range(0, count, chunk_size):
+        rows, cols = np.nonzero(face_distances(encodings, encodings[start:start + chunk_size]) <= tolerance)
+        rows += start
+        upper = rows < cols
+        sources.append(rows[upper])
+        targets.append(cols[upper])
+    sources, targets = np.concatenate(sources), np.concatenate(targets)
+
+    # Every encoding takes the smallest label among its neighbours until nothing changes
+    labels = np.arange(count)
+    while True:
+        updated = labels.copy()
+        np.minimum.at(updated, sources, labels[targets])
+        np.minimum.at(updated, targets, labels[sources])
+        updated = updated[updated]  # Jump to the label's own label to converge faster
+        if np.array_equal(updated, labels):
+            break
+        labels = updated
+    return np.unique(labels, return_inverse=True)[1]
+
+
+class UnknownPerson:
+    """One distinct unregistered face seen during a session"""
+
+    def __init__(self, number, encoding, sightings, first_seen, last_seen, face_crop):
+        self.number = number
+        self.encoding = encoding
+        self.sightings = sightings
+        self.first_seen = first_seen
+        self.last_seen = last_seen
+        self.face_crop = face_crop
+
+
+class UnknownFaces:
+    """Session-local memory of faces that matched nobody in the gallery
+
+    ``match`` compares faces that already missed the gallery with the
+    people seen this session in one vectorized pass, so a recurring visitor
+    is labelled "Unknown #n". The gallery always comes first, so a student
+    is marked even if a bad frame of them was once taken for an unknown.
+    Faces it does not know are buffered by ``add`` (callers only add faces
+    at least ``UNKNOWN_MIN_DISTANCE`` from the gallery) and grouped into
+    people by ``cluster_encodings`` every ``cluster_batch`` faces.
+    """
+
+    def __init__(self, date=None, session_id=None, tolerance=UNKNOWN_TOLERANCE, cluster_batch=CLUSTER_BATCH,
+                 max_people=MAX_UNKNOWN_PEOPLE):
+        self.date = date or datetime.now().strftime("%Y-%m-%d")
+        self.session_id = session_id or 0
+        self.tolerance = tolerance
+        self.cluster_batch = cluster_batch
+        self.max_people = max_people
+
+        self.people = []
+        self.centroids = np.empty((0, 128))
+        self.pending = []
+        self.next_number = 1
+        self.cache_hits = 0
+
+    def match(self, face_encodings):
+        """Return the UnknownPerson each face belongs to, or None for faces not seen before"""
+        if len(face_encodings) == 0 or not self.people:
+            return [None] * len(face_encodings)
+
+        distances = face_distances(self.centroids, face_encodings)
+        closest = distances.argmin(axis=1)
+        now = time.time()
+        results = []
+        for row, index in enumerate(closest):
+            if distances[row, index] <= self.tolerance:
+                person = self.people[index]
+                person.sightings += 1
+                person.last_seen = now
+                results.append(person)
+            else:
+                results.append(None)
+        self.cache_hits += sum(person is not None for person in results)
+        return results
+
+    def add(self, encoding, face_crop=None):
+        """Buffer a face that matched nobody; clusters once the buffer is full"""
+        self.pending.append((np.asarray(encoding, dtype=np.float64), time.time(), face_crop))
+        if len(self.pending) >= self.cluster_batch:
+            self.cluster()
+
+    def cluster(self):
+        """Group the buffered faces into people, merging them into those already known"""
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        encodings = np.array([encoding for encoding, _, _ in pending])
+        labels = cluster_encodings(encodings, self.tolerance)
+
+        for label in range(labels.max() + 1):
+            members = np.flatnonzero(labels == label)
+            centroid = encodings[members].mean(axis=0)
+            seen = [pending[i][1] for i in members]
+            crop = next((pending[i][2] for i in members if pending[i][2] is not None), None)
+
+            if self.people:
+                distances = face_distances(self.centroids, [centroid])[0]
+                index = int(distances.argmin())
+                if distances[index] <= self.tolerance:
+                    person = self.people[index]
+                    total = person.sightings + len(members)
+                    person.encoding = (person.encoding * person.sightings + centroid * len(members)) / total
+                    person.sightings = total
+                    person.first_seen = min(person.first_seen, min(seen))
+                    person.last_seen = max(person.last_seen, max(seen))
+                    if person.face_crop is None:
+                        person.face_crop = crop
+                    self.centroids[index] = person.encoding
+                    continue
+
+            self.people.append(UnknownPerson(self.next_number, centroid, len(members), min(seen), max(seen), crop))
+            self.next_number += 1
+            self.centroids = np.vstack([self.centroids, centroid])
+
+        if len(self.people) > self.max_people:
+            self.people = sorted(self.people, key=lambda person: (person.sightings, person.last_seen),
+                                 reverse=True)[:self.max_people]
+            self._reindex()
+
+    def forget_registered(self, known_encodings, tolerance=MATCH_TOLERANCE):
+        """Drop people who now match the gallery, e.g. after they were registered"""
+        self.cluster()
+        if not self.people or len(known_encodings) == 0:
+            return
+        registered = (face_distances(known_encodings, self.centroids) <= tolerance).any(axis=1)
+        self.people = [person for person, matched in zip(self.people, registered) if not matched]
+        self._reindex()
+
+    def _reindex(self):
+        self.centroids = np.array([person.encoding for person in self.people]).reshape(-1, 128)
+
+    def save(self, conn, min_sightings=MIN_SIGHTINGS):
+        """Write the people seen at least ``min_sightings`` times; returns how many were saved"""
+        self.cluster()
+        rows = []
+        for person in self.people:
+            if person.sightings < min_sightings:
+                continue
+            crop = None
+            if person.face_crop is not None:
+                ok, jpeg = cv2.imencode(".jpg", person.face_crop)
+                crop = jpeg.tobytes() if ok else None
+            rows.append((self.date, self.session_id, person.number,
+                         datetime.fromtimestamp(person.first_seen).strftime("%H:%M:%S"),
+                         datetime.fromtimestamp(person.last_seen).strftime("%H:%M:%S"),
+                         person.sightings, person.encoding.tobytes(), crop))
+        conn.executemany('''
+        INSERT INTO unknown_faces (date, session_id, number, first_seen, last_seen, sightings, face_encoding, face_crop)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (date, session_id, number) DO UPDATE SET
+            last_seen = excluded.last_seen, sightings = excluded.sightings,
+            face_encoding = excluded.face_encoding, face_crop = COALESCE(unknown_faces.face_crop, excluded.face_crop)
+        ''', rows)
+        conn.commit()
+        return len(rows)
+
+
+def list_unknown_faces(conn, date=None):
+    """Saved unknown people, newest session first, each as a dict"""
+    query = ("SELECT u.id, u.date, u.session_id, c.course, u.number, u.first_seen, u.last_seen, u.sightings, "
+             "u.face_crop FROM unknown_faces u LEFT JOIN class_sessions c ON c.id = u.session_id")
+    params = []
+    if date:
+        query += " WHERE u.date = ?"
+        params.append(date)
+    query += " ORDER BY u.date DESC, u.session_id DESC, u.sightings DESC"
+    columns = ("id", "date", "session_id", "course", "number", "first_seen", "last_seen", "sightings", "face_crop")
+    return [dict(zip(columns, row)) for row in conn.execute(query, params)]
+
+
+@click.group()
+def cli():
+    """Review the unregistered faces seen by this kiosk"""
+
+
+@cli.command(name="list")
+@click.option("--db", "db_path", default="attendance.db", show_default=True)
+@click.option("--date", default=None, help="Only this day (YYYY-MM-DD)")
+def list_command(db_path, date):
+    """List distinct unknown people per day and session"""
+    conn = sqlite3.connect(db_path)
+    for person in list_unknown_faces(conn, date):
+        session = f"session {person['session_id']} ({person['course']})" if person["session_id"] else "no session"
+        click.echo(f"{person['date']} {session:<24} Unknown #{person['number']:<4} "
+                   f"seen {person['sightings']:>5}x {person['first_seen']}-{person['last_seen']}")
+    conn.close()
+
+
+@cli.command()
+@click.option("--db", "db_path", default="attendance.db", show_default=True)
+@click.option("--date", default=None, help="Only this day (YYYY-MM-DD)")
+@click.argument("output_dir", type=click.Path(file_okay=False))
+def export(db_path, date, output_dir):
+    """Write each unknown person's face crop to OUTPUT_DIR, e.g. to enroll them from the photos"""
+    conn = sqlite3.connect(db_path)
+    os.makedirs(output_dir, exist_ok=True)
+    exported = 0
+    for person in list_unknown_faces(conn, date):
+        if person["face_crop"]:
+            name = f"{person['date']}-s{person['session_id']}-unknown{person['number']}.jpg"
+            with open(os.path.join(output_dir, name), "wb") as f:
+                f.write(person["face_crop"])
+            exported += 1
+    conn.close()
+    click.echo(f"Exported {exported} face crops to {output_dir}")
+
+
+if __name__ == "__main__":
+    cli()